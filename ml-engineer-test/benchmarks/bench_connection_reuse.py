@@ -0,0 +1,66 @@
+"""Per-request overhead of a fresh client per message vs the shared ChatModel.
+
+Runs sequential completions against an in-process stub with no latency and
+reports the mean time per request and how many TCP connections were opened.
+
+    python benchmarks/bench_connection_reuse.py --requests 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import openai
+from message.config import get_settings
+from message.model import OpenAIKeys, get_chat_model
+from message.prompt_manager import load_prompt
+from message.stub_server import running_stub_server
+
+MESSAGES = [{OpenAIKeys.ROLE: "user", OpenAIKeys.CONTENT: "Hey there"}]
+
+
+async def fresh_client(api_base: str):
+    """Previous behaviour: settings, system prompt and HTTP session per message."""
+    load_prompt("system_prompt.txt")
+    await openai.ChatCompletion.acreate(
+        model="gpt-4-turbo-preview", messages=MESSAGES, api_key="sk-stub", api_base=api_base
+    )
+
+
+async def shared_client(api_base: str):
+    await get_chat_model().get_completion(model="gpt-4-turbo-preview", messages=MESSAGES)
+
+
+async def run(requests: int):
+    results = {}
+    for name, call in (("fresh client", fresh_client), ("shared ChatModel", shared_client)):
+        stats = {}
+        async with running_stub_server(stats=stats) as api_base:
+            os.environ["OPENAI_API_BASE"] = api_base
+            get_settings.cache_clear()
+            get_chat_model.cache_clear()
+
+            start = time.perf_counter()
+            for _ in range(requests):
+                await call(api_base)
+            elapsed = time.perf_counter() - start
+            await get_chat_model().aclose()
+        results[name] = (elapsed / requests * 1000, stats["connections"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+    results = asyncio.run(run(args.requests))
+
+    print(f"{'client':<20}{'ms/request':>12}{'connections':>13}")
+    for name, (ms, connections) in results.items():
+        print(f"{name:<20}{ms:>12.2f}{connections:>13}")
+
+
+if __name__ == "__main__":
+    main()
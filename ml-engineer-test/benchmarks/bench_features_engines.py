@@ -0,0 +1,59 @@
+"""Throughput of the SQL and NumPy feature engines on synthetic data.
+
+Both engines start from the same in-memory exercise results and produce
+a features frame; the table reports rows per second for each.
+
+    python benchmarks/bench_features_engines.py --rows 1000000 10000000 50000000
+"""
+import argparse
+import time
+from pathlib import Path
+
+import pyarrow as pa
+from message.config import QUERIES_DIR
+from message.data import FEATURES_QUERY, FEATURES_SINGLE_PASS_QUERY, compute_features_py, open_query
+from message.engine import DuckDBSession
+from message.synthetic import generate_exercise_results
+
+EXERCISES_PER_SESSION = 15
+
+
+def time_sql(exercise_results: pa.Table, query_filename: str) -> float:
+    with DuckDBSession() as session:
+        session.register("exercise_results", exercise_results)
+        query = open_query(Path(QUERIES_DIR, query_filename))
+        start = time.perf_counter()
+        session.query_df(query)
+        return time.perf_counter() - start
+
+
+def time_py(exercise_df) -> float:
+    start = time.perf_counter()
+    compute_features_py(exercise_df)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>12}{'engine':>24}{'seconds':>10}{'rows/s':>14}")
+    for rows in args.rows:
+        exercise_df = generate_exercise_results(
+            n_sessions=rows // EXERCISES_PER_SESSION, exercises_per_session=EXERCISES_PER_SESSION
+        )
+        # Registered through Arrow, converted outside the timed section
+        exercise_results = pa.Table.from_pandas(exercise_df, preserve_index=False)
+
+        timings = {
+            "sql": time_sql(exercise_results, FEATURES_QUERY),
+            "sql --single-pass": time_sql(exercise_results, FEATURES_SINGLE_PASS_QUERY),
+            "py": time_py(exercise_df),
+        }
+        for engine, seconds in timings.items():
+            print(f"{len(exercise_df):>12,}{engine:>24}{seconds:>10.3f}{len(exercise_df) / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
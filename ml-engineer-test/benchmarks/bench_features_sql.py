@@ -0,0 +1,70 @@
+"""Compares the multi-CTE features.sql against features_single_pass.sql.
+
+Reports how many times each plan scans `exercise_results` (from EXPLAIN)
+and the best wall-clock time over a few repeats, on synthetic data.
+
+    python benchmarks/bench_features_sql.py --sessions 200000 --exercises 15
+"""
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+from message.config import QUERIES_DIR
+from message.data import FEATURES_QUERY, FEATURES_SINGLE_PASS_QUERY, open_query
+from message.synthetic import generate_exercise_results
+
+SCAN_OPERATOR = re.compile(r"\b(READ_PARQUET|PARQUET_SCAN|SEQ_SCAN|PANDAS_SCAN|ARROW_SCAN)\b")
+
+
+def count_scans(con: duckdb.DuckDBPyConnection, query: str) -> int:
+    """Counts the scan operators in the physical plan of a query."""
+    plan = "".join(row[1] for row in con.execute(f"EXPLAIN {query}").fetchall())
+    return len(SCAN_OPERATOR.findall(plan))
+
+
+def time_query(con: duckdb.DuckDBPyConnection, query: str, repeats: int) -> float:
+    """Returns the best wall-clock time of fully materializing a query."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        con.execute(query).fetch_arrow_table()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200_000)
+    parser.add_argument("--exercises", type=int, default=15)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp, "exercise_results.parquet")
+        generate_exercise_results(args.sessions, args.exercises).to_parquet(source)
+
+        con = duckdb.connect()
+        con.execute(
+            f"CREATE VIEW exercise_results AS SELECT * FROM read_parquet('{source}')"
+        )
+
+        rows = args.sessions * args.exercises
+        print(f"exercise_results: {rows:,} rows, {args.sessions:,} sessions")
+        print(f"{'query':<28}{'scans':>8}{'seconds':>12}")
+        results = {}
+        for query_filename in (FEATURES_QUERY, FEATURES_SINGLE_PASS_QUERY):
+            query = open_query(Path(QUERIES_DIR, query_filename))
+            scans = count_scans(con, query)
+            seconds = time_query(con, query, args.repeats)
+            results[query_filename] = seconds
+            print(f"{query_filename:<28}{scans:>8}{seconds:>12.3f}")
+
+        speedup = results[FEATURES_QUERY] / results[FEATURES_SINGLE_PASS_QUERY]
+        print(f"speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
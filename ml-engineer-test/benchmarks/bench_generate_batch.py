@@ -0,0 +1,83 @@
+"""Offline throughput of `message generate-batch` against the local stub server.
+
+The stub runs in its own process with a fixed latency per completion, so the
+numbers measure the client side: prompt building, fan-out and bookkeeping.
+
+    python benchmarks/bench_generate_batch.py --sessions 2000 --concurrency 1 16 64 --latency 0.2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from message.batch import generate_batch
+from message.config import get_settings
+from message.feature_store import get_feature_store
+from message.model import get_chat_model
+from message.stub_server import run_stub_server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise TimeoutError(f"Stub server did not start on port {port}")
+
+
+async def run(session_groups, output, concurrency):
+    try:
+        return await generate_batch(session_groups, output, concurrency=concurrency)
+    finally:
+        # Every run has its own event loop, and the pooled connections belong to it
+        await get_chat_model().aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency per completion (s).")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(
+        target=run_stub_server, kwargs={"port": port, "latency": args.latency}, daemon=True
+    )
+    server.start()
+    wait_for_port(port)
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    get_settings.cache_clear()
+
+    session_groups = get_feature_store().column("session_group")[: args.sessions]
+    print(f"{'concurrency':>12}{'messages':>10}{'seconds':>10}{'msg/s':>10}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for concurrency in args.concurrency:
+                # Sequential runs are slow, cap them to a few seconds of stub latency
+                n_sessions = min(len(session_groups), max(concurrency, 1) * 25)
+                stats = asyncio.run(run(session_groups[:n_sessions], Path(tmp, "messages.jsonl"), concurrency))
+                print(
+                    f"{concurrency:>12}{stats['generated']:>10}{stats['seconds']:>10.2f}"
+                    f"{stats['generated'] / stats['seconds']:>10.1f}"
+                )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Scaling curve of the hash-partitioned parallel transform.
+
+Writes synthetic exercise results to parquet once, then runs the parallel
+transform with an increasing number of worker processes and reports the
+wall time, speedup and parallel efficiency against the first worker count.
+
+    python benchmarks/bench_parallel_transform.py --rows 50000000 --workers 1 2 4 8 16 32
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from message.data import FEATURES_SINGLE_PASS_QUERY
+from message.parallel import transform_features_parallel
+from message.synthetic import generate_exercise_results
+
+EXERCISES_PER_SESSION = 15
+
+
+def default_workers():
+    cores = os.cpu_count()
+    return [n for n in (1, 2, 4, 8, 16, 32, 64) if n < cores] + [cores]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    parser.add_argument("--engine", choices=["sql", "py"], default="sql")
+    parser.add_argument("--row-group-size", type=int, default=250_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir, "exercise_results.parquet")
+        generate_exercise_results(
+            n_sessions=args.rows // EXERCISES_PER_SESSION, exercises_per_session=EXERCISES_PER_SESSION
+        ).to_parquet(source, row_group_size=args.row_group_size)
+
+        print(f"{args.rows:,} rows, {args.engine} engine, {os.cpu_count()} cores")
+        print(f"{'workers':>8}{'seconds':>10}{'speedup':>9}{'efficiency':>12}")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            transform_features_parallel(
+                source,
+                Path(tmp_dir, "features"),
+                workers=workers,
+                engine=args.engine,
+                query_filename=FEATURES_SINGLE_PASS_QUERY,
+            )
+            seconds = time.perf_counter() - start
+            # Speedup and efficiency are relative to the first worker count
+            baseline = baseline or (workers, seconds)
+            speedup = baseline[1] / seconds
+            print(f"{workers:>8}{seconds:>10.2f}{speedup:>9.2f}{speedup * baseline[0] / workers:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Prompt rendering cost per message, context dicts vs Arrow columns.
+
+Renders the user prompts of the features table (repeated up to --messages)
+once through `fetch_session_data` + `build_user_prompt`, one dict per
+session, and once through `FeatureStore.take` + `render_user_prompts` in
+chunks of --chunk-size session groups, as `generate_batch` does.
+
+    python benchmarks/bench_prompt_rendering.py --messages 100000
+"""
+import argparse
+import itertools
+import time
+
+from message.batch import RENDER_CHUNK_SIZE, render_prompts
+from message.data import fetch_session_data
+from message.feature_store import get_feature_store
+from message.prompt_manager import build_user_prompt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=RENDER_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    session_groups = get_feature_store().column("session_group")
+    session_groups = list(itertools.islice(itertools.cycle(session_groups), args.messages))
+
+    start = time.perf_counter()
+    expected = [build_user_prompt(fetch_session_data(session_group)) for session_group in session_groups]
+    per_dict = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prompts = [prompt for _, prompt in render_prompts(session_groups, chunk_size=args.chunk_size)]
+    columnar = time.perf_counter() - start
+    assert prompts == expected
+
+    print(f"{'rendering':<12}{'seconds':>10}{'us/message':>12}")
+    for name, seconds in (("dict", per_dict), ("columnar", columnar)):
+        print(f"{name:<12}{seconds:>10.2f}{seconds / args.messages * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Memory per queued session context, dicts vs SessionContext.
+
+Builds --sessions contexts from the features records (cycled over the
+features table), as a batch queue would hold them, and reports the memory
+allocated per context with tracemalloc: the previous dict with its
+formatted strings, then the slotted SessionContext that keeps the feature
+values and formats them when a prompt is rendered.
+
+    python benchmarks/bench_session_context.py --sessions 1000000
+"""
+import argparse
+import gc
+import itertools
+import tracemalloc
+
+from message.data import SESSION_CONTEXT_DEFAULTS, SESSION_CONTEXT_STRING_FIELDS, SessionContext
+from message.feature_store import get_feature_store
+
+
+def dict_context(record):
+    """The context dict fetch_session_data used to build."""
+    session_context = {field: record.get(field, default) for field, default in SESSION_CONTEXT_DEFAULTS.items()}
+    for field in SESSION_CONTEXT_STRING_FIELDS:
+        session_context[field] = f"{session_context[field]}"
+    return session_context
+
+
+def queue_bytes(build, records, n_sessions):
+    gc.collect()
+    tracemalloc.start()
+    queue = [build(record) for record in itertools.islice(itertools.cycle(records), n_sessions)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    store = get_feature_store()
+    records = store.get_many(store.column("session_group"))
+
+    print(f"{'context':<16}{'MiB':>10}{'bytes/context':>16}")
+    for name, build in (("dict", dict_context), ("SessionContext", SessionContext.from_record)):
+        size = queue_bytes(build, records, args.sessions)
+        print(f"{name:<16}{size / 2**20:>10.1f}{size / args.sessions:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Peak memory and time of the in-memory transform vs the streaming transform.
+
+Writes synthetic exercise results to a parquet file, then runs each mode in
+a fresh process and reports its wall time and peak resident memory.
+
+    python benchmarks/bench_streaming_transform.py --rows 20000000 --memory-limit 1GB
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+from message.config import QUERIES_DIR
+from message.data import FEATURES_SINGLE_PASS_QUERY, open_query
+from message.streaming import transform_features_streaming
+from message.synthetic import generate_exercise_results
+
+EXERCISES_PER_SESSION = 15
+
+
+def in_memory(source: Path, output: Path, memory_limit: str):
+    """Previous behaviour: pandas in, DuckDB on the default connection, pandas out."""
+    exercise_df = pd.read_parquet(source)
+    duckdb.register("exercise_results", exercise_df)
+    duckdb.sql(open_query(Path(QUERIES_DIR, FEATURES_SINGLE_PASS_QUERY))).df().to_parquet(output)
+
+
+def streaming(source: Path, output: Path, memory_limit: str):
+    transform_features_streaming(
+        source,
+        output,
+        query_filename=FEATURES_SINGLE_PASS_QUERY,
+        memory_limit=memory_limit,
+        temp_directory=Path(output.parent, "spill"),
+    )
+
+
+MODES = {"in-memory": in_memory, "streaming": streaming}
+
+
+def peak_rss_kib() -> int:
+    """Peak resident memory of this process (ru_maxrss also counts the parent's before exec)."""
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--memory-limit", default="512MB")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--source", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: run one mode and report time and peak RSS
+        start = time.perf_counter()
+        MODES[args.mode](args.source, Path(args.source.parent, f"{args.mode}.parquet"), args.memory_limit)
+        print(time.perf_counter() - start, peak_rss_kib())
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir, "exercise_results.parquet")
+        generate_exercise_results(
+            n_sessions=args.rows // EXERCISES_PER_SESSION, exercises_per_session=EXERCISES_PER_SESSION
+        ).to_parquet(source)
+        print(f"{args.rows:,} rows, {source.stat().st_size / 2**20:.0f} MiB parquet")
+
+        print(f"{'mode':<12}{'seconds':>10}{'peak MiB':>10}")
+        for mode in MODES:
+            result = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--source", str(source), "--memory-limit", args.memory_limit],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            seconds, peak_kib = result.stdout.split()
+            print(f"{mode:<12}{float(seconds):>10.2f}{int(peak_kib) / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
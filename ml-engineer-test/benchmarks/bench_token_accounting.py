@@ -0,0 +1,63 @@
+"""Token accounting cost per message, before and after the cached counters.
+
+Builds user prompts for the features table (repeated up to --messages) and
+compares the previous per-message accounting (three full tokenizations,
+including the system prompt) with a memoized system prompt plus batch
+counting of the user prompts. Output tokens come from the API usage, so
+they are not re-encoded.
+
+    python benchmarks/bench_token_accounting.py --messages 100000
+"""
+import argparse
+import itertools
+import time
+
+import tiktoken
+from message.data import fetch_session_data
+from message.feature_store import get_feature_store
+from message.model import ChatModel, STATIC_TOKEN_COUNTS
+from message.prompt_manager import build_user_prompt, load_prompt
+from message.stub_server import STUB_CONTENT
+
+
+def previous_accounting(system_prompt, user_prompts, model="gpt-4-turbo-preview"):
+    for user_prompt in user_prompts:
+        for text in (STUB_CONTENT, system_prompt, user_prompt):
+            len(tiktoken.encoding_for_model(model).encode(text))
+
+
+def cached_accounting(system_prompt, user_prompts, num_threads):
+    system_tokens = ChatModel.count_static_tokens(system_prompt)
+    user_tokens = ChatModel.count_tokens_batch(user_prompts, num_threads=num_threads)
+    return [system_tokens + tokens for tokens in user_tokens]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    session_groups = get_feature_store().column("session_group")
+    user_prompts = [
+        build_user_prompt(fetch_session_data(session_group))
+        for session_group in itertools.islice(itertools.cycle(session_groups), args.messages)
+    ]
+    system_prompt = load_prompt("system_prompt.txt")
+
+    start = time.perf_counter()
+    previous_accounting(system_prompt, user_prompts)
+    previous = time.perf_counter() - start
+
+    STATIC_TOKEN_COUNTS.clear()
+    start = time.perf_counter()
+    cached_accounting(system_prompt, user_prompts, args.threads)
+    cached = time.perf_counter() - start
+
+    print(f"{'accounting':<12}{'seconds':>10}{'us/message':>12}")
+    for name, seconds in (("previous", previous), ("cached", cached)):
+        print(f"{name:<12}{seconds:>10.2f}{seconds / args.messages * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark suite of the transform and message paths, with a JSON results file.
+
+Runs every case of message.benchmark (features.sql, the NumPy transform,
+feature lookups, prompt rendering and token counting) on synthetic data at
+each --scales number of sessions, and writes the results with the commit
+and environment to --output. With --baseline, compares the best times
+with an earlier results file and exits with status 1 when a case is more
+than --tolerance slower, so a regression fails the release check.
+
+    python benchmarks/run_suite.py --scales 10000,100000 --output data/benchmarks.json
+    python benchmarks/run_suite.py --baseline data/benchmarks_release.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from message.benchmark import BENCHMARK_CASES, DEFAULT_SCALES, compare_results, run_benchmarks
+from message.config import DATA_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)), help="Comma-separated sessions.")
+    parser.add_argument("--cases", default=",".join(BENCHMARK_CASES), help="Comma-separated cases.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--exercises", type=int, default=15)
+    parser.add_argument("--skew", type=float, default=0.0)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--output", type=Path, default=Path(DATA_DIR, "benchmarks.json"))
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        scales=[int(scale) for scale in args.scales.split(",")],
+        cases=args.cases.split(","),
+        repeats=args.repeats,
+        exercises_per_session=args.exercises,
+        skew=args.skew,
+        lookups=args.lookups,
+    )
+    args.output.write_text(json.dumps(report, indent=2))
+
+    print(f"{'case':<16}{'sessions':>10}{'items':>10}{'best s':>10}{'median s':>10}{'us/item':>10}")
+    for result in report["results"]:
+        print(
+            f"{result['case']:<16}{result['scale']:>10,}{result['items']:>10,}{result['best_seconds']:>10.3f}"
+            f"{result['median_seconds']:>10.3f}{result['us_per_item']:>10.2f}"
+        )
+    print(f"Results -> {args.output}")
+
+    if args.baseline:
+        comparison = compare_results(json.loads(args.baseline.read_text()), report, args.tolerance)
+        print(f"\n{'case':<16}{'sessions':>10}{'baseline s':>12}{'s':>10}{'ratio':>8}")
+        for row in comparison:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(
+                f"{row['case']:<16}{row['scale']:>10,}{row['baseline_seconds']:>12.3f}"
+                f"{row['seconds']:>10.3f}{row['ratio']:>8.2f}{flag}"
+            )
+        if any(row["regression"] for row in comparison):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+import aiohttp
+import openai
+from openai.error import APIError, RateLimitError, Timeout
+from message.config import get_settings
+
+# Where `message stub-server` listens by default
+STUB_API_BASE = "http://127.0.0.1:8089/v1"
+
+
+class Completion(NamedTuple):
+    """Completion text and the token usage reported by the API.
+
+    Usage is None when the response did not include it; completions served
+    from the cache, or shared with an identical request in flight
+    (coalesced), cost no tokens.
+    """
+
+    content: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached: bool = False
+    coalesced: bool = False
+
+
+class CompletionBackend(ABC):
+    """Sends chat completion requests over a pooled HTTP session.
+
+    Every request goes through one aiohttp session with a keep-alive
+    connection pool, created lazily on the running event loop (and
+    re-created if a later call runs on another loop). Backends raise the
+    openai error types (RateLimitError for 429s, APIError, Timeout), so
+    retries and metrics in ChatModel work the same whatever the backend.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of open connections; extra requests wait for one.
+    timeout : float
+        Total timeout of a request in seconds.
+    keepalive_timeout : float
+        Seconds an idle connection is kept open for reuse.
+    """
+
+    name = None
+
+    def __init__(self, pool_size: int = 64, timeout: float = 60.0, keepalive_timeout: float = 30.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._session_loop = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def aclose(self) -> None:
+        """Closes the pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @abstractmethod
+    async def complete(self, **kwargs) -> Completion:
+        """Sends one chat completion request (OpenAI parameters) and returns its completion."""
+
+
+class OpenAIBackend(CompletionBackend):
+    """Completions through `openai.ChatCompletion.acreate` (openai 0.28).
+
+    The pooled session is handed to openai through its `aiosession` context
+    variable. `api_base` points the client at any OpenAI-compatible endpoint.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: str, api_base: Optional[str] = None, **pool):
+        super().__init__(**pool)
+        openai.api_key = api_key
+        if api_base:
+            openai.api_base = api_base
+        self.api_key = api_key
+        self.api_base = api_base
+
+    async def complete(self, **kwargs) -> Completion:
+        kwargs.setdefault("api_key", self.api_key)
+        if self.api_base:
+            kwargs.setdefault("api_base", self.api_base)
+        kwargs.setdefault("request_timeout", self.timeout)
+
+        # openai picks up the shared session from this context variable
+        session_token = openai.aiosession.set(self._get_session())
+        try:
+            chat_completion = await openai.ChatCompletion.acreate(**kwargs)
+        finally:
+            openai.aiosession.reset(session_token)
+
+        usage = chat_completion.get("usage") or {}
+        return Completion(
+            chat_completion.choices[0].message["content"], usage.get("prompt_tokens"), usage.get("completion_tokens")
+        )
+
+
+class StubBackend(CompletionBackend):
+    """Plain HTTP client of the local stub server (`message stub-server`).
+
+    Posts the request as JSON to `{api_base}/chat/completions` without the
+    openai client, so load tests measure the message path rather than the
+    client library. 429 answers raise RateLimitError with the response
+    headers (Retry-After); other error statuses, connection errors and
+    bodies that are not JSON raise APIError.
+    """
+
+    name = "stub"
+
+    def __init__(self, api_base: str = STUB_API_BASE, **pool):
+        super().__init__(**pool)
+        self.api_base = api_base
+
+    async def complete(self, **kwargs) -> Completion:
+        url = f"{self.api_base.rstrip('/')}/chat/completions"
+        try:
+            async with self._get_session().post(url, json=kwargs) as response:
+                text = await response.text()
+                headers = dict(response.headers)
+        except asyncio.TimeoutError as e:
+            raise Timeout(f"Request to {url} timed out") from e
+        except aiohttp.ClientError as e:
+            # No status: ChatModel retries it like a server error
+            raise APIError(f"Request to {url} failed: {e}") from e
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = None
+
+        if response.status >= 400:
+            error = body.get("error", {}) if isinstance(body, dict) else {}
+            error_class = RateLimitError if response.status == 429 else APIError
+            raise error_class(
+                error.get("message", f"HTTP {response.status}"),
+                http_status=response.status,
+                json_body=body,
+                headers=headers,
+                code=error.get("code"),
+            )
+
+        if not isinstance(body, dict):
+            raise APIError(f"Invalid JSON response from {url}", http_status=response.status, headers=headers)
+
+        usage = body.get("usage") or {}
+        return Completion(
+            body["choices"][0]["message"]["content"], usage.get("prompt_tokens"), usage.get("completion_tokens")
+        )
+
+
+def create_backend(
+    name: str = None, pool_size: int = None, timeout: float = None, keepalive_timeout: float = None
+) -> CompletionBackend:
+    """Backend named by `name`, defaults to the COMPLETION_BACKEND setting ("openai" or "stub")."""
+    settings = get_settings()
+    name = name or settings.COMPLETION_BACKEND
+    pool = {
+        "pool_size": pool_size or settings.OPENAI_POOL_SIZE,
+        "timeout": timeout or settings.OPENAI_TIMEOUT,
+        "keepalive_timeout": keepalive_timeout or settings.OPENAI_KEEPALIVE_TIMEOUT,
+    }
+    if name == OpenAIBackend.name:
+        return OpenAIBackend(settings.OPENAI_API_KEY, settings.OPENAI_API_BASE, **pool)
+    if name == StubBackend.name:
+        return StubBackend(settings.OPENAI_API_BASE or STUB_API_BASE, **pool)
+    raise ValueError(f"Unknown completion backend: {name} (use openai or stub)")
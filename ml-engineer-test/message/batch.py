@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from message.context import RENDER_CHUNK_SIZE, render_user_prompts
+from message.feature_store import get_feature_store
+from message.metrics import COALESCED, MESSAGE_SECONDS, get_metrics, scoped_metrics
+from message.model import ChatModel, generate_message, get_chat_model
+from message.prompt_store import get_prompt_store, prompts_are_current
+
+RESULT_SCHEMA = pa.schema(
+    [
+        ("session_group", pa.string()),
+        ("message", pa.string()),
+        ("error", pa.string()),
+        ("latency", pa.float64()),
+    ]
+)
+
+
+class JsonlResultWriter:
+    """Appends one JSON line per result and flushes it right away."""
+
+    def __init__(self, path: Path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """Buffers results and writes them as parquet row groups of `batch_size`."""
+
+    def __init__(self, path: Path, batch_size: int = 1_000):
+        self._writer = pq.ParquetWriter(path, RESULT_SCHEMA)
+        self._batch_size = batch_size
+        self._records = []
+
+    def write(self, record: Dict) -> None:
+        self._records.append(record)
+        if len(self._records) >= self._batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._records:
+            self._writer.write_table(pa.Table.from_pylist(self._records, schema=RESULT_SCHEMA))
+            self._records = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def open_result_writer(path: Path):
+    """Picks the result writer from the output file suffix (.jsonl or .parquet)."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return ParquetResultWriter(path)
+    if path.suffix == ".jsonl":
+        return JsonlResultWriter(path)
+    raise ValueError(f"Unsupported output format: {path.suffix} (use .jsonl or .parquet)")
+
+
+def nok_session_groups() -> List[str]:
+    """Session groups flagged as NOK in the feature store."""
+    store = get_feature_store()
+    return [
+        session_group
+        for session_group, session_is_nok in zip(store.column("session_group"), store.column("session_is_nok"))
+        if session_is_nok is True
+    ]
+
+
+def render_prompts(
+    session_groups: Iterable[str], chunk_size: int = RENDER_CHUNK_SIZE
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Yields `(session_group, user_prompt)`, rendering the prompts per chunk.
+
+    Each chunk of session groups is taken from the FeatureStore as one Arrow
+    table and rendered with `render_user_prompts`, instead of building a
+    context dict per session. When `message render-prompts` has written a
+    current prompts file, the chunk's prompts are taken from it instead.
+    Unknown session groups get a None prompt.
+    """
+    prompt_store = get_prompt_store() if prompts_are_current() else None
+    store = get_feature_store()
+    metrics = get_metrics()
+    session_groups = iter(session_groups)
+    while True:
+        chunk = list(itertools.islice(session_groups, chunk_size))
+        if not chunk:
+            return
+        if prompt_store is not None:
+            with metrics.time_stage("prompt_lookup", count=len(chunk)):
+                prompts = prompt_store.take(chunk).column("user_prompt").to_pylist()
+            yield from zip(chunk, prompts)
+            continue
+        with metrics.time_stage("feature_lookup", count=len(chunk)):
+            features = store.take(chunk)
+            found = pc.is_valid(features.column("session_group")).to_pylist()
+        with metrics.time_stage("prompt_render", count=sum(found)):
+            prompts = iter(render_user_prompts(features.filter(found)))
+        for session_group, is_found in zip(chunk, found):
+            yield session_group, next(prompts) if is_found else None
+
+
+async def _generate_one(
+    session_group: str,
+    user_prompt: Optional[str],
+    chat_model: ChatModel,
+    use_cache: bool,
+) -> Dict:
+    start = time.perf_counter()
+    metrics = get_metrics()
+    record = {"session_group": session_group, "message": None, "error": None}
+
+    if user_prompt is None:
+        record["error"] = "No session data found"
+    else:
+        try:
+            record["message"] = await generate_message(user_prompt, chat_model, use_cache=use_cache)
+        except Exception as e:
+            logging.error(f"Message generation failed for {session_group}: {e}")
+            record["error"] = f"{type(e).__name__}: {e}"
+
+    record["latency"] = time.perf_counter() - start
+    metrics.histogram(MESSAGE_SECONDS, "End-to-end seconds per message.").observe(
+        record["latency"], outcome="error" if record["error"] else "ok"
+    )
+    return record
+
+
+async def generate_batch(
+    session_groups: Iterable[str],
+    output: Path,
+    concurrency: int = 16,
+    tokens_per_minute: Optional[int] = None,
+    use_cache: bool = True,
+) -> Dict:
+    """Generates messages for many session groups concurrently.
+
+    `concurrency` workers pull session groups from the iterable, so at most
+    that many completions are in flight. Prompts are rendered ahead in
+    chunks of RENDER_CHUNK_SIZE (see `render_prompts`). Results are written to `output`
+    (.jsonl or .parquet) as they complete; failures are recorded per session
+    instead of aborting the batch. All requests share one ChatModel and its
+    connection pool (OPENAI_POOL_SIZE connections). The pool is left open
+    for the model's other users; whoever owns the event loop closes it
+    (`get_chat_model().aclose()`).
+
+    Parameters
+    ----------
+    session_groups : Iterable[str]
+        Session groups to generate messages for.
+    output : Path
+        Results file, .jsonl or .parquet.
+    concurrency : int
+        Maximum number of completions in flight.
+    tokens_per_minute : int, optional
+        Token budget per minute shared by all requests of the batch,
+        enforced by the scheduler of the model (see CompletionScheduler).
+        The scheduler's own budget is restored when the batch ends.
+    use_cache : bool
+        Answer identical prompts from the completion cache.
+
+    Returns
+    -------
+    dict
+        Number of generated messages and failures, the elapsed seconds, the
+        completion cache and rate limit counters, the number of duplicate
+        completions coalesced into an identical one in flight and the metrics
+        summary of the batch.
+    """
+    chat_model = get_chat_model()
+    prompts = render_prompts(session_groups)
+    stats = {"generated": 0, "failed": 0}
+
+    writer = open_result_writer(output)
+    start = time.perf_counter()
+
+    async def worker():
+        # Workers share one iterator; next() never interleaves within the event loop
+        for session_group, user_prompt in prompts:
+            record = await _generate_one(session_group, user_prompt, chat_model, use_cache)
+            writer.write(record)
+            stats["failed" if record["error"] else "generated"] += 1
+
+    # The token budget applies to this batch only; the shared scheduler keeps
+    # its own budget, and its request rate (with any 429 clamp) throughout
+    token_limit = chat_model.scheduler.token_limit(tokens_per_minute) if tokens_per_minute else nullcontext()
+    # The summary covers this batch only, the process-wide metrics keep counting
+    try:
+        with token_limit, scoped_metrics() as metrics:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        writer.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    if chat_model.cache is not None:
+        stats["cache"] = chat_model.cache.stats
+    stats["rate_limit"] = dict(chat_model.scheduler.stats, request_rate=chat_model.scheduler.request_rate)
+    stats["coalesced"] = int(metrics.counter(COALESCED).value(stage="completion"))
+    stats["metrics"] = metrics.summary()
+    return stats
@@ -0,0 +1,201 @@
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from message.batch import RENDER_CHUNK_SIZE
+from message.config import BASE_DIR, QUERIES_DIR
+from message.context import render_user_prompts
+from message.data import FEATURES_QUERY, compute_features_py, open_query
+from message.engine import DuckDBSession
+from message.feature_store import FeatureStore, write_features
+from message.model import ChatModel
+from message.synthetic import generate_exercise_results
+
+# Benchmarked paths, in the order they run at each scale
+BENCHMARK_CASES = ("transform_sql", "transform_py", "feature_lookup", "prompt_render", "token_count")
+# Numbers of synthetic sessions the cases run at
+DEFAULT_SCALES = (10_000, 100_000)
+# Version of the results file layout
+RESULTS_SCHEMA = 1
+
+
+def time_repeats(fn: Callable[[], object], repeats: int) -> List[float]:
+    """Wall-clock seconds of `repeats` calls of `fn`."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def environment() -> Dict:
+    """Where the results come from: commit, interpreter, libraries and machine."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "duckdb": duckdb.__version__,
+        "pyarrow": pa.__version__,
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def _transform_sql(exercise_df: pd.DataFrame) -> pd.DataFrame:
+    query = open_query(Path(QUERIES_DIR, FEATURES_QUERY))
+    session = DuckDBSession()
+    try:
+        session.register("exercise_results", exercise_df)
+        return session.query_df(query)
+    finally:
+        session.close()
+
+
+def _render(store: FeatureStore, session_groups: Sequence[str]) -> List[str]:
+    prompts = []
+    for offset in range(0, len(session_groups), RENDER_CHUNK_SIZE):
+        prompts.extend(render_user_prompts(store.take(session_groups[offset:offset + RENDER_CHUNK_SIZE])))
+    return prompts
+
+
+def run_benchmarks(
+    scales: Iterable[int] = DEFAULT_SCALES,
+    cases: Iterable[str] = BENCHMARK_CASES,
+    repeats: int = 3,
+    exercises_per_session: int = 15,
+    skew: float = 0.0,
+    lookups: int = 100_000,
+    seed: int = 0,
+) -> Dict:
+    """Times the transform and message paths on synthetic data at several scales.
+
+    Every scale generates `exercise_results` for that many sessions,
+    computes its features into a temporary FeatureStore and runs the
+    cases on it:
+
+    - transform_sql: features.sql on a DuckDB session, per input row.
+    - transform_py: the NumPy engine (compute_features_py), per input row.
+    - feature_lookup: `lookups` random FeatureStore.get calls, per lookup.
+    - prompt_render: columnar user prompts of every session, per prompt.
+    - token_count: ChatModel.count_tokens_batch of those prompts, per prompt.
+
+    Parameters
+    ----------
+    scales : Iterable[int]
+        Numbers of sessions to generate.
+    cases : Iterable[str]
+        Cases to run, from BENCHMARK_CASES.
+    repeats : int
+        Timed runs per case; the best and the median are reported.
+    exercises_per_session : int
+        Exercise rows per session (the mean when skewed).
+    skew : float
+        Zipf exponent of the synthetic data, see generate_exercise_results.
+    lookups : int
+        Feature lookups per feature_lookup run.
+    seed : int
+        Seed of the synthetic data and the lookup keys.
+
+    Returns
+    -------
+    dict
+        The results file content: the schema version, the environment, the
+        parameters and one result per case and scale with its item count,
+        best and median seconds and microseconds per item.
+    """
+    cases = list(cases)
+    unknown = set(cases) - set(BENCHMARK_CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {sorted(unknown)} (use {', '.join(BENCHMARK_CASES)})")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_sessions in scales:
+            exercise_df = generate_exercise_results(n_sessions, exercises_per_session, seed=seed, skew=skew)
+            features_path = Path(tmp, f"features_{n_sessions}.parquet")
+            write_features(compute_features_py(exercise_df), features_path)
+            store = FeatureStore(features_path, auto_reload=False)
+            session_groups = store.column("session_group")
+            rng = np.random.default_rng(seed)
+            lookup_keys = [session_groups[i] for i in rng.integers(0, len(session_groups), lookups)]
+            prompts = _render(store, session_groups) if "token_count" in cases else None
+
+            runs = {
+                "transform_sql": (len(exercise_df), lambda: _transform_sql(exercise_df)),
+                "transform_py": (len(exercise_df), lambda: compute_features_py(exercise_df)),
+                "feature_lookup": (lookups, lambda: [store.get(key) for key in lookup_keys]),
+                "prompt_render": (len(session_groups), lambda: _render(store, session_groups)),
+                "token_count": (len(session_groups), lambda: ChatModel.count_tokens_batch(prompts)),
+            }
+            for case in cases:
+                items, fn = runs[case]
+                timings = time_repeats(fn, repeats)
+                best = min(timings)
+                results.append(
+                    {
+                        "case": case,
+                        "scale": n_sessions,
+                        "items": items,
+                        "repeats": repeats,
+                        "best_seconds": best,
+                        "median_seconds": statistics.median(timings),
+                        "us_per_item": best / items * 1e6 if items else None,
+                    }
+                )
+
+    return {
+        "schema": RESULTS_SCHEMA,
+        "environment": environment(),
+        "parameters": {
+            "exercises_per_session": exercises_per_session,
+            "skew": skew,
+            "lookups": lookups,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float = 0.2) -> List[Dict]:
+    """Compares the best times of two results files, case by case and scale by scale.
+
+    A case regresses when it is more than `tolerance` (relative) slower
+    than in the baseline. Cases missing from either file are skipped.
+    """
+    baseline_results = {(result["case"], result["scale"]): result for result in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        before = baseline_results.get((result["case"], result["scale"]))
+        if before is None or not before["best_seconds"]:
+            continue
+        ratio = result["best_seconds"] / before["best_seconds"]
+        comparison.append(
+            {
+                "case": result["case"],
+                "scale": result["scale"],
+                "baseline_seconds": before["best_seconds"],
+                "seconds": result["best_seconds"],
+                "ratio": ratio,
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    return comparison
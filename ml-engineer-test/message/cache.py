@@ -0,0 +1,153 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+# Request parameters that do not change the completion
+TRANSPORT_PARAMS = {"api_key", "api_base", "api_type", "api_version", "organization", "request_timeout"}
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def completion_key(model: str, messages: list, temperature: float = None, **params) -> str:
+    """Content address of a completion request.
+
+    Built from the model, the temperature, the hashes of the system and user
+    prompts and any other parameter that shapes the output (e.g. max_tokens).
+    """
+    by_role = {}
+    for message in messages:
+        by_role.setdefault(message["role"], []).append(message["content"])
+    extra = {name: value for name, value in params.items() if name not in TRANSPORT_PARAMS}
+    return "|".join(
+        [
+            model,
+            repr(temperature),
+            prompt_hash("\n".join(by_role.pop("system", []))),
+            prompt_hash("\n".join(by_role.pop("user", []))),
+            prompt_hash(json.dumps([by_role, extra], sort_keys=True, default=str)),
+        ]
+    )
+
+
+class CompletionCache:
+    """Completion cache with an in-memory LRU tier and an optional SQLite tier.
+
+    Lookups try memory first, then disk; disk hits are promoted to memory.
+    Entries older than `ttl` seconds are treated as misses and evicted.
+
+    Parameters
+    ----------
+    max_entries : int
+        Size of the in-memory LRU tier, 0 disables it.
+    ttl : float, optional
+        Seconds an entry stays valid, None keeps entries until evicted.
+    path : Path, optional
+        SQLite file for the on-disk tier, None disables it.
+    clock : callable
+        Returns the current time in seconds.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: Optional[float] = None, path: Optional[Path] = None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+        self._db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and self.clock() - created_at > self.ttl
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        self._remember(key, *row)
+                        self._stats["disk_hits"] += 1
+                        return row[0]
+                    self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            created_at = self.clock()
+            self._remember(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at),
+                )
+                self._db.commit()
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def evict_expired(self) -> int:
+        """Drops every expired entry from both tiers, returns how many were dropped."""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            expired = [key for key, (_, created_at) in self._memory.items() if self._expired(created_at)]
+            for key in expired:
+                del self._memory[key]
+            dropped = len(expired)
+            if self._db is not None:
+                cursor = self._db.execute(
+                    "DELETE FROM completions WHERE created_at < ?", (self.clock() - self.ttl,)
+                )
+                self._db.commit()
+                dropped += cursor.rowcount
+            return dropped
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and bypass counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller of a key (the leader) starts `fn()` as a task; callers
+    arriving while it is in flight await that same task instead of starting
+    their own, and all get its result or its exception. Keys are forgotten
+    once the task finishes, so later calls start afresh: this removes
+    duplicate work in flight, it is not a cache.
+
+    Callers await the task through `asyncio.shield`, so a caller that is
+    cancelled (e.g. timed out upstream) leaves the shared work running for
+    the others.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """Result of `fn()` for `key`, and whether it was shared with an earlier caller."""
+        self.stats["calls"] += 1
+        task = self._in_flight.get(key)
+        # Tasks of another (e.g. closed) event loop cannot be awaited here
+        coalesced = task is not None and task.get_loop() is asyncio.get_running_loop()
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Nobody may be left to await a failed task: mark its exception retrieved
+        if not task.cancelled():
+            task.exception()
@@ -1,8 +1,10 @@
 import logging
 from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from pydantic_settings import BaseSettings
+if TYPE_CHECKING:
+    from message.settings import Settings
 
 BASE_DIR = Path(__file__).parent.parent.absolute()
 
@@ -12,22 +14,21 @@ QUERIES_DIR = Path(BASE_DIR, "queries")
 TESTS_DIR = Path(BASE_DIR, "tests")
 PROMPTS_DIR = Path(BASE_DIR, "prompts")
 
-# create dirs
-BASE_DIR.mkdir(parents=True, exist_ok=True)
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-NOTEBOOKS_DIR.mkdir(parents=True, exist_ok=True)
-QUERIES_DIR.mkdir(parents=True, exist_ok=True)
-TESTS_DIR.mkdir(parents=True, exist_ok=True)
+# Streaming transform defaults: DuckDB memory limit and spill directory
+STREAMING_MEMORY_LIMIT = "2GB"
+STREAMING_TEMP_DIR = Path(DATA_DIR, "duckdb_tmp")
 
 
-class Settings(BaseSettings):
-    OPENAI_API_KEY: str
-
-    class Config:
-        env_file = f"{BASE_DIR}/.env"
+def create_dirs() -> None:
+    """Creates the project directories; run by the CLI and before writing to DATA_DIR."""
+    for directory in (BASE_DIR, DATA_DIR, NOTEBOOKS_DIR, QUERIES_DIR, TESTS_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
 
 
 @lru_cache()
-def get_settings() -> Settings:
+def get_settings() -> "Settings":
+    # pydantic-settings is imported on first use, not when config is imported
+    from message.settings import Settings
+
     logging.info("Loading config settings from the environment...")
     return Settings()
@@ -0,0 +1,112 @@
+from typing import Dict, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from message.data import NULL_TEXT, SESSION_CONTEXT_DEFAULTS
+from message.prompt_manager import PromptRegistry, get_prompt_registry
+
+# Session groups whose prompts are rendered together, column-wise
+RENDER_CHUNK_SIZE = 4_096
+
+# Python prints floats outside [1e-4, 1e16) in exponent notation, Arrow from
+# 1e15 on and with a different exponent format; those few values are
+# formatted in Python
+PLAIN_FLOAT_RANGE = (1e-4, 1e15)
+
+
+def _format_floats(values: pa.Array) -> pa.Array:
+    """`str()` of every float, with nulls as NULL_TEXT."""
+    text = pc.cast(values, pa.string())
+    # Arrow writes integral floats without the ".0" Python keeps ("2" vs "2.0")
+    integral = pc.invert(pc.match_substring_regex(text, r"[.en]"))
+    text = pc.if_else(integral, pc.binary_join_element_wise(text, ".0", ""), text)
+
+    magnitude = pc.abs(values)
+    outside = pc.and_(
+        pc.not_equal(magnitude, 0.0),
+        pc.or_(pc.less(magnitude, PLAIN_FLOAT_RANGE[0]), pc.greater_equal(magnitude, PLAIN_FLOAT_RANGE[1])),
+    )
+    outside = pc.fill_null(outside, False)
+    if pc.any(outside).as_py():
+        replacements = pa.array([str(value) for value in pc.filter(values, outside).to_pylist()], pa.string())
+        text = pc.replace_with_mask(text, outside, replacements)
+    return pc.fill_null(text, NULL_TEXT)
+
+
+def format_column(values: pa.Array) -> pa.Array:
+    """Formats a column as the strings the prompt templates get for it.
+
+    Matches `format(value, "")` of the values FeatureStore records hold,
+    which are the Arrow values of the column (`to_pylist`): floats and ints
+    as Python prints them, and every null as None (NULL_TEXT).
+    """
+    if pa.types.is_floating(values.type):
+        return _format_floats(pc.cast(values, pa.float64()))
+    if pa.types.is_boolean(values.type):
+        text = pc.if_else(values, "True", "False")
+    elif pa.types.is_null(values.type):
+        text = pa.nulls(len(values), pa.string())
+    else:
+        text = pc.cast(values, pa.string())
+    return pc.fill_null(text, NULL_TEXT)
+
+
+def _column(features: Union[pa.Table, pa.RecordBatch], index: int) -> pa.Array:
+    column = features.column(index)
+    return column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+
+
+def _is_true(values: pa.Array) -> pa.Array:
+    """`value == True` for every value, with nulls as False."""
+    if pa.types.is_boolean(values.type):
+        is_true = values
+    elif pa.types.is_integer(values.type) or pa.types.is_floating(values.type):
+        is_true = pc.equal(values, 1)
+    else:
+        is_true = pa.repeat(pa.scalar(False), len(values))
+    return pc.fill_null(is_true, False)
+
+
+def build_context_columns(features: Union[pa.Table, pa.RecordBatch]) -> Dict[str, pa.Array]:
+    """Session context of every row of a features table, as string columns.
+
+    The columnar counterpart of `fetch_session_data`: the same fields and
+    defaults, formatted with vectorized compute kernels instead of one dict
+    per session. `session_is_nok` is kept as a boolean column (missing
+    means NOK) to pick the scenario template.
+    """
+    n_rows = features.num_rows
+
+    columns = {}
+    for field, default in SESSION_CONTEXT_DEFAULTS.items():
+        index = features.schema.get_field_index(field)
+        values = _column(features, index) if index >= 0 else None
+        if field == "session_is_nok":
+            columns[field] = _is_true(values) if values is not None else pa.repeat(pa.scalar(default), n_rows)
+        elif values is not None:
+            columns[field] = format_column(values)
+        else:
+            columns[field] = pa.repeat(pa.scalar(str(default)), n_rows)
+    return columns
+
+
+def render_user_prompts(
+    features: Union[pa.Table, pa.RecordBatch], registry: Optional[PromptRegistry] = None
+) -> List[str]:
+    """Renders the user prompt of every row of a features table at once.
+
+    Scenario and user templates are filled column-wise; the only per-row
+    Python objects are the final prompt strings. Gives the same prompts as
+    `build_user_prompt(fetch_session_data(session_group))`.
+    """
+    registry = registry or get_prompt_registry()
+    columns = build_context_columns(features)
+    if not len(columns["session_is_nok"]):
+        return []
+
+    columns["scenario_description"] = pc.if_else(
+        columns["session_is_nok"],
+        registry.get("scenario_nok.txt").render_columns(columns),
+        registry.get("scenario_ok.txt").render_columns(columns),
+    )
+    return registry.get("user_prompt.txt").render_columns(columns).to_pylist()
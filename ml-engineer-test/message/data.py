@@ -1,8 +1,53 @@
+from collections.abc import Mapping
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Optional
 
-import duckdb
+import numpy as np
 import pandas as pd
-from message.config import DATA_DIR, QUERIES_DIR
+from message.config import DATA_DIR, QUERIES_DIR, create_dirs
+from message.feature_store import FEATURES_COMPRESSION, FEATURES_PATH, get_feature_store, write_features
+
+if TYPE_CHECKING:
+    from message.engine import DuckDBSession
+
+FEATURES_QUERY = "features.sql"
+FEATURES_SINGLE_PASS_QUERY = "features_single_pass.sql"
+
+QUALITY_REASON_COLUMNS = [
+    "quality_reason_movement_detection",
+    "quality_reason_my_self_personal",
+    "quality_reason_other",
+    "quality_reason_exercises",
+    "quality_reason_tablet",
+    "quality_reason_tablet_and_or_motion_trackers",
+    "quality_reason_easy_of_use",
+    "quality_reason_session_speed",
+]
+
+# Session-level columns, constant within a session_group (ANY_VALUE in SQL)
+SESSION_COLUMNS = [
+    "patient_id",
+    "patient_name",
+    "patient_age",
+    "therapy_name",
+    "session_number",
+    "leave_session",
+    "session_is_nok",
+    "pain",
+    "fatigue",
+    "quality",
+    *QUALITY_REASON_COLUMNS,
+]
+
+LEAVE_EXERCISE_REASONS = [
+    "system_problem",
+    "other",
+    "unable_perform",
+    "pain",
+    "tired",
+    "technical_issues",
+    "difficulty",
+]
 
 
 def open_query(query_filename: Path, **kwargs) -> str:
@@ -21,35 +66,208 @@ def open_query(query_filename: Path, **kwargs) -> str:
     return open(query_filename, "r").read().format(**kwargs)
 
 
-def transform_features_sql(tables_to_register=None):
+def transform_features_sql(
+    tables_to_register=None,
+    query_filename: str = FEATURES_QUERY,
+    session: "DuckDBSession" = None,
+    compression: str = FEATURES_COMPRESSION,
+):
     """-Loads the exercise results and transforms
     them into features using the features.sql query.
         -Allows optional table registration for DuckDB.
+        -`query_filename` selects the query, e.g. FEATURES_SINGLE_PASS_QUERY
+        to scan `exercise_results` once instead of once per feature CTE.
+        -Runs on `session`, or on a fresh DuckDBSession closed afterwards;
+        registered tables never outlive the call.
+        -Writes features.parquet (FEATURES_PATH, the file get_features
+        serves) sorted by session_group, in row groups compressed with
+        `compression` (write_features).
     """
 
-    query = open_query(Path(QUERIES_DIR, "features.sql"))
+    # duckdb is only imported by the transforms, not by message lookups
+    from message.engine import DuckDBSession
+
+    query = open_query(Path(QUERIES_DIR, query_filename))
+    owns_session = session is None
+    session = session or DuckDBSession()
+
+    try:
+        # ✅ Register tables if provided
+        for table_name, df in tables_to_register or []:
+            session.register(table_name, df)
+
+        features = session.query_df(query)
+    finally:
+        if owns_session:
+            session.close()
+        else:
+            for table_name, _ in tables_to_register or []:
+                session.unregister(table_name)
 
-    # ✅ Register tables if provided
-    if tables_to_register:
-        for table_name, df in tables_to_register:
-            duckdb.register(table_name, df)
+    create_dirs()
+    write_features(features, FEATURES_PATH, compression=compression)
 
-    session = duckdb.sql(query).df()
 
-    session.to_parquet(Path(DATA_DIR, "features.parquet"))
+def _first_index(codes: np.ndarray) -> np.ndarray:
+    """Index of the first row of each code, for codes numbered in order of
+    first appearance (as returned by `pd.factorize`)."""
+    running_max = np.maximum.accumulate(codes)
+    return np.flatnonzero(np.diff(running_max, prepend=-1) > 0)
 
 
-def transform_features_py():
-    ###### YOUR CODE HERE ######
+def _run_starts(sorted_codes: np.ndarray) -> np.ndarray:
+    """Index where each run of equal values starts in a sorted array."""
+    return np.flatnonzero(np.diff(sorted_codes, prepend=-1) != 0)
 
-    ###########################
 
-    return
+def _any_value(column: pd.Series, codes: np.ndarray, first_rows: np.ndarray) -> np.ndarray:
+    """First non-null value of a column per group, like DuckDB's ANY_VALUE."""
+    values = column.to_numpy()
+    valid = column.notna().to_numpy()
+    if valid.all() or not valid.any():
+        return values[first_rows]
+
+    valid_rows = np.flatnonzero(valid)
+    valid_codes, groups = pd.factorize(codes[valid_rows])
+    picked = first_rows.copy()
+    picked[groups] = valid_rows[_first_index(valid_codes)]
+    return values[picked]
+
+
+def _group_sum(column: pd.Series, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """Per-group sum of a column, with nulls counted as 0."""
+    values = column.to_numpy(dtype="float64", na_value=0.0)
+    return np.bincount(codes, weights=values, minlength=n_groups)
+
+
+def compute_features_py(exercise_df: pd.DataFrame) -> pd.DataFrame:
+    """Builds the features.sql frame with grouped NumPy reductions.
+
+    Rows are grouped through the factorized `session_group` codes, so every
+    feature is a bincount or a segmented reduction; there is no per-group
+    Python code. Groups come out in order of first appearance. Ties are
+    broken deterministically: `exercise_with_most_incorrect` takes the
+    lexicographically smallest exercise among the most incorrect ones and
+    `first_exercise_skipped` the earliest row among equal `exercise_order`.
+
+    Parameters
+    ----------
+    exercise_df : pd.DataFrame
+        Raw exercise results, one row per exercise.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row of features per session group.
+    """
+    codes, session_groups = pd.factorize(exercise_df["session_group"], use_na_sentinel=False)
+    codes = codes.astype(np.int64)
+    n_groups = len(session_groups)
+    first_rows = _first_index(codes)
+
+    features = {"session_group": np.asarray(session_groups, dtype=object)}
+
+    # Session-level attributes
+    for column in SESSION_COLUMNS:
+        features[column] = _any_value(exercise_df[column], codes, first_rows)
+
+    # Leave exercise counts
+    leave_codes, leave_reasons = pd.factorize(exercise_df["leave_exercise"])
+    leave_reasons = list(leave_reasons)
+    for reason in LEAVE_EXERCISE_REASONS:
+        if reason in leave_reasons:
+            matches = codes[leave_codes == leave_reasons.index(reason)]
+            features[f"leave_exercise_{reason}"] = np.bincount(matches, minlength=n_groups)
+        else:
+            features[f"leave_exercise_{reason}"] = np.zeros(n_groups, dtype=np.int64)
+
+    features["prescribed_repeats"] = _group_sum(exercise_df["prescribed_repeats"], codes, n_groups)
+    features["training_time"] = _group_sum(exercise_df["training_time"], codes, n_groups)
+
+    # perc_correct_repeats = SUM(correct) / NULLIF(SUM(correct + wrong), 0)
+    correct = exercise_df["correct_repeats"].to_numpy(dtype="float64", na_value=np.nan)
+    wrong = exercise_df["wrong_repeats"].to_numpy(dtype="float64", na_value=np.nan)
+    correct_seen = ~np.isnan(correct)
+    correct_sum = np.bincount(codes[correct_seen], weights=correct[correct_seen], minlength=n_groups)
+    has_correct = np.bincount(codes[correct_seen], minlength=n_groups) > 0
+    attempted = correct + wrong
+    attempted_seen = ~np.isnan(attempted)
+    attempted_sum = np.bincount(
+        codes[attempted_seen], weights=attempted[attempted_seen], minlength=n_groups
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        features["perc_correct_repeats"] = np.where(
+            has_correct & (attempted_sum != 0), correct_sum / attempted_sum, np.nan
+        )
+
+    features["number_exercises"] = np.bincount(codes, minlength=n_groups)
+
+    # (session_group, exercise_name) pairs; exercise codes are lexicographic
+    # and a null exercise name ranks after every name
+    exercise_codes, exercise_names = pd.factorize(exercise_df["exercise_name"], sort=True)
+    n_exercises = len(exercise_names)
+    exercise_rank = np.where(exercise_codes < 0, n_exercises, exercise_codes).astype(np.int64)
+    pairs, pair_codes = np.unique(codes * (n_exercises + 1) + exercise_rank, return_inverse=True)
+    pair_group = pairs // (n_exercises + 1)
+    pair_rank = pairs % (n_exercises + 1)
+
+    features["number_of_distinct_exercises"] = np.bincount(
+        pair_group[pair_rank < n_exercises], minlength=n_groups
+    )
+
+    # Argmax of wrong repeats per group: the key orders pairs by total wrong
+    # repeats, then by reversed exercise rank, so the max is unique per group.
+    # Pairs without any wrong_repeats value get -1 (repeats are non-negative).
+    wrong_seen = ~np.isnan(wrong)
+    pair_wrong = np.bincount(
+        pair_codes[wrong_seen], weights=wrong[wrong_seen], minlength=len(pairs)
+    ).astype(np.int64)
+    pair_has_wrong = np.bincount(pair_codes[wrong_seen], minlength=len(pairs)) > 0
+    pair_key = np.where(
+        pair_has_wrong, pair_wrong * (n_exercises + 1) + (n_exercises - pair_rank), -1
+    )
+    best_key = np.maximum.reduceat(pair_key, _run_starts(pair_group)) if n_groups else pair_key
+    best_rank = n_exercises - best_key % (n_exercises + 1)
+    names = np.append(np.asarray(exercise_names, dtype=object), None)
+    most_incorrect = names[np.clip(best_rank, 0, n_exercises)]
+    most_incorrect[best_key // (n_exercises + 1) == 0] = "None"
+    most_incorrect[best_key < 0] = None
+    features["exercise_with_most_incorrect"] = most_incorrect
+
+    # First skipped exercise: lowest exercise_order (nulls last), then earliest row
+    skipped = np.flatnonzero(leave_codes >= 0)
+    skipped_order = exercise_df["exercise_order"].to_numpy(dtype="float64", na_value=np.nan)[skipped]
+    skipped = skipped[np.lexsort((skipped, skipped_order, codes[skipped]))]
+    first_skipped = skipped[_run_starts(codes[skipped])]
+    features["first_exercise_skipped"] = np.full(n_groups, None, dtype=object)
+    features["first_exercise_skipped"][codes[first_skipped]] = exercise_df[
+        "exercise_name"
+    ].to_numpy(dtype=object)[first_skipped]
+
+    return pd.DataFrame(features)
+
+
+def transform_features_py(exercise_df: pd.DataFrame = None, compression: str = FEATURES_COMPRESSION):
+    """-Loads the exercise results and transforms
+    them into features with the NumPy engine (compute_features_py).
+        -Produces the same frame as the features.sql query, written like
+        transform_features_sql.
+    """
+    if exercise_df is None:
+        exercise_df = pd.read_parquet(Path(DATA_DIR, "exercise_results.parquet"))
+
+    session = compute_features_py(exercise_df)
+
+    create_dirs()
+    write_features(session, FEATURES_PATH, compression=compression)
 
 
 def get_features(session_group: str) -> dict:
     """Gets the features for a given session group.
 
+    Lookups go through the shared FeatureStore: the first ones read the
+    row group of the session only, later ones hit the loaded table.
+
     Parameters
     ----------
     session_group : str
@@ -60,34 +278,110 @@ def get_features(session_group: str) -> dict:
     dict
         The features for the given session group in a dict format.
     """
-    session = pd.read_parquet(Path(DATA_DIR, "features_expected.parquet"))
+    features = get_feature_store().get(session_group)
 
-    return session[session["session_group"] == session_group].to_dict(
-        orient="records"
-    )
+    return [features] if features is not None else []
+
+
+# Keys of the context returned by fetch_session_data, with the value used
+# when a feature is missing
+SESSION_CONTEXT_DEFAULTS = {
+    "patient_name": "Unknown",
+    "therapy_name": "Unknown Therapy",
+    "session_number": None,
+    "session_is_nok": True,
+    "pain": 0,
+    "fatigue": 0,
+    "quality": 5,
+    "number_exercises": 0,
+    "exercise_with_most_incorrect": "N/A",
+    "first_exercise_skipped": "N/A",
+    "leave_session": "No early leave",
+    "number_of_distinct_exercises": "N/A",
+    "perc_correct_repeats": "N/A",
+}
+
+# Keys of the context returned by fetch_session_data, available to the prompt templates
+SESSION_CONTEXT_FIELDS = list(SESSION_CONTEXT_DEFAULTS)
 
+# How the templates render a null feature: records hold None for every null
+# (FeatureStore builds them from Arrow), and render_user_prompts fills the
+# nulls of its columns with the same text
+NULL_TEXT = format(None, "")
 
-def fetch_session_data(session_group: str) -> dict:
-    """Fetches and processes session data."""
+# Context fields fetch_session_data hands out as strings
+SESSION_CONTEXT_STRING_FIELDS = ["pain", "fatigue", "quality", "number_exercises"]
+
+
+class SessionContext(Mapping):
+    """Session context of one message, the values the prompt templates get.
+
+    A read-only mapping over SESSION_CONTEXT_FIELDS (plus
+    `scenario_description` once set), stored in slots instead of a dict:
+    values are kept as they come from the features, and the fields in
+    SESSION_CONTEXT_STRING_FIELDS are formatted to strings only when read.
+    Compares equal to the dict of the same context.
+    """
+
+    __slots__ = (*SESSION_CONTEXT_FIELDS, "scenario_description")
+
+    patient_name: str
+    therapy_name: str
+    session_number: Optional[float]
+    session_is_nok: bool
+    pain: float
+    fatigue: float
+    quality: float
+    number_exercises: int
+    exercise_with_most_incorrect: Optional[str]
+    first_exercise_skipped: Optional[str]
+    leave_session: Optional[str]
+    number_of_distinct_exercises: int
+    perc_correct_repeats: float
+    scenario_description: str
+
+    @classmethod
+    def from_record(cls, record: Mapping) -> "SessionContext":
+        """Context of a features record (a FeatureStore row), with the defaults for missing features."""
+        context = cls.__new__(cls)
+        for field, default in SESSION_CONTEXT_DEFAULTS.items():
+            setattr(context, field, record.get(field, default))
+        # Only ever compared to True when picking the scenario
+        context.session_is_nok = bool(context.session_is_nok == True)
+        return context
+
+    def __getitem__(self, field: str):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        try:
+            value = getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+        return f"{value}" if field in SESSION_CONTEXT_STRING_FIELDS else value
+
+    def __setitem__(self, field: str, value) -> None:
+        if field not in self.__slots__:
+            raise KeyError(f"{field} is not a session context field")
+        setattr(self, field, value)
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.__slots__:
+            if hasattr(self, field):
+                yield field
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"SessionContext({dict(self)!r})"
+
+
+def fetch_session_data(session_group: str) -> Optional[SessionContext]:
+    """Fetches the session context of a session group, None if it is unknown."""
     features = get_features(session_group=session_group)
     if not features:
-        return {}
+        return None
 
     session_info = features[0] if isinstance(features, list) else features
-    # Ensure we always return a structured dictionary with defaults
-    return {
-        "patient_name": session_info.get("patient_name", "Unknown"),
-        "therapy_name": session_info.get("therapy_name", "Unknown Therapy"),
-        "session_number": session_info.get("session_number", None),
-        "session_is_nok": session_info.get("session_is_nok", True),
-        "pain": f"{session_info.get('pain', 0)}",
-        "fatigue": f"{session_info.get('fatigue', 0)}",
-        "quality": f"{session_info.get('quality', 5)}",
-        "number_exercises": f"{session_info.get('number_exercises', 0)}",
-        "exercise_with_most_incorrect": session_info.get("exercise_with_most_incorrect", "N/A"),
-        "first_exercise_skipped": session_info.get("first_exercise_skipped", "N/A"),
-        "leave_session": session_info.get("leave_session", "No early leave"),
-        "number_of_distinct_exercises": session_info.get("number_of_distinct_exercises", "N/A"),
-        "perc_correct_repeats": session_info.get("perc_correct_repeats", "N/A"),
-    }
-
+    # Ensure we always return a structured context with defaults
+    return SessionContext.from_record(session_info)
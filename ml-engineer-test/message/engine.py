@@ -0,0 +1,116 @@
+from pathlib import Path
+from typing import Optional
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from message.feature_store import replace_file
+
+
+def sql_literal(value) -> str:
+    """Quotes a path, or a list of paths, as a DuckDB string literal."""
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(sql_literal(item) for item in value) + "]"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def parquet_source(source) -> str:
+    """Parquet scan of a file, a directory (every .parquet file below it),
+    a glob or a list of files."""
+    if isinstance(source, (list, tuple)):
+        return f"read_parquet({sql_literal([str(path) for path in source])})"
+    if Path(source).is_dir():
+        source = Path(source, "**", "*.parquet")
+    return f"read_parquet({sql_literal(source)})"
+
+
+class DuckDBSession:
+    """A dedicated, configured DuckDB connection.
+
+    Each session owns its own in-memory database, so tables registered in
+    one session are invisible to others and several transforms can run in
+    the same process. Inputs are registered as Arrow tables (pandas frames
+    are converted once, Arrow tables are scanned in place). Closing the
+    session, or leaving its `with` block, drops the registrations and the
+    connection.
+
+    Parameters
+    ----------
+    threads : int, optional
+        Number of DuckDB worker threads, defaults to all cores.
+    memory_limit : str, optional
+        Memory limit, e.g. "4GB", defaults to DuckDB's (80% of RAM).
+    temp_directory : Path, optional
+        Directory operators spill to when the memory limit is reached.
+    preserve_insertion_order : bool
+        Keep the input row order in results; turning it off lets DuckDB
+        stream and parallelize more freely.
+    """
+
+    def __init__(
+        self,
+        threads: Optional[int] = None,
+        memory_limit: Optional[str] = None,
+        temp_directory: Optional[Path] = None,
+        preserve_insertion_order: bool = False,
+    ):
+        config = {"preserve_insertion_order": preserve_insertion_order}
+        if threads:
+            config["threads"] = int(threads)
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        if temp_directory:
+            Path(temp_directory).mkdir(parents=True, exist_ok=True)
+            config["temp_directory"] = str(temp_directory)
+
+        self.connection = duckdb.connect(config=config)
+        self.connection.execute("SET enable_progress_bar = false")
+        self._registered = {}
+
+    def __enter__(self) -> "DuckDBSession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def register(self, name: str, data) -> None:
+        """Exposes a pandas frame or an Arrow table/dataset/reader as a view."""
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        self.connection.register(name, data)
+        # Keep a reference, DuckDB scans the Arrow buffers in place
+        self._registered[name] = data
+
+    def unregister(self, name: str) -> None:
+        self.connection.unregister(name)
+        self._registered.pop(name, None)
+
+    def create_parquet_view(self, name: str, source) -> None:
+        """Creates a view over parquet file(s), read lazily with projection pushdown."""
+        self.connection.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {parquet_source(source)}")
+
+    def execute(self, query: str, parameters=None) -> duckdb.DuckDBPyConnection:
+        return self.connection.execute(query, parameters)
+
+    def query_df(self, query: str, parameters=None) -> pd.DataFrame:
+        return self.connection.execute(query, parameters).fetchdf()
+
+    def copy_to_parquet(self, query: str, path: Path) -> int:
+        """Writes the result of a query straight to a parquet file, returns the row count."""
+        query = query.strip().rstrip(";")
+        n_rows = []
+        replace_file(
+            path,
+            lambda tmp_path: n_rows.append(
+                self.connection.execute(f"COPY ({query}) TO {sql_literal(tmp_path)} (FORMAT PARQUET)").fetchone()[0]
+            ),
+        )
+        return n_rows[0]
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        for name in list(self._registered):
+            self.unregister(name)
+        self.connection.close()
+        self.connection = None
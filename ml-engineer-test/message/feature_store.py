@@ -0,0 +1,333 @@
+import bisect
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from message.config import DATA_DIR
+
+# Features served by get_features: the output of `message transform` (write_features),
+# not features_expected.parquet; see "Served features vs the reference file" in the README
+FEATURES_PATH = Path(DATA_DIR, "features.parquet")
+
+# Layout of the features files the transforms write (write_features)
+FEATURES_ROW_GROUP_SIZE = 8_192
+FEATURES_COMPRESSION = "zstd"
+
+# Point lookups a lazy FeatureStore serves from the file before loading it all
+LAZY_LOOKUPS = 100
+
+
+# Storage types of the features columns, whatever the engine or the values
+# written: narrow integers, float64 for scores and ratios (prompts print them),
+# int64 for sums. Other columns (e.g. of the prompts file) keep their type.
+FEATURES_SCHEMA = pa.schema(
+    [
+        ("session_group", pa.string()),
+        ("patient_id", pa.string()),
+        ("patient_name", pa.string()),
+        ("patient_age", pa.int16()),
+        ("therapy_name", pa.string()),
+        ("session_number", pa.int32()),
+        ("leave_session", pa.string()),
+        ("session_is_nok", pa.bool_()),
+        ("pain", pa.float64()),
+        ("fatigue", pa.float64()),
+        ("quality", pa.float64()),
+        *(
+            (f"quality_reason_{reason}", pa.int8())
+            for reason in [
+                "movement_detection",
+                "my_self_personal",
+                "other",
+                "exercises",
+                "tablet",
+                "tablet_and_or_motion_trackers",
+                "easy_of_use",
+                "session_speed",
+            ]
+        ),
+        *(
+            (f"leave_exercise_{reason}", pa.int32())
+            for reason in ["system_problem", "other", "unable_perform", "pain", "tired", "technical_issues", "difficulty"]
+        ),
+        ("prescribed_repeats", pa.int64()),
+        ("training_time", pa.int64()),
+        ("perc_correct_repeats", pa.float64()),
+        ("number_exercises", pa.int32()),
+        ("number_of_distinct_exercises", pa.int32()),
+        ("exercise_with_most_incorrect", pa.string()),
+        ("first_exercise_skipped", pa.string()),
+    ]
+)
+
+
+def replace_file(path: Path, write) -> None:
+    """Writes through a temporary file so readers never see a partial file."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_features(
+    features: Union[pd.DataFrame, pa.Table],
+    path: Path,
+    compression: str = FEATURES_COMPRESSION,
+    compression_level: Optional[int] = None,
+    row_group_size: int = FEATURES_ROW_GROUP_SIZE,
+    metadata: Optional[Dict[str, str]] = None,
+) -> None:
+    """Writes a features table in the layout lookups can prune.
+
+    Rows are sorted by `session_group` and cut into row groups of
+    `row_group_size` rows, so the min/max statistics of every row group
+    cover a disjoint key range and a point lookup reads one row group
+    (read_features). Columns are stored in their FEATURES_SCHEMA type, so
+    every write has the same schema whatever its values; the casts are
+    safe, a value the type cannot hold raises instead of being changed.
+    Every column but the unique `session_group` is dictionary-encoded
+    (pages of high-cardinality columns fall back to plain encoding).
+    Reading the file back gives the same values. The file is replaced
+    atomically, so stores serving it never see a partial file and a failed
+    write leaves the previous one in place.
+
+    Parameters
+    ----------
+    features : pd.DataFrame or pa.Table
+        Features, one row per session_group.
+    path : Path
+        Parquet file to write.
+    compression : str
+        Parquet codec: "zstd", "snappy", "gzip", "brotli", "lz4" or "none".
+    compression_level : int, optional
+        Level of the codec, its default when None.
+    row_group_size : int
+        Rows per row group; smaller groups make point reads cheaper and
+        compress a little worse.
+    metadata : dict, optional
+        Key-value metadata added to the file schema.
+    """
+    table = features if isinstance(features, pa.Table) else pa.Table.from_pandas(features, preserve_index=False)
+    table = table.sort_by("session_group")
+    for offset, name in enumerate(table.column_names):
+        if name in FEATURES_SCHEMA.names:
+            table = table.set_column(offset, name, table.column(name).cast(FEATURES_SCHEMA.field(name).type))
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+    replace_file(
+        path,
+        lambda tmp_path: pq.write_table(
+            table,
+            tmp_path,
+            row_group_size=row_group_size,
+            compression=compression,
+            compression_level=compression_level,
+            use_dictionary=[name for name in table.column_names if name != "session_group"],
+            write_statistics=True,
+        ),
+    )
+
+
+def matching_row_groups(metadata: pq.FileMetaData, session_groups: Iterable[str]) -> List[int]:
+    """Row groups whose `session_group` min/max statistics may hold one of the keys."""
+    keys = sorted(session_groups)
+    column = metadata.schema.names.index("session_group")
+    row_groups = []
+    for row_group in range(metadata.num_row_groups):
+        statistics = metadata.row_group(row_group).column(column).statistics
+        if statistics is None or not statistics.has_min_max:
+            row_groups.append(row_group)
+            continue
+        first = bisect.bisect_left(keys, statistics.min)
+        if first < len(keys) and keys[first] <= statistics.max:
+            row_groups.append(row_group)
+    return row_groups
+
+
+def read_features(
+    session_groups: Iterable[str], path: Path = FEATURES_PATH, columns: Optional[List[str]] = None
+) -> pa.Table:
+    """Reads the features of some session groups with filter pushdown.
+
+    Only the row groups whose statistics may hold the keys are read, one
+    per session on files written by write_features; files without useful
+    statistics are read whole. Rows come in file order, unknown session
+    groups are left out.
+    """
+    keys = list(dict.fromkeys(session_groups))
+    if columns is not None and "session_group" not in columns:
+        columns = ["session_group", *columns]
+    path = Path(path)
+    if path.is_dir():
+        return pq.read_table(path, columns=columns, filters=[("session_group", "in", keys)])
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    row_groups = matching_row_groups(parquet_file.metadata, keys)
+    table = parquet_file.read_row_groups(row_groups, columns=columns)
+    return table.filter(pc.is_in(table["session_group"], pa.array(keys, pa.string())))
+
+
+def _columns(table: pa.Table) -> Dict[str, List]:
+    """One Python list per column, with Arrow's Python values: nulls of every type are None."""
+    return {name: table.column(name).to_pylist() for name in table.column_names}
+
+
+class FeatureStore:
+    """Memory-resident features table with a hash index on `session_group`.
+
+    The parquet file is read once (memory-mapped) and kept as one Python list
+    per column, so a lookup is a dict probe plus one list access per column.
+    Records hold the Python values of the Arrow columns (`to_pylist`), so a
+    null is None whatever its type and whatever the pandas version.
+    The Arrow table is kept as well, for columnar access to many sessions
+    at once (`take`).
+
+    A `lazy` store does not read the file up front: its first `lazy_lookups`
+    point lookups read only the row group of the session (read_features),
+    so a short-lived process looking up one session never loads the whole
+    table. Any other access, or more lookups, loads it, and so does the
+    first lookup in a file of a single row group.
+
+    Parameters
+    ----------
+    path : Path
+        Features parquet file (or dataset directory) to serve.
+    auto_reload : bool
+        Reload when the file's mtime changes. The mtime is checked at most
+        once every `reload_interval` seconds.
+    reload_interval : float
+        Minimum number of seconds between two mtime checks.
+    lazy : bool
+        Serve the first point lookups from the file instead of loading it.
+    lazy_lookups : int
+        Point lookups served from the file before a lazy store loads it.
+    """
+
+    def __init__(
+        self,
+        path: Path = FEATURES_PATH,
+        auto_reload: bool = True,
+        reload_interval: float = 1.0,
+        lazy: bool = False,
+        lazy_lookups: int = LAZY_LOOKUPS,
+    ):
+        self.path = Path(path)
+        self.auto_reload = auto_reload
+        self.reload_interval = reload_interval
+        self.lazy_lookups = lazy_lookups if lazy else 0
+        self.file_lookups = 0
+        self._row_groups = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._state = None
+        if not lazy:
+            self.reload()
+
+    def reload(self) -> None:
+        """Reads the features file and rebuilds the index."""
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            table = pq.read_table(self.path, memory_map=True)
+            columns = _columns(table)
+            # First occurrence wins, session_group is unique in the features table
+            index = {}
+            for offset, session_group in enumerate(columns["session_group"]):
+                index.setdefault(session_group, offset)
+
+            # Swap in one assignment so concurrent readers never see a mix
+            self._state = (columns, index, table)
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+
+    def _loaded(self):
+        """The loaded columns, index and table, loading or reloading the file if needed."""
+        if self._state is None:
+            self.reload()
+        elif self.auto_reload:
+            self._maybe_reload()
+        return self._state
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        if os.stat(self.path).st_mtime_ns != self._mtime:
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._loaded()[1])
+
+    def __contains__(self, session_group: str) -> bool:
+        return session_group in self._loaded()[1]
+
+    def column(self, name: str) -> List:
+        """Returns all values of a column, in file order."""
+        return self._loaded()[0][name]
+
+    def _lookup(self, session_group: str) -> Optional[Dict]:
+        """Reads the features of one session group from the file, without loading it."""
+        self.file_lookups += 1
+        columns = _columns(read_features([session_group], self.path))
+        if not columns["session_group"]:
+            return None
+        return {name: values[0] for name, values in columns.items()}
+
+    def _prunable(self) -> bool:
+        """Whether a point read of the file can skip row groups."""
+        if self._row_groups is None:
+            self._row_groups = math.inf if self.path.is_dir() else pq.read_metadata(self.path).num_row_groups
+        return self._row_groups > 1
+
+    def get(self, session_group: str) -> Optional[Dict]:
+        """Returns the features of a session group, or None if it is unknown."""
+        if self._state is None and self.file_lookups < self.lazy_lookups and self._prunable():
+            return self._lookup(session_group)
+
+        columns, index, _ = self._loaded()
+        offset = index.get(session_group)
+        if offset is None:
+            return None
+        return {name: values[offset] for name, values in columns.items()}
+
+    def get_many(self, session_groups: Iterable[str]) -> List[Optional[Dict]]:
+        """Returns the features of several session groups, in the same order.
+
+        Unknown session groups give None.
+        """
+        columns, index, _ = self._loaded()
+        records = []
+        for session_group in session_groups:
+            offset = index.get(session_group)
+            records.append(
+                None if offset is None else {name: values[offset] for name, values in columns.items()}
+            )
+        return records
+
+    def take(self, session_groups: Iterable[str]) -> pa.Table:
+        """Returns the features of several session groups as an Arrow table.
+
+        Rows are in the same order as `session_groups`; unknown session
+        groups give a row of nulls.
+        """
+        _, index, table = self._loaded()
+        return table.take(pa.array([index.get(session_group) for session_group in session_groups], pa.int64()))
+
+
+@lru_cache()
+def get_feature_store() -> FeatureStore:
+    """Shared feature store over the default features file.
+
+    It is lazy: a process that looks up a few sessions reads their row
+    groups only, a long-running one loads the table after LAZY_LOOKUPS.
+    """
+    return FeatureStore(lazy=True)
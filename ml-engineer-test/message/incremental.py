@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+from message.config import DATA_DIR, QUERIES_DIR
+from message.data import FEATURES_QUERY, open_query
+from message.engine import DuckDBSession, replace_file, sql_literal
+
+FEATURES_DATASET_DIR = Path(DATA_DIR, "features")
+MANIFEST_FILENAME = "_manifest.parquet"
+WATERMARK_FILENAME = "_watermark.json"
+WATERMARK_COLUMN = "session_exercise_result_id"
+
+
+def _load_watermark(dataset_dir: Path):
+    watermark_path = Path(dataset_dir, WATERMARK_FILENAME)
+    if not watermark_path.exists():
+        return None
+    return json.loads(watermark_path.read_text())["value"]
+
+
+def _load_manifest(dataset_dir: Path) -> pd.DataFrame:
+    manifest_path = Path(dataset_dir, MANIFEST_FILENAME)
+    if not manifest_path.exists():
+        return pd.DataFrame({"session_group": pd.Series(dtype=object), "part": pd.Series(dtype=object)})
+    return pd.read_parquet(manifest_path)
+
+
+def _remove_orphan_parts(dataset_dir: Path, manifest: pd.DataFrame) -> None:
+    """Deletes the parts (and temporary files) of a run that died before writing the manifest."""
+    referenced = set(manifest["part"])
+    for path in [*dataset_dir.glob("part-*.parquet"), *dataset_dir.glob(".*.tmp")]:
+        if path.name not in referenced:
+            path.unlink(missing_ok=True)
+
+
+def _next_part(dataset_dir: Path, manifest: pd.DataFrame) -> str:
+    """Name of a new part, after every part on disk or in the manifest (which may be gone already)."""
+    parts = {path.name for path in dataset_dir.glob("part-*.parquet")} | set(manifest["part"])
+    index = max(int(Path(part).stem.split("-")[1]) for part in parts) + 1 if parts else 0
+    return f"part-{index:05d}.parquet"
+
+
+def transform_features_incremental(
+    source=None,
+    dataset_dir: Path = FEATURES_DATASET_DIR,
+    query_filename: str = FEATURES_QUERY,
+    watermark_column: str = WATERMARK_COLUMN,
+) -> int:
+    """Materializes features only for session groups that changed since the last run.
+
+    Rows whose `watermark_column` is above the stored watermark mark their
+    session groups as new or changed. Only those groups are aggregated, from
+    all of their rows, and written as a new part of the features dataset.
+    Groups that were materialized before are dropped from their old part,
+    so every session group lives in exactly one part. The manifest maps
+    each session group to its part.
+
+    The manifest and then the watermark are written last, so a run that
+    dies half-way is simply redone: the next run deletes the parts the
+    manifest does not reference and recomputes the same groups.
+
+    Parameters
+    ----------
+    source : str or Path
+        Parquet file, directory glob or list of files with the exercise results.
+    dataset_dir : Path
+        Directory of the partitioned features dataset.
+    query_filename : str
+        Features query to run over the changed groups.
+    watermark_column : str
+        Monotonically increasing column used to detect new rows.
+
+    Returns
+    -------
+    int
+        Number of session groups materialized in this run.
+    """
+    source = source or Path(DATA_DIR, "exercise_results.parquet")
+    dataset_dir = Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(dataset_dir)
+    _remove_orphan_parts(dataset_dir, manifest)
+
+    with DuckDBSession() as session:
+        session.create_parquet_view("exercise_results_source", source)
+
+        # 1️⃣ Session groups with rows above the watermark
+        watermark = _load_watermark(dataset_dir)
+        new_rows = f"WHERE {watermark_column} > $watermark" if watermark is not None else ""
+        session.execute(
+            f"""
+            CREATE TEMP TABLE delta AS
+            SELECT session_group, MAX({watermark_column}) AS watermark
+            FROM exercise_results_source
+            {new_rows}
+            GROUP BY session_group
+            """,
+            {"watermark": watermark} if watermark is not None else None,
+        )
+        n_groups, new_watermark = session.execute("SELECT COUNT(*), MAX(watermark) FROM delta").fetchone()
+        if n_groups == 0:
+            return 0
+
+        # 2️⃣ Aggregate all rows of the changed groups into a new part
+        session.execute(
+            """
+            CREATE TEMP VIEW exercise_results AS
+            SELECT * FROM exercise_results_source
+            WHERE session_group IN (SELECT session_group FROM delta)
+            """
+        )
+        part = _next_part(dataset_dir, manifest)
+        session.copy_to_parquet(open_query(Path(QUERIES_DIR, query_filename)), Path(dataset_dir, part))
+
+        # 3️⃣ Drop the changed groups from the parts they were materialized in
+        delta = session.query_df("SELECT session_group FROM delta")
+        changed = manifest[manifest["session_group"].isin(delta["session_group"])]
+        for old_part in changed["part"].unique():
+            old_path = Path(dataset_dir, old_part)
+            if manifest["part"].eq(old_part).sum() == (changed["part"] == old_part).sum():
+                # Already gone if an earlier run died after deleting it
+                old_path.unlink(missing_ok=True)
+                continue
+            session.copy_to_parquet(
+                f"""
+                SELECT * FROM read_parquet({sql_literal(old_path)})
+                WHERE session_group NOT IN (SELECT session_group FROM delta)
+                """,
+                old_path,
+            )
+
+    # 4️⃣ Record where every group lives and advance the watermark
+    delta["part"] = part
+    manifest = pd.concat(
+        [manifest[~manifest["session_group"].isin(delta["session_group"])], delta],
+        ignore_index=True,
+    )
+    replace_file(Path(dataset_dir, MANIFEST_FILENAME), lambda path: manifest.to_parquet(path, index=False))
+    replace_file(
+        Path(dataset_dir, WATERMARK_FILENAME),
+        lambda path: path.write_text(json.dumps({"column": watermark_column, "value": new_watermark})),
+    )
+
+    return n_groups
+
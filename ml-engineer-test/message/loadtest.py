@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable
+
+import numpy as np
+from message.metrics import COALESCED, scoped_metrics
+
+LATENCY_QUANTILES = {"p50": 50, "p95": 95, "p99": 99}
+
+
+def latency_summary(latencies: Iterable[float]) -> Dict:
+    """Exact latency quantiles, mean and max of a load test, in seconds."""
+    latencies = np.asarray(list(latencies), dtype="float64")
+    if not len(latencies):
+        return {}
+    summary = {name: float(np.percentile(latencies, q)) for name, q in LATENCY_QUANTILES.items()}
+    summary["mean"] = float(latencies.mean())
+    summary["max"] = float(latencies.max())
+    return summary
+
+
+async def run_loadtest(
+    send: Callable[[str], Awaitable],
+    session_groups: Iterable[str],
+    rps: float,
+    duration: float,
+) -> Dict:
+    """Drives `send(session_group)` at a target request rate and measures it.
+
+    Arrivals are open-loop: request i starts `i / rps` seconds after the
+    start whether or not earlier requests have finished, so a slow backend
+    shows up as growing latency instead of a lower request rate. Session
+    groups are cycled if there are fewer than requests.
+
+    Parameters
+    ----------
+    send : Callable[[str], Awaitable]
+        Coroutine function handling one session group, e.g. `get_message`.
+    session_groups : Iterable[str]
+        Session groups to send.
+    rps : float
+        Target requests per second.
+    duration : float
+        Seconds of load; `rps * duration` requests are sent.
+
+    Returns
+    -------
+    dict
+        Requests sent, successes, errors by type, target and achieved
+        throughput (successful requests per second until the last one
+        finished), latency quantiles of the successful requests, the worst
+        start delay behind schedule, the number of calls coalesced into an
+        identical one in flight and the metrics summary of the run.
+    """
+    n_requests = int(rps * duration)
+    latencies = []
+    errors = Counter()
+
+    async def one(session_group: str) -> None:
+        start = time.perf_counter()
+        try:
+            await send(session_group)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    start_lag = 0.0
+    tasks = []
+    # The summary covers this run only, the process-wide metrics keep counting
+    with scoped_metrics() as metrics:
+        for i, session_group in zip(range(n_requests), itertools.cycle(session_groups)):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start_lag = max(start_lag, -delay)
+            tasks.append(asyncio.create_task(one(session_group)))
+        await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - start
+
+    return {
+        "requests": n_requests,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "seconds": seconds,
+        "target_rps": rps,
+        "achieved_rps": len(latencies) / seconds if seconds else 0.0,
+        "latency": latency_summary(latencies),
+        "max_start_lag": start_lag,
+        "coalesced": int(sum(metrics.counter(COALESCED).summary().values())),
+        "metrics": metrics.summary(),
+    }
@@ -1,49 +1,345 @@
-import pandas as pd
-import os
-from message.prompt_manager import get_scenario_prompt, load_prompt
-import typer
-from message.data import transform_features_py  # noqa
-from message.data import transform_features_sql  # noqa
-from message.data import fetch_session_data
-from message.model import generate_message
+import asyncio
+import json
+import sys
+from enum import Enum
 from pathlib import Path
-from message.config import DATA_DIR
+from typing import List
+
+import typer
+from message.coalesce import SingleFlight
+from message.config import DATA_DIR, STREAMING_MEMORY_LIMIT, STREAMING_TEMP_DIR, create_dirs
+from message.metrics import COALESCED, STAGE_SECONDS, get_metrics, scoped_metrics
+
+# Commands import pandas, duckdb, openai and the rest of the package when they
+# run, so starting the CLI (e.g. one `message get-message` per job) only pays
+# for what the command uses
 app = typer.Typer()
 
 
+@app.callback()
+def cli():
+    """Session features and AI-crafted messages."""
+    create_dirs()
+
+
+class Engine(str, Enum):
+    sql = "sql"
+    py = "py"
+
+
 @app.command()
-def transform():
+def transform(
+    engine: Engine = typer.Option(Engine.sql, help="Transformation engine: DuckDB SQL or NumPy."),
+    single_pass: bool = typer.Option(
+        False, "--single-pass", help="Use the single-scan features query (sql engine)."
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="Only materialize new or changed session groups into data/features/ (sql engine).",
+    ),
+    streaming: bool = typer.Option(
+        False,
+        "--streaming",
+        help="Scan the parquet input and write features out-of-core, without pandas (sql engine).",
+    ),
+    parallel: bool = typer.Option(
+        False,
+        "--parallel",
+        help="Hash-partition on session_group and aggregate the partitions in a process pool.",
+    ),
+    workers: int = typer.Option(None, help="Worker processes for --parallel, defaults to the number of cores."),
+    source: Path = typer.Option(None, help="Exercise results parquet file or directory."),
+    memory_limit: str = typer.Option(STREAMING_MEMORY_LIMIT, help="DuckDB memory limit for --streaming."),
+    temp_directory: Path = typer.Option(STREAMING_TEMP_DIR, help="DuckDB spill directory for --streaming."),
+    compression: str = typer.Option("zstd", help="Parquet codec of features.parquet: zstd, snappy, gzip or none."),
+):
+
+    if single_pass and engine == Engine.py:
+        raise typer.BadParameter("only the sql engine has a single-pass query.", param_hint="'--single-pass'")
+    if incremental and engine == Engine.py:
+        raise typer.BadParameter("only the sql engine has an incremental mode.", param_hint="'--incremental'")
+    if streaming and engine == Engine.py:
+        raise typer.BadParameter("only the sql engine has a streaming mode.", param_hint="'--streaming'")
+
+    from message.data import FEATURES_QUERY, FEATURES_SINGLE_PASS_QUERY
+
+    query_filename = FEATURES_SINGLE_PASS_QUERY if single_pass else FEATURES_QUERY
+
+    if incremental:
+        from message.incremental import transform_features_incremental
+
+        n_groups = transform_features_incremental(source, query_filename=query_filename)
+        print(f"Materialized {n_groups} new or changed session groups")
+        return
+
+    if parallel:
+        from message.parallel import FEATURES_PARALLEL_DIR, transform_features_parallel
+
+        n_groups = transform_features_parallel(
+            source, workers=workers, engine=engine.value, query_filename=query_filename
+        )
+        print(f"Wrote features for {n_groups} session groups to {FEATURES_PARALLEL_DIR}")
+        return
+
+    if streaming:
+        from message.streaming import transform_features_streaming
 
-    # Uncomment the function you want to run
-    
-    exercise_df = pd.read_parquet(Path(DATA_DIR, "exercise_results.parquet"))
-    transform_features_sql(tables_to_register=[("exercise_results", exercise_df)])
-    # transform_features_py()
+        n_groups = transform_features_streaming(
+            source,
+            query_filename=query_filename,
+            memory_limit=memory_limit,
+            temp_directory=temp_directory,
+        )
+        print(f"Wrote features for {n_groups} session groups")
+        return
+
+    import pandas as pd
+    from message.data import transform_features_py, transform_features_sql
+
+    exercise_df = pd.read_parquet(source or Path(DATA_DIR, "exercise_results.parquet"))
+
+    if engine == Engine.py:
+        transform_features_py(exercise_df, compression=compression)
+        return
+
+    transform_features_sql(
+        tables_to_register=[("exercise_results", exercise_df)],
+        query_filename=query_filename,
+        compression=compression,
+    )
 
     return
 
 
 @app.command()
+def render_prompts(
+    source: Path = typer.Option(
+        None, help="Features parquet file, defaults to data/features.parquet (written by transform, served by get-message)."
+    ),
+    output: Path = typer.Option(Path(DATA_DIR, "prompts.parquet"), help="Prompts parquet file."),
+    compression: str = typer.Option("zstd", help="Parquet codec: zstd, snappy, gzip or none."),
+):
+    """
+    Renders the prompt of every session into a prompts parquet, with its hash and token estimate.
+    Reads data/features.parquet, the output of `message transform`, unless --source is given.
+    get-message and generate-batch then send these prompts instead of rendering them.
+    """
+    from message.feature_store import FEATURES_PATH
+    from message.prompt_store import render_prompts_file
+
+    summary = render_prompts_file(source or FEATURES_PATH, output, compression=compression)
+    print(
+        f"Rendered {summary['sessions']} prompts, {summary['unique_prompts']} distinct "
+        f"(dedup ratio {summary['dedup_ratio']:.1%}) -> {output}"
+    )
+    print(
+        f"Estimated input tokens: {summary['input_tokens']:,} ({summary['unique_input_tokens']:,} deduplicated), "
+        f"cost ${summary['estimated_cost']:.2f} (${summary['unique_estimated_cost']:.2f} deduplicated)"
+    )
+
+
+# get_message calls in flight, by session_group
+MESSAGES_IN_FLIGHT = SingleFlight()
+
+
+@app.command("get-message")
+def get_message_command(session_group: str):
+    """
+    Retrieves session details for a given session_group and prints an AI-crafted message.
+    """
+
+    async def main():
+        try:
+            return await get_message(session_group)
+        finally:
+            # The pooled connections belong to this event loop; without a
+            # completion the model (and openai) was never loaded
+            model = sys.modules.get("message.model")
+            if model is not None and model.get_chat_model.cache_info().currsize:
+                await model.get_chat_model().aclose()
+
+    message = asyncio.run(main())
+    if message:
+        print(message)
+
+
 async def get_message(session_group: str) -> str:
     """
     Retrieves session details for a given session_group and generates an AI-crafted message.
+
+    Concurrent calls for the same session_group (e.g. upstream retries) share
+    one lookup, render and completion. The `get-message` command runs it
+    with asyncio.run, the load test awaits it directly.
     """
+    message, coalesced = await MESSAGES_IN_FLIGHT.run(session_group, lambda: _get_message(session_group))
+    if coalesced:
+        get_metrics().counter(COALESCED, "Calls that joined an identical call in flight.").inc(stage="message")
+    return message
+
 
-    # 1️⃣ Fetch session details
-    session_context = fetch_session_data(session_group)
-    if not session_context:
-        print(f"No session data found for session_group: {session_group}")
-        return ""
+async def _get_message(session_group: str) -> str:
+    from message.model import generate_message
+    from message.prompt_store import lookup_prompt
 
-    # 2️⃣ Load & format scenario description
-    session_context["scenario_description"] = get_scenario_prompt(session_context)
-    
-    # 3️⃣ Load user prompt template & format with session data
-    user_prompt_template = load_prompt("user_prompt.txt")
+    metrics = get_metrics()
 
-    user_prompt = user_prompt_template.format(**session_context)
+    # 1️⃣ Look up the prompt rendered by `message render-prompts`
+    with metrics.time_stage("prompt_lookup"):
+        user_prompt = lookup_prompt(session_group)
 
-    # 4️⃣ Generate AI message
+    if user_prompt is None:
+        from message.data import fetch_session_data
+        from message.prompt_manager import build_user_prompt
+
+        # 2️⃣ Otherwise fetch session details
+        with metrics.time_stage("feature_lookup"):
+            session_context = fetch_session_data(session_group)
+        if not session_context:
+            print(f"No session data found for session_group: {session_group}")
+            return ""
+
+        # ...and format scenario description & user prompt with session data
+        with metrics.time_stage("prompt_render"):
+            user_prompt = build_user_prompt(session_context)
+
+    # 3️⃣ Generate AI message
     response = await generate_message(user_prompt)
 
-    return response
\ No newline at end of file
+    return response
+
+
+@app.command()
+def generate_batch(
+    session_group: List[str] = typer.Option(None, "--session-group", "-s", help="Session group, repeatable."),
+    input_file: Path = typer.Option(None, help="File with one session_group per line."),
+    all_nok: bool = typer.Option(False, "--all-nok", help="Every NOK session in the feature store."),
+    output: Path = typer.Option(Path(DATA_DIR, "messages.jsonl"), help="Results file, .jsonl or .parquet."),
+    concurrency: int = typer.Option(16, help="Maximum number of completions in flight."),
+    tokens_per_minute: int = typer.Option(None, help="Token budget per minute across all requests."),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Always call the API, even for cached prompts."),
+    metrics_json: Path = typer.Option(Path(DATA_DIR, "metrics.json"), help="JSON summary of the batch metrics."),
+    metrics_prom: Path = typer.Option(
+        Path(DATA_DIR, "metrics.prom"), help="Batch metrics in the Prometheus text format."
+    ),
+):
+    """
+    Generates AI-crafted messages for many session groups, streaming results to a file.
+    """
+    from message.batch import generate_batch as run_generate_batch, nok_session_groups
+    from message.model import get_chat_model
+
+    session_groups = list(session_group or [])
+    if input_file:
+        session_groups += [line.strip() for line in input_file.read_text().splitlines() if line.strip()]
+    if all_nok:
+        session_groups += nok_session_groups()
+    if not session_groups:
+        raise typer.BadParameter("Provide --session-group, --input-file or --all-nok.")
+
+    async def main():
+        try:
+            return await run_generate_batch(
+                session_groups,
+                output,
+                concurrency=concurrency,
+                tokens_per_minute=tokens_per_minute,
+                use_cache=not no_cache,
+            )
+        finally:
+            # The pooled connections belong to this event loop
+            await get_chat_model().aclose()
+
+    with scoped_metrics() as metrics:
+        stats = asyncio.run(main())
+    print(
+        f"Generated {stats['generated']} messages ({stats['failed']} failed) "
+        f"in {stats['seconds']:.1f}s -> {output}"
+    )
+    if "cache" in stats:
+        print(f"Completion cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses")
+    if stats["coalesced"]:
+        print(f"Coalesced {stats['coalesced']} duplicate completions in flight")
+
+    for stage, latency in stats["metrics"].get(STAGE_SECONDS, {}).items():
+        print(f"{stage}: p50 {latency['p50'] * 1000:.1f}ms, p95 {latency['p95'] * 1000:.1f}ms, n={latency['count']}")
+    metrics.write(json_path=metrics_json, prometheus_path=metrics_prom)
+    print(f"Metrics -> {metrics_json}, {metrics_prom}")
+
+
+@app.command()
+def loadtest(
+    rps: float = typer.Option(50.0, help="Target requests per second."),
+    duration: float = typer.Option(10.0, help="Seconds of load."),
+    all_nok: bool = typer.Option(False, "--all-nok", help="Only NOK sessions, instead of every session."),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Always call the backend, even for cached prompts."),
+    output: Path = typer.Option(None, help="JSON file for the report."),
+):
+    """
+    Drives get_message at a target request rate and reports latency quantiles and throughput.
+    Set COMPLETION_BACKEND=stub and run `message stub-server` to load test offline.
+    """
+    from message.batch import nok_session_groups
+    from message.feature_store import get_feature_store
+    from message.loadtest import run_loadtest
+    from message.model import get_chat_model
+
+    session_groups = nok_session_groups() if all_nok else get_feature_store().column("session_group")
+    chat_model = get_chat_model()
+    if no_cache:
+        chat_model.cache = None
+
+    async def main():
+        try:
+            return await run_loadtest(get_message, session_groups, rps=rps, duration=duration)
+        finally:
+            await chat_model.aclose()
+
+    report = asyncio.run(main())
+    latency = report["latency"]
+    print(
+        f"{report['ok']}/{report['requests']} ok in {report['seconds']:.1f}s: "
+        f"{report['achieved_rps']:.1f} req/s achieved (target {rps:g})"
+    )
+    if latency:
+        print(
+            f"latency p50 {latency['p50'] * 1000:.1f}ms, p95 {latency['p95'] * 1000:.1f}ms, "
+            f"p99 {latency['p99'] * 1000:.1f}ms, max {latency['max'] * 1000:.1f}ms"
+        )
+    if report["errors"]:
+        print(f"errors: {report['errors']}")
+    if report["coalesced"]:
+        print(f"coalesced: {report['coalesced']} duplicate calls in flight")
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+        print(f"Report -> {output}")
+
+
+@app.command()
+def stub_server(
+    host: str = typer.Option("127.0.0.1"),
+    port: int = typer.Option(8089),
+    latency: float = typer.Option(0.0, help="Seconds per completion (mean, median for lognormal)."),
+    latency_distribution: str = typer.Option("constant", help="One of constant, exponential, lognormal."),
+    latency_sigma: float = typer.Option(0.5, help="Lognormal shape, larger means a longer tail."),
+    rate_limit_probability: float = typer.Option(0.0, help="Share of requests answered with a 429."),
+    rate_limit_rpm: float = typer.Option(None, help="Requests per minute served before answering 429."),
+    retry_after: float = typer.Option(1.0, help="Retry-After seconds of the random 429s."),
+    seed: int = typer.Option(None, help="Seed of the latency and 429 draws."),
+):
+    """
+    Serves a local OpenAI-compatible completion stub (set OPENAI_API_BASE=http://HOST:PORT/v1).
+    """
+    from message.stub_server import run_stub_server
+
+    run_stub_server(
+        host=host,
+        port=port,
+        latency=latency,
+        latency_distribution=latency_distribution,
+        latency_sigma=latency_sigma,
+        rate_limit_probability=rate_limit_probability,
+        rate_limit_rpm=rate_limit_rpm,
+        retry_after=retry_after,
+        seed=seed,
+    )
@@ -0,0 +1,257 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Upper bounds (s) of the latency histogram buckets, from microsecond local
+# stages (feature lookup, prompt render) up to slow completions
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Stages of one message: feature lookup, prompt render, completion, token counting
+STAGE_SECONDS = "message_stage_seconds"
+MESSAGE_SECONDS = "message_seconds"
+COMPLETIONS = "message_completions_total"
+RETRIES = "message_completion_retries_total"
+CACHE_REQUESTS = "message_cache_requests_total"
+COALESCED = "message_coalesced_total"
+TOKENS = "message_tokens_total"
+COST = "message_cost_dollars_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Registries of the scoped_metrics blocks the current context runs in
+_SCOPES: ContextVar[Tuple["MetricsRegistry", ...]] = ContextVar("metrics_scopes", default=())
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == math.inf else repr(value)
+
+
+class Counter:
+    """Monotonic counter, one value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield self.name, labels, value
+
+    def summary(self) -> Dict:
+        return {_format_labels(labels) or "total": value for labels, value in sorted(self._values.items())}
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one set of buckets per label set.
+
+    Quantiles are estimated by linear interpolation inside the bucket that
+    holds them, like Prometheus' `histogram_quantile`.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, count: int = 1, **labels) -> None:
+        """Records `value`, `count` times (e.g. a per-item share of a batch)."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += count
+                    break
+            series["sum"] += value * count
+            series["count"] += count
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_labels(labels))
+        return series["count"] if series else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        series = self._series.get(_labels(labels))
+        if not series or not series["count"]:
+            return None
+        rank = q * series["count"]
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series["counts"]):
+            if count and seen + count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def samples(self):
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", labels, series["sum"]
+            yield f"{self.name}_count", labels, series["count"]
+
+    def summary(self) -> Dict:
+        summary = {}
+        for labels, series in sorted(self._series.items()):
+            label_values = dict(labels)
+            summary[_format_labels(labels) or "total"] = {
+                "count": series["count"],
+                "sum": series["sum"],
+                "mean": series["sum"] / series["count"],
+                "p50": self.quantile(0.5, **label_values),
+                "p95": self.quantile(0.95, **label_values),
+                "p99": self.quantile(0.99, **label_values),
+            }
+        return summary
+
+
+class _Tee:
+    """Records into a metric and into its copies in the active scopes; reads from the first."""
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._metrics[0], name)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        for metric in self._metrics:
+            metric.inc(amount, **labels)
+
+    def observe(self, value: float, count: int = 1, **labels) -> None:
+        for metric in self._metrics:
+            metric.observe(value, count=count, **labels)
+
+
+class MetricsRegistry:
+    """Counters and histograms of the message pipeline.
+
+    Metrics are created on first use. `to_prometheus` renders them in the
+    Prometheus text exposition format, `summary` as a JSON-friendly dict
+    with counter totals and latency quantiles.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+        scopes = _SCOPES.get()
+        if not scopes or self in scopes:
+            return metric
+        return _Tee([metric] + [scope._get(cls, name, description, **kwargs) for scope in scopes])
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get(Counter, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, description, buckets=buckets)
+
+    @contextmanager
+    def time_stage(self, stage: str, count: int = 1):
+        """Observes the time spent in the block under `message_stage_seconds{stage=...}`.
+
+        A block handling `count` messages at once is recorded as `count`
+        observations of its per-message share.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if count:
+                self.histogram(STAGE_SECONDS, "Seconds spent per message stage.").observe(
+                    (time.perf_counter() - start) / count, count=count, stage=stage
+                )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics = {}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric.description:
+                lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        return {name: metric.summary() for name, metric in sorted(self._metrics.items())}
+
+    def write(self, json_path: Optional[Path] = None, prometheus_path: Optional[Path] = None) -> None:
+        """Writes the JSON summary and/or the Prometheus text export."""
+        if json_path:
+            Path(json_path).write_text(json.dumps(self.summary(), indent=2))
+        if prometheus_path:
+            Path(prometheus_path).write_text(self.to_prometheus())
+
+
+@lru_cache()
+def get_metrics() -> MetricsRegistry:
+    """Process-wide metrics registry."""
+    return MetricsRegistry()
+
+
+@contextmanager
+def scoped_metrics() -> Iterator[MetricsRegistry]:
+    """Collects the metrics recorded inside the block into a registry of its own.
+
+    Everything recorded in this context, and in the tasks it starts, still
+    goes to the process-wide registry, and also to the yielded one. A batch
+    or a load test can therefore summarize its own run without resetting
+    what other callers have recorded.
+    """
+    registry = MetricsRegistry()
+    token = _SCOPES.set(_SCOPES.get() + (registry,))
+    try:
+        yield registry
+    finally:
+        _SCOPES.reset(token)
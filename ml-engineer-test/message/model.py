@@ -1,16 +1,41 @@
 from message.prompt_manager import load_prompt
-import openai
 import asyncio
 import random
 import logging
+import time
 from openai.error import RateLimitError, APIError, Timeout, InvalidRequestError
+from message.backends import Completion, CompletionBackend, create_backend
 from message.config import get_settings
-import tiktoken
+from message.cache import CompletionCache, completion_key, prompt_hash
+from message.coalesce import SingleFlight
+from message.metrics import CACHE_REQUESTS, COALESCED, COMPLETIONS, COST, RETRIES, TOKENS, get_metrics
+from message.rate_limit import CompletionScheduler, retry_after
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    import tiktoken
 # OpenAI pricing (adjust if model changes)
+# Attempts for server errors and timeouts, with exponential backoff from RETRY_BACKOFF seconds
 MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Output budget reserved per request when rate limiting on tokens per minute
+EXPECTED_OUTPUT_TOKENS = 256
 PRICING = {
         "gpt-4-turbo-preview": {"input": 0.01 / 1000, "output": 0.03 / 1000},  # $0.01 per 1k input tokens, $0.03 per 1k output tokens
     }
+# Token counts of static prompts (system prompt, templates) by (model, prompt hash)
+STATIC_TOKEN_COUNTS = {}
+
+
+@lru_cache()
+def get_encoding(model: str) -> "tiktoken.Encoding":
+    """Tokenizer of a model, loaded once per model (tiktoken is imported on first use)."""
+    import tiktoken
+
+    return tiktoken.encoding_for_model(model)
+
+
 class OpenAIKeys(str):
     ROLE = "role"
     CONTENT = "content"
@@ -18,47 +43,197 @@ class OpenAIKeys(str):
 
 
 class ChatModel:
+    """Chat completion client meant to be created once and shared.
+
+    Requests are sent by a CompletionBackend (the OpenAI API, or the local
+    stub server for offline load tests) that keeps one keep-alive connection
+    pool, so requests reuse open connections instead of paying a new TCP/TLS
+    handshake each time. ChatModel adds the completion cache, coalescing of
+    identical requests in flight, retries and metrics on top, whatever the
+    backend.
 
-    def __init__(self):
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of open connections; extra requests wait for one.
+    timeout : float, optional
+        Total timeout of a request in seconds.
+    keepalive_timeout : float, optional
+        Seconds an idle connection is kept open for reuse.
+    cache : CompletionCache, optional
+        Cache of completions by request content, defaults to one built from
+        the COMPLETION_CACHE_* settings.
+    backend : CompletionBackend, optional
+        Backend sending the requests, defaults to the COMPLETION_BACKEND setting.
+    scheduler : CompletionScheduler, optional
+        Rate limiter shared by all requests, defaults to one with the
+        RATE_LIMIT_RPM and RATE_LIMIT_TPM budgets.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = None,
+        timeout: float = None,
+        keepalive_timeout: float = None,
+        cache: CompletionCache = None,
+        backend: CompletionBackend = None,
+        scheduler: CompletionScheduler = None,
+    ):
         settings = get_settings()
-        openai.api_key = settings.OPENAI_API_KEY
-        
+        self.backend = backend or create_backend(
+            pool_size=pool_size, timeout=timeout, keepalive_timeout=keepalive_timeout
+        )
+        self.scheduler = scheduler or CompletionScheduler(settings.RATE_LIMIT_RPM, settings.RATE_LIMIT_TPM)
+        self.max_rate_limit_wait = settings.RATE_LIMIT_MAX_WAIT
+        # Identical requests in flight, by completion key
+        self.in_flight = SingleFlight()
+        if cache is None and (settings.COMPLETION_CACHE_SIZE > 0 or settings.COMPLETION_CACHE_PATH):
+            cache = CompletionCache(
+                max_entries=settings.COMPLETION_CACHE_SIZE,
+                ttl=settings.COMPLETION_CACHE_TTL,
+                path=settings.COMPLETION_CACHE_PATH,
+            )
+        self.cache = cache
+
+    async def aclose(self) -> None:
+        """Closes the pooled connections."""
+        await self.backend.aclose()
+
     async def get_completion(
         self,
+        use_cache: bool = True,
         **kwargs,
     ) -> str:
         """Creates a new chat completion for the provided messages and parameters.
 
         See https://platform.openai.com/docs/api-reference/chat/create
-        for a list of valid parameters.
+        for a list of valid parameters. Identical requests are answered from
+        the completion cache unless `use_cache` is False.
 
         Returns
         -------
         str
             The chat completion response.
         """
-        
-        for attempt in range(MAX_RETRIES):
-            try:
-                chat_completion = await openai.ChatCompletion.acreate(**kwargs)
-                return chat_completion.choices[0].message[OpenAIKeys.CONTENT]
-
-            except RateLimitError:
-                if attempt < MAX_RETRIES - 1:  # If it's not the last attempt
-                    wait_time = 2 ** attempt + random.uniform(0, 1)  # Exponential backoff
-                    self.logger.warning(f"Rate limit hit! Retrying in {wait_time:.2f} seconds...")
-                    await asyncio.sleep(wait_time)  # Async sleep to wait before retrying
-                else:
-                    self.logger.error("Max retries exceeded for rate limits.")
-                    raise  # If max retries exceeded, raise the error
-            except (APIError, Timeout) as e:
-                self.logger.error(f"OpenAI API error: {e}")
-                raise  # Re-raise critical API errors
+        completion = await self.create_completion(use_cache=use_cache, **kwargs)
+        return completion.content
+
+    async def create_completion(
+        self,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> Completion:
+        """Same as `get_completion`, but also returns the token usage of the response.
+
+        Concurrent identical requests share one API call unless `use_cache`
+        is False; the callers that joined it get the completion without its
+        usage, so tokens and cost are counted once.
+        """
+        metrics = get_metrics()
+        request_key = completion_key(**kwargs) if use_cache and not kwargs.get("stream") else None
+        if self.cache is not None:
+            if request_key is not None:
+                cached = self.cache.get(request_key)
+                if cached is not None:
+                    metrics.counter(CACHE_REQUESTS, "Completion cache lookups.").inc(result="hit")
+                    return Completion(cached, prompt_tokens=0, completion_tokens=0, cached=True)
+                metrics.counter(CACHE_REQUESTS, "Completion cache lookups.").inc(result="miss")
+            else:
+                self.cache.record_bypass()
+                metrics.counter(CACHE_REQUESTS, "Completion cache lookups.").inc(result="bypass")
+
+        with metrics.time_stage("completion"):
+            if request_key is None:
+                return await self._send(None, **kwargs)
+            completion, coalesced = await self.in_flight.run(request_key, lambda: self._send(request_key, **kwargs))
+        if coalesced:
+            metrics.counter(COALESCED, "Calls that joined an identical call in flight.").inc(stage="completion")
+            return completion._replace(prompt_tokens=0, completion_tokens=0, coalesced=True)
+        return completion
+
+    async def _send(self, cache_key: Optional[str], **kwargs) -> Completion:
+        """Sends one request through the scheduler, retrying 429s and transient errors."""
+        metrics = get_metrics()
+        # Token estimate for the tokens-per-minute budget, settled with the usage
+        estimated_tokens = self.estimate_tokens(**kwargs) if self.scheduler.tokens else 0
+        deadline = time.monotonic() + self.max_rate_limit_wait
+        attempt = 0
+
+        try:
+            while True:
+                with metrics.time_stage("rate_limit_wait"):
+                    await self.scheduler.acquire(estimated_tokens)
+                try:
+                    completion = await self.backend.complete(**kwargs)
+                except RateLimitError as e:
+                    # Wait out the Retry-After, then back in the queue with the other senders
+                    wait_time = self.scheduler.on_rate_limited(retry_after(e))
+                    if time.monotonic() + wait_time > deadline:
+                        logging.error(f"Rate limited for more than {self.max_rate_limit_wait:.0f} seconds.")
+                        raise
+                    metrics.counter(RETRIES, "Completion retries by reason.").inc(reason="rate_limit")
+                    # The refused attempt used nothing, its tokens go back to the budget
+                    if self.scheduler.tokens and estimated_tokens:
+                        self.scheduler.tokens.refund(estimated_tokens)
+                    logging.warning(f"Rate limit hit! Retrying in {wait_time:.2f} seconds...")
+                    await asyncio.sleep(wait_time)
+                    continue
+                except (APIError, Timeout) as e:
+                    attempt += 1
+                    transient = isinstance(e, Timeout) or (e.http_status or 500) >= 500
+                    if not transient or attempt >= MAX_RETRIES:
+                        logging.error(f"OpenAI API error: {e}")
+                        raise  # Re-raise critical API errors
+                    reason = "timeout" if isinstance(e, Timeout) else "server_error"
+                    metrics.counter(RETRIES, "Completion retries by reason.").inc(reason=reason)
+                    wait_time = RETRY_BACKOFF * (2 ** (attempt - 1) + random.uniform(0, 1))  # Exponential backoff
+                    logging.warning(f"OpenAI API error: {e}. Retrying in {wait_time:.2f} seconds...")
+                    await asyncio.sleep(wait_time)
+                    continue
+
+                used_tokens = None
+                if completion.prompt_tokens is not None and completion.completion_tokens is not None:
+                    used_tokens = completion.prompt_tokens + completion.completion_tokens
+                self.scheduler.on_success(estimated_tokens, used_tokens)
+                if cache_key is not None and self.cache is not None:
+                    self.cache.set(cache_key, completion.content)
+                metrics.counter(COMPLETIONS, "Completions by outcome.").inc(outcome="ok")
+                return completion
+        except Exception:
+            metrics.counter(COMPLETIONS, "Completions by outcome.").inc(outcome="error")
+            raise
+
     @staticmethod
     def count_tokens(text: str, model="gpt-4-turbo-preview") -> int:
             """Counts tokens in a given text."""
-            enc = tiktoken.encoding_for_model(model)
-            return len(enc.encode(text))
+            return len(get_encoding(model).encode(text))
+
+    @staticmethod
+    def count_static_tokens(text: str, model="gpt-4-turbo-preview") -> int:
+            """Counts tokens of a prompt that repeats across messages, memoized by its hash."""
+            key = (model, prompt_hash(text))
+            count = STATIC_TOKEN_COUNTS.get(key)
+            if count is None:
+                count = STATIC_TOKEN_COUNTS[key] = ChatModel.count_tokens(text, model)
+            return count
+
+    @staticmethod
+    def count_tokens_batch(texts: Iterable[str], model="gpt-4-turbo-preview", num_threads: int = 8) -> List[int]:
+            """Counts tokens of many texts, encoding them in parallel threads."""
+            return [len(tokens) for tokens in get_encoding(model).encode_batch(list(texts), num_threads=num_threads)]
+
+    @staticmethod
+    def estimate_tokens(
+        messages: list, model="gpt-4-turbo-preview", max_tokens: int = None, **params
+    ) -> int:
+            """Tokens a request may use: its messages (system prompts memoized) plus the output budget."""
+            tokens = sum(
+                ChatModel.count_static_tokens(message[OpenAIKeys.CONTENT], model)
+                if message[OpenAIKeys.ROLE] == "system"
+                else ChatModel.count_tokens(message[OpenAIKeys.CONTENT], model)
+                for message in messages
+            )
+            return tokens + (max_tokens or EXPECTED_OUTPUT_TOKENS)
 
     @staticmethod
     def estimate_cost(input_tokens: int, output_tokens: int, model="gpt-4-turbo-preview") -> float:
@@ -68,13 +243,25 @@ class ChatModel:
             return input_cost + output_cost
 
 
-async def generate_message(user_prompt: str) -> str:
+@lru_cache()
+def get_chat_model() -> ChatModel:
+    """Shared ChatModel, so every message reuses the same connection pool."""
+    return ChatModel()
+
+
+def get_system_prompt() -> str:
+    """System prompt, served from the compiled prompt registry."""
+    return load_prompt("system_prompt.txt")
+
+
+async def generate_message(user_prompt: str, chat_model: ChatModel = None, use_cache: bool = True) -> str:
     """Calls OpenAI GPT model to generate a session message."""
-    chat_model = ChatModel()
+    chat_model = chat_model or get_chat_model()
     
-    system_prompt = load_prompt("system_prompt.txt")
+    system_prompt = get_system_prompt()
 
-    response = await chat_model.get_completion(
+    completion = await chat_model.create_completion(
+        use_cache=use_cache,
         temperature=0.7,
         model="gpt-4-turbo-preview",
         messages=[
@@ -82,18 +269,49 @@ async def generate_message(user_prompt: str) -> str:
             {OpenAIKeys.ROLE: "user", OpenAIKeys.CONTENT: user_prompt},
         ],
     )
-    group_tokens(response,system_prompt,user_prompt,chat_model)
-    return response
+    group_tokens(
+        completion.content,
+        system_prompt,
+        user_prompt,
+        chat_model,
+        prompt_tokens=completion.prompt_tokens,
+        completion_tokens=completion.completion_tokens,
+        model="gpt-4-turbo-preview",
+    )
+    return completion.content
+
 
+def group_tokens(
+    response: str,
+    system_prompt: str,
+    user_prompt: str,
+    chat_model: ChatModel,
+    prompt_tokens: int = None,
+    completion_tokens: int = None,
+    model: str = "gpt-4-turbo-preview",
+):
+    """Logs the tokens and estimated cost of a message and adds them to the metrics.
 
-def group_tokens(response: str,system_prompt: str,user_prompt: str, chat_model: ChatModel):
-    output_tokens = chat_model.count_tokens(response)
-    input_tokens = chat_model.count_tokens(system_prompt) + chat_model.count_tokens(user_prompt)
+    Uses the usage reported by the API when given, and only tokenizes what
+    is missing; the system prompt count is memoized.
+    """
+    metrics = get_metrics()
+    with metrics.time_stage("token_counting"):
+        input_tokens = prompt_tokens
+        if input_tokens is None:
+            input_tokens = chat_model.count_static_tokens(system_prompt, model)
+            input_tokens += chat_model.count_tokens(user_prompt, model)
+        output_tokens = completion_tokens
+        if output_tokens is None:
+            output_tokens = chat_model.count_tokens(response, model)
 
     # 8️⃣ Estimate cost
-    estimated_price = chat_model.estimate_cost(input_tokens, output_tokens)
+    estimated_price = chat_model.estimate_cost(input_tokens, output_tokens, model)
+    metrics.counter(TOKENS, "Tokens by direction.").inc(input_tokens, direction="input", model=model)
+    metrics.counter(TOKENS, "Tokens by direction.").inc(output_tokens, direction="output", model=model)
+    metrics.counter(COST, "Estimated cost in dollars, from PRICING.").inc(estimated_price, model=model)
     
-    logging.info(f"Input Tokens: {input_tokens}, Output Tokens: {output_tokens}")
-    logging.info(f"Estimated Cost: ${estimated_price:.6f}")
+    logging.info("Input Tokens: %d, Output Tokens: %d", input_tokens, output_tokens)
+    logging.info("Estimated Cost: $%.6f", estimated_price)
     
-    return
\ No newline at end of file
+    return input_tokens, output_tokens
\ No newline at end of file
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from message.config import DATA_DIR, QUERIES_DIR
+from message.data import FEATURES_QUERY, compute_features_py, open_query
+from message.engine import DuckDBSession, replace_file, sql_literal
+from message.incremental import MANIFEST_FILENAME
+
+FEATURES_PARALLEL_DIR = Path(DATA_DIR, "features_parallel")
+PARTITIONS_DIRNAME = "_partitions"
+PARTITION_COLUMN = "partition"
+
+
+def _source_files(source) -> list:
+    """Parquet files of a file, a directory (every .parquet file below it), a glob or a list."""
+    if isinstance(source, (list, tuple)):
+        return [Path(path) for path in source]
+    if Path(source).is_dir():
+        return sorted(Path(source).rglob("*.parquet"))
+    if any(char in str(source) for char in "*?["):
+        return sorted(Path("/").glob(str(Path(source).absolute()).lstrip("/")))
+    return [Path(source)]
+
+
+def partition_of(session_groups: pa.Array, n_partitions: int) -> np.ndarray:
+    """Hash partition of every session group, stable across processes and runs.
+
+    Null session groups all go to partition 0, so they aggregate into one group.
+    """
+    codes, uniques = pd.factorize(session_groups.to_numpy(zero_copy_only=False))
+    partitions = pd.util.hash_array(np.asarray(uniques, dtype=object)) % n_partitions
+    # factorize codes nulls as -1, which picks the appended partition 0
+    return np.append(partitions, 0)[codes]
+
+
+def _partition_row_groups(path: Path, row_groups: list, partitions_dir: Path, n_partitions: int, name: str) -> None:
+    """Splits some row groups of a source file into the hash partitions, in a worker process."""
+    table = pq.ParquetFile(path).read_row_groups(row_groups)
+    partitions = partition_of(table.column("session_group"), n_partitions)
+    order = np.argsort(partitions, kind="stable")
+    table = table.take(order)
+    bounds = np.searchsorted(partitions[order], np.arange(n_partitions + 1))
+    for partition in range(n_partitions):
+        start, stop = bounds[partition], bounds[partition + 1]
+        if start == stop:
+            continue
+        partition_dir = Path(partitions_dir, f"{PARTITION_COLUMN}={partition}")
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table.slice(start, stop - start), Path(partition_dir, f"{name}.parquet"))
+
+
+def partition_exercise_results(source, partitions_dir: Path, n_partitions: int, pool: ProcessPoolExecutor) -> list:
+    """Splits the exercise results into `n_partitions` directories by hash of `session_group`.
+
+    Every session group lands in exactly one partition, so partitions can be
+    aggregated independently. The split itself runs in the pool, one task per
+    source row group. Returns the directories of the non-empty partitions.
+    """
+    tasks = [
+        (path, [row_group], f"map-{i:05d}-{row_group:05d}")
+        for i, path in enumerate(_source_files(source))
+        for row_group in range(pq.ParquetFile(path).num_row_groups)
+    ]
+    list(
+        pool.map(
+            _partition_row_groups,
+            [path for path, _, _ in tasks],
+            [row_groups for _, row_groups, _ in tasks],
+            [partitions_dir] * len(tasks),
+            [n_partitions] * len(tasks),
+            [name for _, _, name in tasks],
+        )
+    )
+    return sorted(Path(partitions_dir).glob(f"{PARTITION_COLUMN}=*"))
+
+
+def _transform_partition(partition_dir: Path, output: Path, engine: str, query_filename: str) -> int:
+    """Aggregates one partition into one features file, in a worker process."""
+    files = sorted(str(path) for path in Path(partition_dir).glob("*.parquet"))
+    if engine == "py":
+        exercise_df = pd.read_parquet(files, partitioning=None)
+        features = compute_features_py(exercise_df)
+        replace_file(output, lambda path: features.to_parquet(path, index=False))
+        return len(features)
+
+    # One thread per worker, the processes provide the parallelism
+    with DuckDBSession(threads=1) as session:
+        session.execute(
+            f"CREATE VIEW exercise_results AS SELECT * FROM read_parquet({sql_literal(files)}, hive_partitioning = false)"
+        )
+        return session.copy_to_parquet(open_query(Path(QUERIES_DIR, query_filename)), output)
+
+
+def transform_features_parallel(
+    source=None,
+    dataset_dir: Path = FEATURES_PARALLEL_DIR,
+    workers: int = None,
+    n_partitions: int = None,
+    engine: str = "sql",
+    query_filename: str = FEATURES_QUERY,
+) -> int:
+    """Transforms exercise results into features with a pool of processes.
+
+    Every feature is computed per `session_group`, so the input is first
+    hash-partitioned on it; each partition is then aggregated in its own
+    process (own DuckDB connection, or the NumPy engine) into
+    `part-XXXXX.parquet`. The manifest maps every session group to its part.
+
+    Parameters
+    ----------
+    source : str, Path or list
+        Parquet file, directory, glob or list of files with the exercise results.
+    dataset_dir : Path
+        Directory of the features dataset; previous parts are replaced.
+    workers : int, optional
+        Number of worker processes, defaults to the number of cores.
+    n_partitions : int, optional
+        Number of hash partitions, defaults to 4 per worker so that
+        uneven partitions still keep every worker busy.
+    engine : str
+        "sql" (DuckDB) or "py" (compute_features_py).
+    query_filename : str
+        Features query for the sql engine.
+
+    Returns
+    -------
+    int
+        Number of session groups written.
+    """
+    source = source or Path(DATA_DIR, "exercise_results.parquet")
+    dataset_dir = Path(dataset_dir)
+    workers = workers or os.cpu_count()
+    n_partitions = n_partitions or 4 * workers
+
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    for old_part in dataset_dir.glob("part-*.parquet"):
+        old_part.unlink()
+    partitions_dir = Path(dataset_dir, PARTITIONS_DIRNAME)
+    shutil.rmtree(partitions_dir, ignore_errors=True)
+
+    # Spawned workers do not inherit DuckDB threads from this process
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        try:
+            # 1️⃣ Hash-partition the input on session_group
+            partition_dirs = partition_exercise_results(source, partitions_dir, n_partitions, pool)
+
+            # 2️⃣ Aggregate the partitions in parallel, one output part each
+            parts = [f"part-{i:05d}.parquet" for i in range(len(partition_dirs))]
+            n_groups = sum(
+                pool.map(
+                    _transform_partition,
+                    partition_dirs,
+                    [Path(dataset_dir, part) for part in parts],
+                    [engine] * len(parts),
+                    [query_filename] * len(parts),
+                )
+            )
+        finally:
+            shutil.rmtree(partitions_dir, ignore_errors=True)
+
+    # 3️⃣ Record where every group lives (nowhere for an empty input)
+    manifest = pd.concat(
+        [
+            pd.DataFrame({"session_group": pd.Series(dtype=object), "part": pd.Series(dtype=object)}),
+            *(
+                pd.read_parquet(Path(dataset_dir, part), columns=["session_group"]).assign(part=part)
+                for part in parts
+            ),
+        ],
+        ignore_index=True,
+    )
+    replace_file(Path(dataset_dir, MANIFEST_FILENAME), lambda path: manifest.to_parquet(path, index=False))
+
+    return n_groups
@@ -1,15 +1,183 @@
+import logging
 import os
+import threading
+import time
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from message.data import SESSION_CONTEXT_FIELDS
 
 PROMPT_DIR = os.path.join(os.path.dirname(__file__), "..", "prompts")
 
+# Fields each template may use; templates not listed get the session context
+TEMPLATE_FIELDS = {
+    "user_prompt.txt": [*SESSION_CONTEXT_FIELDS, "scenario_description"],
+}
+
+_formatter = Formatter()
+
+
+class CompiledPrompt:
+    """A prompt template pre-parsed with `string.Formatter`.
+
+    Rendering walks the parsed literal/field pieces instead of re-parsing the
+    raw text, and gives the same result as `text.format(**context)`.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self._parts = []
+        for literal, field_name, format_spec, conversion in _formatter.parse(text):
+            if field_name is not None and not field_name.isidentifier():
+                raise ValueError(f"{name}: only named fields are supported, got {{{field_name}}}")
+            if format_spec and "{" in format_spec:
+                raise ValueError(f"{name}: nested fields in format specs are not supported")
+            self._parts.append((literal, field_name, format_spec, conversion))
+        self.fields = frozenset(field for _, field, _, _ in self._parts if field is not None)
+
+    def render_columns(self, columns: Mapping[str, pa.Array]) -> pa.Array:
+        """Renders the template for every row of string columns at once.
+
+        Gives the same strings as `render` row by row. Fields with a
+        conversion or a format spec are not supported.
+        """
+        pieces = []
+        for literal, field_name, format_spec, conversion in self._parts:
+            if literal:
+                pieces.append(literal)
+            if field_name is not None:
+                if format_spec or conversion:
+                    raise ValueError(f"{self.name}: {{{field_name}}} cannot be rendered on columns")
+                pieces.append(columns[field_name])
+        return pc.binary_join_element_wise(*pieces, "")
+
+    def render(self, context: Mapping) -> str:
+        pieces = []
+        for literal, field_name, format_spec, conversion in self._parts:
+            pieces.append(literal)
+            if field_name is not None:
+                value = context[field_name]
+                if conversion:
+                    value = _formatter.convert_field(value, conversion)
+                pieces.append(format(value, format_spec))
+        return "".join(pieces)
+
+
+class PromptRegistry:
+    """Every template of the prompts directory, loaded and compiled once.
+
+    Templates are validated at load time: a field that is not available in
+    the session context raises a ValueError before any completion is sent.
+    Files are reloaded when their mtime changes, checked at most once every
+    `reload_interval` seconds; a reloaded template that fails validation is
+    logged and the previous version keeps being served.
+
+    Parameters
+    ----------
+    prompts_dir : str
+        Directory with the `.txt` templates.
+    template_fields : dict, optional
+        Allowed fields per template name, defaults to TEMPLATE_FIELDS.
+    default_fields : Iterable[str], optional
+        Allowed fields for templates not in `template_fields`.
+    auto_reload : bool
+        Reload templates whose file changed.
+    reload_interval : float
+        Minimum number of seconds between two mtime checks.
+    """
+
+    def __init__(
+        self,
+        prompts_dir: str = PROMPT_DIR,
+        template_fields: Optional[Dict[str, Iterable[str]]] = None,
+        default_fields: Optional[Iterable[str]] = None,
+        auto_reload: bool = True,
+        reload_interval: float = 1.0,
+    ):
+        self.prompts_dir = prompts_dir
+        self.template_fields = TEMPLATE_FIELDS if template_fields is None else template_fields
+        self.default_fields = SESSION_CONTEXT_FIELDS if default_fields is None else default_fields
+        self.auto_reload = auto_reload
+        self.reload_interval = reload_interval
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._load(strict=True)
+
+    def _compile(self, name: str, text: str) -> CompiledPrompt:
+        prompt = CompiledPrompt(name, text)
+        missing = prompt.fields - set(self.template_fields.get(name, self.default_fields))
+        if missing:
+            raise ValueError(f"{name} uses fields missing from the session context: {sorted(missing)}")
+        return prompt
+
+    def _load(self, strict: bool) -> None:
+        with self._lock:
+            prompts = dict(self._prompts)
+            mtimes = dict(self._mtimes)
+            for entry in os.scandir(self.prompts_dir):
+                if not entry.name.endswith(".txt"):
+                    continue
+                mtime = entry.stat().st_mtime_ns
+                if mtimes.get(entry.name) == mtime:
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                try:
+                    prompts[entry.name] = self._compile(entry.name, text)
+                except ValueError:
+                    if strict:
+                        raise
+                    logging.exception(f"Keeping the previous version of {entry.name}")
+                mtimes[entry.name] = mtime
+
+            self._prompts = prompts
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+
+    def reload(self) -> None:
+        """Re-reads templates whose file changed since they were loaded."""
+        self._load(strict=False)
+
+    def _maybe_reload(self) -> None:
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(self._prompts)
+
+    def get(self, name: str) -> CompiledPrompt:
+        if self.auto_reload:
+            self._maybe_reload()
+        return self._prompts[name]
+
+    def render(self, name: str, context: Mapping) -> str:
+        return self.get(name).render(context)
+
+
+@lru_cache()
+def get_prompt_registry() -> PromptRegistry:
+    """Shared registry over the prompts directory."""
+    return PromptRegistry()
+
+
 def load_prompt(file_name: str) -> str:
     """Loads a prompt file from the prompts directory."""
-    file_path = os.path.join(PROMPT_DIR, file_name)
-    with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return get_prompt_registry().get(file_name).text
 
-def get_scenario_prompt(session_context: dict) -> str:
+def get_scenario_prompt(session_context: Mapping) -> str:
     """Loads and formats the appropriate scenario template."""
     file_name = "scenario_nok.txt" if session_context["session_is_nok"] == True else "scenario_ok.txt"
-    template = load_prompt(file_name)
-    return template.format(**session_context)
+    return get_prompt_registry().render(file_name, session_context)
+
+
+def build_user_prompt(session_context: Mapping) -> str:
+    """Adds the scenario description to the context and formats the user prompt."""
+    session_context["scenario_description"] = get_scenario_prompt(session_context)
+    return get_prompt_registry().render("user_prompt.txt", session_context)
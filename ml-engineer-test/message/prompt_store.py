@@ -0,0 +1,218 @@
+import json
+import math
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from message.cache import prompt_hash
+from message.config import DATA_DIR
+from message.context import RENDER_CHUNK_SIZE, render_user_prompts
+from message.feature_store import FEATURES_COMPRESSION, FEATURES_PATH, FeatureStore, write_features
+from message.model import EXPECTED_OUTPUT_TOKENS, ChatModel
+from message.prompt_manager import PromptRegistry, get_prompt_registry
+
+PROMPTS_PATH = Path(DATA_DIR, "prompts.parquet")
+PROMPTS_MODEL = "gpt-4-turbo-preview"
+
+# Templates a pre-rendered prompt depends on; editing any of them makes the prompts file stale
+PROMPT_TEMPLATES = ("system_prompt.txt", "scenario_ok.txt", "scenario_nok.txt", "user_prompt.txt")
+# Seconds between two staleness checks of the prompts file by lookup_prompt
+PROMPTS_CHECK_INTERVAL = 1.0
+# Version of the value formatting of rendered prompts; prompts files of another
+# version are stale (2: every null renders as NULL_TEXT, like the records)
+PROMPTS_FORMAT_VERSION = 2
+# Schema metadata key of the render summary
+SUMMARY_KEY = b"message.prompts"
+
+PROMPTS_SCHEMA = pa.schema(
+    [
+        ("session_group", pa.string()),
+        ("prompt_hash", pa.string()),
+        ("user_prompt", pa.string()),
+        ("prompt_tokens", pa.int64()),
+        ("duplicate", pa.bool_()),
+    ]
+)
+
+
+def templates_hash(registry: Optional[PromptRegistry] = None) -> str:
+    """Hash of the templates the prompts are rendered from."""
+    registry = registry or get_prompt_registry()
+    return prompt_hash("\n".join(f"{name}\n{registry.get(name).text}" for name in PROMPT_TEMPLATES))
+
+
+def render_prompt_table(
+    features: pa.Table,
+    registry: Optional[PromptRegistry] = None,
+    model: str = PROMPTS_MODEL,
+    chunk_size: int = RENDER_CHUNK_SIZE,
+) -> pa.Table:
+    """Renders the user prompt of every session of a features table.
+
+    Prompts are rendered column-wise per chunk (render_user_prompts), then
+    deduplicated by hash: only the first session with a given prompt has
+    `duplicate` False, and each distinct prompt is tokenized once.
+
+    Returns
+    -------
+    pa.Table
+        One row per session with its session_group, the hash, text and
+        token count of its user prompt, and the `duplicate` flag
+        (PROMPTS_SCHEMA).
+    """
+    prompts = []
+    for batch in features.to_batches(max_chunksize=chunk_size):
+        prompts.extend(render_user_prompts(batch, registry))
+    hashes = [prompt_hash(prompt) for prompt in prompts]
+
+    # ✅ First occurrence of every distinct prompt
+    first = {}
+    for offset, hash_ in enumerate(hashes):
+        first.setdefault(hash_, offset)
+    unique_tokens = ChatModel.count_tokens_batch([prompts[offset] for offset in first.values()], model)
+    tokens = dict(zip(first, unique_tokens))
+
+    return pa.table(
+        {
+            "session_group": features.column("session_group"),
+            "prompt_hash": hashes,
+            "user_prompt": prompts,
+            "prompt_tokens": [tokens[hash_] for hash_ in hashes],
+            "duplicate": [first[hash_] != offset for offset, hash_ in enumerate(hashes)],
+        },
+        schema=PROMPTS_SCHEMA,
+    )
+
+
+def summarize_prompts(prompts: pa.Table, model: str = PROMPTS_MODEL) -> Dict:
+    """What sending every prompt would cost, with and without deduplication.
+
+    Input tokens add the system prompt to every user prompt; the cost adds
+    EXPECTED_OUTPUT_TOKENS per completion. Deduplicated figures count each
+    distinct prompt once, which is what the completion cache and coalescing
+    actually send.
+    """
+    system_tokens = ChatModel.count_static_tokens(get_prompt_registry().get("system_prompt.txt").text, model)
+    sessions = prompts.num_rows
+    unique = prompts.filter(pc.invert(prompts.column("duplicate")))
+    input_tokens = pc.sum(prompts.column("prompt_tokens")).as_py() or 0
+    unique_input_tokens = pc.sum(unique.column("prompt_tokens")).as_py() or 0
+
+    return {
+        "model": model,
+        "sessions": sessions,
+        "unique_prompts": unique.num_rows,
+        "dedup_ratio": 1 - unique.num_rows / sessions if sessions else 0.0,
+        "input_tokens": input_tokens + system_tokens * sessions,
+        "unique_input_tokens": unique_input_tokens + system_tokens * unique.num_rows,
+        "estimated_cost": ChatModel.estimate_cost(
+            input_tokens + system_tokens * sessions, EXPECTED_OUTPUT_TOKENS * sessions, model
+        ),
+        "unique_estimated_cost": ChatModel.estimate_cost(
+            unique_input_tokens + system_tokens * unique.num_rows, EXPECTED_OUTPUT_TOKENS * unique.num_rows, model
+        ),
+    }
+
+
+def render_prompts_file(
+    features_path: Path = FEATURES_PATH,
+    output: Path = PROMPTS_PATH,
+    model: str = PROMPTS_MODEL,
+    compression: str = FEATURES_COMPRESSION,
+) -> Dict:
+    """Renders the prompts of every session of a features file into a prompts parquet.
+
+    The file has the layout of the features file (write_features): sorted by
+    session_group, with row group statistics for point reads, and the
+    repeated prompt texts dictionary-encoded. Its schema metadata holds the
+    summary (summarize_prompts) together with the format version, the hash
+    of the templates and the mtime of the features file, so `prompts_are_current` can tell when
+    it is stale.
+
+    Returns
+    -------
+    dict
+        The summary: sessions, distinct prompts, dedup ratio, input tokens
+        and estimated cost, with and without deduplication.
+    """
+    features_path = Path(features_path).resolve()
+    features_mtime = os.stat(features_path).st_mtime_ns
+    prompts = render_prompt_table(pq.read_table(features_path, memory_map=True), model=model)
+
+    summary = summarize_prompts(prompts, model)
+    summary.update(
+        format_version=PROMPTS_FORMAT_VERSION,
+        templates_hash=templates_hash(),
+        features_path=str(features_path),
+        features_mtime_ns=features_mtime,
+    )
+    write_features(prompts, output, compression=compression, metadata={SUMMARY_KEY: json.dumps(summary)})
+    return summary
+
+
+def read_prompts_summary(path: Path = PROMPTS_PATH) -> Optional[Dict]:
+    """Summary stored by render_prompts_file, or None when there is no prompts file."""
+    if not Path(path).exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata[SUMMARY_KEY]) if SUMMARY_KEY in metadata else None
+
+
+@lru_cache(maxsize=8)
+def _summary_at(path: str, mtime_ns: int) -> Optional[Dict]:
+    return read_prompts_summary(path)
+
+
+def prompts_are_current(path: Optional[Path] = None, features_path: Optional[Path] = None) -> bool:
+    """Whether a prompts file exists and was rendered from the current features and templates,
+    with the current PROMPTS_FORMAT_VERSION.
+
+    Defaults to the prompts file get_message serves (PROMPTS_PATH) and the
+    features file of the shared FeatureStore (FEATURES_PATH).
+    """
+    path = path or PROMPTS_PATH
+    features_path = features_path or FEATURES_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        features_mtime = os.stat(features_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    summary = _summary_at(str(path), mtime)
+    return (
+        summary is not None
+        and summary["features_path"] == str(Path(features_path).resolve())
+        and summary["features_mtime_ns"] == features_mtime
+        and summary.get("format_version") == PROMPTS_FORMAT_VERSION
+        and summary["templates_hash"] == templates_hash()
+    )
+
+
+# Time and result of the last prompts_are_current check of lookup_prompt
+_last_check = {"at": -math.inf, "current": False}
+
+
+@lru_cache()
+def get_prompt_store() -> FeatureStore:
+    """Shared store over the default prompts file, lazy like the feature store."""
+    return FeatureStore(PROMPTS_PATH, lazy=True)
+
+
+def lookup_prompt(session_group: str) -> Optional[str]:
+    """Pre-rendered user prompt of a session group.
+
+    None when the prompts file is missing or stale, or does not have the
+    session; callers then render the prompt from the features. Staleness is
+    checked at most once every PROMPTS_CHECK_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    if now - _last_check["at"] >= PROMPTS_CHECK_INTERVAL:
+        _last_check.update(at=now, current=prompts_are_current())
+    if not _last_check["current"]:
+        return None
+    record = get_prompt_store().get(session_group)
+    return record["user_prompt"] if record is not None else None
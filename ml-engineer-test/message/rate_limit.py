@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `rate_per_minute`.
+
+    `acquire` waits until the requested amount is available, so callers
+    sharing a bucket are held to the rate together. Waiters are served in
+    arrival order.
+
+    Parameters
+    ----------
+    rate_per_minute : float
+        Tokens added to the bucket per minute.
+    capacity : float
+        Maximum burst size, defaults to one minute worth of tokens.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Waits until `amount` tokens are available and takes them."""
+        # A request larger than the bucket could never be served otherwise
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def set_rate(self, rate_per_minute: float) -> None:
+        """Changes the refill rate, keeping the tokens accumulated so far."""
+        self._refill()
+        self.rate = rate_per_minute / 60.0
+
+    def refund(self, amount: float) -> None:
+        """Returns unused tokens, or takes more when `amount` is negative."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait from the Retry-After (or retry-after-ms) header of a 429, if any."""
+    headers = {name.lower(): value for name, value in (getattr(error, "headers", None) or {}).items()}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class CompletionScheduler:
+    """Admission control shared by every completion of a ChatModel.
+
+    Requests wait in arrival order for the requests-per-minute and
+    tokens-per-minute budgets (token counts are estimated before sending
+    and corrected with the usage of the response), so concurrent callers
+    are paced together instead of each backing off on its own.
+
+    The first 429 of a `window` pauses every sender for its Retry-After
+    and clamps the request rate to what the provider accepted over the
+    last `window` seconds, which is where throughput settles when the limit
+    is unknown or lower than configured. The clamp keeps at least
+    `decrease` of the recent send rate, so a 429 before there is a full
+    window of answers cannot throttle far below the limit, and repeated
+    clamps step down until the provider stops refusing. Further 429s in
+    the same window only delay their own request, so a burst of 429s (or
+    the odd one out) is one signal rather than a pause that never ends.
+    After a clamp the rate probes upwards by `probe` per second, up to the
+    configured limit.
+
+    Parameters
+    ----------
+    requests_per_minute : float, optional
+        Request budget, unlimited until the provider answers 429.
+    tokens_per_minute : float, optional
+        Token budget (prompt estimate plus expected output).
+    window : float
+        Seconds of accepted requests the rate is clamped to after a 429.
+    decrease : float
+        Share of the send rate over the window kept at least by a clamp.
+    backoff : float
+        Pause after a 429 without a Retry-After header, in seconds.
+    probe : float
+        Relative increase of the request rate per second after a clamp.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        window: float = 10.0,
+        decrease: float = 0.9,
+        backoff: float = 1.0,
+        probe: float = 0.01,
+    ):
+        self.window = window
+        self.decrease = decrease
+        self.backoff = backoff
+        self.probe = probe
+        self.requests_per_minute = None
+        self.tokens_per_minute = None
+        self.requests = None
+        self.tokens = None
+        self.set_limits(requests_per_minute, tokens_per_minute)
+        self._paused_until = 0.0
+        self._paused_at = None
+        self._started = None
+        self._sent = deque()
+        self._accepted = deque()
+        self._clamped_at = None
+        self._probed_at = None
+        self.stats = {"rate_limited": 0, "clamps": 0}
+
+    def set_limits(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        """Sets the request and token budgets per minute (None for no limit)."""
+        self.requests_per_minute = requests_per_minute
+        # One second of request burst: a full minute would flood the provider
+        self.requests = (
+            TokenBucket(requests_per_minute, capacity=max(1.0, requests_per_minute / 60))
+            if requests_per_minute
+            else None
+        )
+        self.set_token_limit(tokens_per_minute)
+
+    def set_token_limit(self, tokens_per_minute: Optional[float] = None) -> None:
+        """Sets the token budget per minute (None for no limit), keeping the request rate and its clamp."""
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @contextmanager
+    def token_limit(self, tokens_per_minute: Optional[float]):
+        """Applies a token budget per minute inside the block, then restores the previous one."""
+        previous = self.tokens_per_minute, self.tokens
+        self.set_token_limit(tokens_per_minute)
+        try:
+            yield self
+        finally:
+            self.tokens_per_minute, self.tokens = previous
+
+    @property
+    def request_rate(self) -> Optional[float]:
+        """Requests per minute currently allowed, None when unlimited."""
+        return self.requests.rate * 60 if self.requests else None
+
+    async def acquire(self, tokens: float = 0) -> None:
+        """Waits for a pause to end and for the request and token budgets."""
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            await asyncio.sleep(pause)
+        if self.requests:
+            await self.requests.acquire(1)
+        if self.tokens and tokens:
+            await self.tokens.acquire(tokens)
+        now = time.monotonic()
+        self._sent.append(now)
+        if self._started is None:
+            self._started = now
+
+    def _per_minute(self, events: deque, now: float) -> float:
+        """Rate of `events` over the last window (or since the first send)."""
+        while events and events[0] < now - self.window:
+            events.popleft()
+        span = min(self.window, now - self._started) if self._started is not None else 0.0
+        return len(events) * 60 / span if span > 0 else 0.0
+
+    def on_success(self, estimated_tokens: float = 0, used_tokens: Optional[float] = None) -> None:
+        """Records an accepted request and settles its token estimate with the actual usage."""
+        now = time.monotonic()
+        self._accepted.append(now)
+        if self.tokens and used_tokens is not None:
+            self.tokens.refund(estimated_tokens - used_tokens)
+
+        # Probe back up towards the configured limit, or without bound if unknown
+        if self._clamped_at is not None and self.requests:
+            rate = self.request_rate * (1 + self.probe) ** (now - self._probed_at)
+            if self.requests_per_minute and rate >= self.requests_per_minute:
+                rate = self.requests_per_minute
+                self._clamped_at = None
+            self.requests.set_rate(rate)
+            self._probed_at = now
+
+    def on_rate_limited(self, wait: Optional[float] = None) -> float:
+        """Records a 429, pausing every sender and lowering the request rate at most
+        once per window; returns how long the rate limited request should wait."""
+        now = time.monotonic()
+        self.stats["rate_limited"] += 1
+        wait = self.backoff if wait is None else wait
+
+        if self._paused_at is None or now - self._paused_at >= self.window:
+            self._paused_at = now
+            self._paused_until = max(self._paused_until, now + wait)
+            sent = self._per_minute(self._sent, now)
+            if sent:
+                # At least one request per window, so the rate never stalls
+                rate = max(self._per_minute(self._accepted, now), self.decrease * sent, 60 / self.window)
+                if self.requests is None:
+                    self.requests = TokenBucket(rate, capacity=max(1.0, rate / 60))
+                self.requests.set_rate(min(rate, self.request_rate))
+                self._clamped_at = self._probed_at = now
+                self.stats["clamps"] += 1
+        return wait
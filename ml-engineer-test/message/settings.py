@@ -0,0 +1,31 @@
+from typing import Optional
+
+from pydantic_settings import BaseSettings
+from message.config import BASE_DIR
+
+
+class Settings(BaseSettings):
+    OPENAI_API_KEY: str
+    # Point the client at another OpenAI-compatible endpoint, e.g. the local stub server
+    OPENAI_API_BASE: Optional[str] = None
+    # Completion backend: "openai" (openai client) or "stub" (plain HTTP client
+    # of `message stub-server`, at OPENAI_API_BASE or http://127.0.0.1:8089/v1)
+    COMPLETION_BACKEND: str = "openai"
+    # HTTP client shared by all completions: max open connections, request timeout (s)
+    # and how long idle keep-alive connections are kept (s)
+    OPENAI_POOL_SIZE: int = 64
+    OPENAI_TIMEOUT: float = 60.0
+    OPENAI_KEEPALIVE_TIMEOUT: float = 30.0
+    # Rate limits shared by all completions: requests and tokens per minute (None for
+    # no limit until the API answers 429) and the longest a request waits on 429s (s)
+    RATE_LIMIT_RPM: Optional[int] = None
+    RATE_LIMIT_TPM: Optional[int] = None
+    RATE_LIMIT_MAX_WAIT: float = 300.0
+    # Completion cache: in-memory LRU entries (0 disables), entry TTL (s)
+    # and an optional SQLite file for the on-disk tier
+    COMPLETION_CACHE_SIZE: int = 10_000
+    COMPLETION_CACHE_TTL: Optional[float] = 24 * 60 * 60
+    COMPLETION_CACHE_PATH: Optional[str] = None
+
+    class Config:
+        env_file = f"{BASE_DIR}/.env"
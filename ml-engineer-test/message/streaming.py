@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from message.config import DATA_DIR, QUERIES_DIR, STREAMING_MEMORY_LIMIT, STREAMING_TEMP_DIR  # noqa
+from message.data import FEATURES_QUERY, open_query
+from message.engine import DuckDBSession
+from message.feature_store import FEATURES_PATH
+
+
+def transform_features_streaming(
+    source=None,
+    output: Path = None,
+    query_filename: str = FEATURES_QUERY,
+    memory_limit: str = STREAMING_MEMORY_LIMIT,
+    temp_directory: Path = STREAMING_TEMP_DIR,
+    threads: int = None,
+) -> int:
+    """Transforms exercise results into features without loading them in memory.
+
+    DuckDB scans the parquet input directly, reading only the columns the
+    query needs, and writes the features with `COPY ... TO`, so no pandas
+    frame is built on either side. Aggregation state above `memory_limit`
+    spills to `temp_directory`, which makes inputs larger than RAM possible.
+
+    Parameters
+    ----------
+    source : str, Path or list
+        Parquet file, directory, glob or list of files with the exercise results.
+    output : Path
+        Features parquet file to write, FEATURES_PATH by default.
+    query_filename : str
+        Features query. FEATURES_SINGLE_PASS_QUERY reads the input once,
+        features.sql scans it once per feature CTE.
+    memory_limit : str
+        DuckDB memory limit, e.g. "2GB".
+    temp_directory : Path
+        Directory DuckDB spills to once the memory limit is reached.
+    threads : int, optional
+        Number of DuckDB threads, defaults to all cores.
+
+    Returns
+    -------
+    int
+        Number of session groups written.
+    """
+    source = source or Path(DATA_DIR, "exercise_results.parquet")
+    output = Path(output or FEATURES_PATH)
+
+    # Without insertion order DuckDB streams the output instead of buffering it
+    with DuckDBSession(
+        threads=threads, memory_limit=memory_limit, temp_directory=temp_directory, preserve_insertion_order=False
+    ) as session:
+        # The view is inlined into the query, so projections reach the parquet scan
+        session.create_parquet_view("exercise_results", source)
+        return session.copy_to_parquet(open_query(Path(QUERIES_DIR, query_filename)), output)
@@ -0,0 +1,186 @@
+import asyncio
+import math
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from aiohttp import web
+
+STUB_CONTENT = (
+    "Great job finishing your session today! 🌟\n\n"
+    "Keep that consistency going, every session builds on the last.\n\n"
+    "How do you feel about your session today?"
+)
+
+# Counters of a stub app: app[STATS]["requests"], ["rate_limited"] and ["connections"]
+STATS = web.AppKey("stats", dict)
+
+LATENCY_DISTRIBUTIONS = ("constant", "exponential", "lognormal")
+
+
+def sample_latency(rng: random.Random, latency: float, distribution: str = "constant", sigma: float = 0.5) -> float:
+    """Seconds one completion takes: `latency` is the mean of the constant and
+    exponential distributions and the median of the lognormal one."""
+    if not latency:
+        return 0.0
+    if distribution == "constant":
+        return latency
+    if distribution == "exponential":
+        return rng.expovariate(1 / latency)
+    if distribution == "lognormal":
+        return rng.lognormvariate(math.log(latency), sigma)
+    raise ValueError(f"Unknown latency distribution: {distribution} (use one of {LATENCY_DISTRIBUTIONS})")
+
+
+class _RequestLimit:
+    """Requests per minute allowed by the stub, refilled continuously with
+    one second of burst, like a provider's RPM limit."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def try_acquire(self) -> Optional[float]:
+        """Takes one request, or returns the seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self.rate
+
+
+def _rate_limited(retry_after: float) -> web.Response:
+    return web.json_response(
+        {
+            "error": {
+                "message": "Rate limit reached for requests (stub).",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }
+        },
+        status=429,
+        headers={"Retry-After": f"{retry_after:.3f}"},
+    )
+
+
+def create_app(
+    latency: float = 0.0,
+    content: str = STUB_CONTENT,
+    latency_distribution: str = "constant",
+    latency_sigma: float = 0.5,
+    rate_limit_probability: float = 0.0,
+    rate_limit_rpm: Optional[float] = None,
+    retry_after: float = 1.0,
+    seed: Optional[int] = None,
+) -> web.Application:
+    """Creates an aiohttp app that mimics the OpenAI chat completions endpoint.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds to wait before answering each request (mean, or median for
+        the lognormal distribution).
+    content : str
+        Message returned by every completion.
+    latency_distribution : str
+        "constant", "exponential" or "lognormal".
+    latency_sigma : float
+        Shape of the lognormal distribution; larger values give a longer tail.
+    rate_limit_probability : float
+        Share of requests answered with a 429, at random.
+    rate_limit_rpm : float, optional
+        Requests per minute served, requests above it get a 429 whose
+        Retry-After says when the next one is allowed.
+    retry_after : float
+        Retry-After seconds of the random 429s.
+    seed : int, optional
+        Seed of the latency and 429 draws.
+
+    Returns
+    -------
+    web.Application
+        The stub application, serving POST /v1/chat/completions.
+    """
+    if latency_distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {latency_distribution} (use one of {LATENCY_DISTRIBUTIONS})")
+    rng = random.Random(seed)
+    limit = _RequestLimit(rate_limit_rpm) if rate_limit_rpm else None
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        stats = request.app[STATS]
+        stats["requests"] += 1
+        stats["peers"].add(request.transport.get_extra_info("peername"))
+        stats["connections"] = len(stats["peers"])
+
+        wait = limit.try_acquire() if limit else None
+        if wait is None and rate_limit_probability and rng.random() < rate_limit_probability:
+            wait = retry_after
+        if wait is not None:
+            stats["rate_limited"] += 1
+            return _rate_limited(wait)
+
+        delay = sample_latency(rng, latency, latency_distribution, latency_sigma)
+        if delay:
+            await asyncio.sleep(delay)
+
+        # Rough usage, ~4 characters per token
+        prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    app = web.Application()
+    app[STATS] = {"requests": 0, "rate_limited": 0, "connections": 0, "peers": set()}
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+@asynccontextmanager
+async def running_stub_server(host: str = "127.0.0.1", port: int = 0, stats: dict = None, **kwargs):
+    """Serves the stub on the running event loop and yields its API base URL.
+
+    Port 0 picks a free port. Pass a dict as `stats` to read the counters.
+    """
+    app = create_app(**kwargs)
+    if stats is not None:
+        stats.update(app[STATS])
+        app[STATS] = stats
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        await runner.cleanup()
+
+
+def run_stub_server(host: str = "127.0.0.1", port: int = 8089, **kwargs) -> None:
+    """Runs the stub server until interrupted."""
+    web.run_app(create_app(**kwargs), host=host, port=port)
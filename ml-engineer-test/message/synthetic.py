@@ -0,0 +1,175 @@
+from typing import List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from message.data import LEAVE_EXERCISE_REASONS, QUALITY_REASON_COLUMNS
+
+THERAPY_NAMES = [
+    "low_back",
+    "shoulder",
+    "knee",
+    "hip",
+    "neck",
+    "ankle",
+    "wrist_hand",
+    "elbow",
+]
+
+EXERCISE_NAMES = [
+    "bridge",
+    "squat",
+    "lunges",
+    "hip_hyperextension",
+    "shoulder_abduction",
+    "prayer_position_stretch",
+    "wris_prono_supination",
+    "knee_extension",
+    "heel_raise",
+    "cat_camel",
+    "neck_rotation",
+    "elbow_flexion",
+]
+
+LEAVE_SESSION_REASONS = ["other", "system_problem", "pain", "tired"]
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    """Probabilities of `n` ranks proportional to 1 / rank**skew (uniform for skew 0)."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def _draw(rng: np.random.Generator, values, size: int, weights=None) -> np.ndarray:
+    """Draws `size` values, uniformly or with the given probabilities."""
+    values = np.array(values, dtype=object)
+    if weights is None:
+        return values[rng.integers(0, len(values), size)]
+    return values[rng.choice(len(values), size, p=weights)]
+
+
+def _reason_weights(reasons: Optional[Mapping[str, float]], default: List[str]):
+    """Reason names and probabilities from a weights mapping, uniform over `default` when None."""
+    if reasons is None:
+        return default, None
+    weights = np.asarray(list(reasons.values()), dtype=float)
+    return list(reasons), weights / weights.sum()
+
+
+def _session_sizes(rng: np.random.Generator, n_sessions: int, exercises_per_session: int, skew: float) -> np.ndarray:
+    """Exercise rows per session: all equal, or Zipf-skewed with the same total."""
+    if not skew:
+        return np.full(n_sessions, exercises_per_session)
+    total = n_sessions * exercises_per_session
+    # At least one row per session, the rest spread by a shuffled Zipf law
+    weights = rng.permutation(zipf_weights(n_sessions, skew))
+    return 1 + rng.multinomial(total - n_sessions, weights)
+
+
+def generate_exercise_results(
+    n_sessions: int = 1_000,
+    exercises_per_session: int = 15,
+    leave_exercise_rate: float = 0.05,
+    seed: int = 0,
+    leave_exercise_reasons: Optional[Mapping[str, float]] = None,
+    leave_session_rate: float = 0.02,
+    leave_session_reasons: Optional[Mapping[str, float]] = None,
+    nok_rate: float = 0.1,
+    skew: float = 0.0,
+) -> pd.DataFrame:
+    """Generates a synthetic `exercise_results` frame with the raw schema.
+
+    The output has `n_sessions * exercises_per_session` rows. Without skew
+    every session gets exactly `exercises_per_session` rows and exercises
+    are drawn uniformly; with `skew` > 0 session sizes, patients, therapies
+    and exercise names follow a Zipf law of that exponent, so a few
+    sessions are much longer than the rest and a few exercises dominate,
+    as hot keys do in production data.
+
+    Parameters
+    ----------
+    n_sessions : int
+        Number of distinct session groups.
+    exercises_per_session : int
+        Number of exercise rows per session (the mean when skewed).
+    leave_exercise_rate : float
+        Probability that an exercise row was left early.
+    seed : int
+        Seed for the random generator.
+    leave_exercise_reasons : Mapping[str, float], optional
+        Relative weights of the reasons for leaving an exercise, uniform
+        over LEAVE_EXERCISE_REASONS by default.
+    leave_session_rate : float
+        Probability that a session was left early.
+    leave_session_reasons : Mapping[str, float], optional
+        Relative weights of the reasons for leaving a session, uniform over
+        LEAVE_SESSION_REASONS by default.
+    nok_rate : float
+        Probability that a session is NOK.
+    skew : float
+        Zipf exponent of session sizes, patients, therapies and exercise
+        names, 0 for uniform.
+
+    Returns
+    -------
+    pd.DataFrame
+        The synthetic exercise results.
+    """
+    rng = np.random.default_rng(seed)
+    exercise_reasons, exercise_reason_weights = _reason_weights(leave_exercise_reasons, LEAVE_EXERCISE_REASONS)
+    session_reasons, session_reason_weights = _reason_weights(leave_session_reasons, LEAVE_SESSION_REASONS)
+
+    sessions = np.arange(n_sessions)
+    sizes = _session_sizes(rng, n_sessions, exercises_per_session, skew)
+    session_of_row = np.repeat(sessions, sizes)
+    n_rows = session_of_row.size
+
+    # Session-level attributes, broadcast to every exercise row
+    n_patients = max(n_sessions // 10, 1)
+    if skew:
+        patients = rng.choice(n_patients, n_sessions, p=zipf_weights(n_patients, skew))
+    else:
+        patients = rng.integers(0, n_patients, n_sessions)
+    session_attrs = {
+        "session_group": np.char.add("sg_", sessions.astype(str)).astype(object),
+        "patient_id": np.char.add("p_", patients.astype(str)).astype(object),
+        "patient_name": np.char.add("Patient ", patients.astype(str)).astype(object),
+        "patient_age": rng.integers(18, 90, n_sessions),
+        "pain": rng.integers(0, 11, n_sessions).astype(float),
+        "fatigue": rng.integers(0, 11, n_sessions).astype(float),
+        "therapy_name": _draw(
+            rng, THERAPY_NAMES, n_sessions, zipf_weights(len(THERAPY_NAMES), skew) if skew else None
+        ),
+        "session_number": rng.integers(1, 200, n_sessions),
+        "leave_session": np.where(
+            rng.random(n_sessions) < leave_session_rate,
+            _draw(rng, session_reasons, n_sessions, session_reason_weights),
+            None,
+        ),
+        "quality": rng.integers(1, 6, n_sessions).astype(float),
+        "session_is_nok": rng.random(n_sessions) < nok_rate,
+    }
+    for reason in QUALITY_REASON_COLUMNS:
+        session_attrs[reason] = (rng.random(n_sessions) < 0.1).astype(np.int64)
+
+    data = {name: values[session_of_row] for name, values in session_attrs.items()}
+
+    # Exercise-level attributes
+    prescribed = rng.integers(5, 20, n_rows)
+    correct = rng.integers(0, prescribed + 1)
+    data["prescribed_repeats"] = prescribed
+    data["leave_exercise"] = np.where(
+        rng.random(n_rows) < leave_exercise_rate,
+        _draw(rng, exercise_reasons, n_rows, exercise_reason_weights),
+        None,
+    )
+    data["training_time"] = rng.integers(10, 120, n_rows)
+    data["correct_repeats"] = correct
+    data["session_exercise_result_id"] = np.arange(n_rows)
+    data["exercise_name"] = _draw(
+        rng, EXERCISE_NAMES, n_rows, zipf_weights(len(EXERCISE_NAMES), skew) if skew else None
+    )
+    data["wrong_repeats"] = prescribed - correct
+    # 1, 2, ... within each session
+    data["exercise_order"] = np.arange(n_rows) - np.repeat(np.cumsum(sizes) - sizes, sizes) + 1
+
+    return pd.DataFrame(data)
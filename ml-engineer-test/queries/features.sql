@@ -88,26 +88,16 @@ incorrect_counts AS (
     GROUP BY session_group, exercise_name
 ),
 
-ranked_exercises AS (
-    SELECT
-        session_group,
-        exercise_name,
-        total_wrong_repeats,
-        ROW_NUMBER() OVER (
-            PARTITION BY session_group
-            ORDER BY total_wrong_repeats DESC, RANDOM() -- Ensures a random selection for ties
-        ) AS rank_incorrect
-    FROM incorrect_counts
-),
-
 exercise_with_most_incorrect AS (
     SELECT
         session_group,
         CASE 
             WHEN MAX(total_wrong_repeats) = 0 THEN 'None'  -- If all incorrect counts are 0, return 'None'
-            ELSE MAX(CASE WHEN rank_incorrect = 1 THEN exercise_name END)
+            -- Ties go to the lexicographically smallest exercise name
+            ELSE FIRST(exercise_name ORDER BY total_wrong_repeats DESC, exercise_name ASC NULLS LAST)
+                FILTER (WHERE total_wrong_repeats IS NOT NULL)
         END AS exercise_with_most_incorrect
-    FROM ranked_exercises
+    FROM incorrect_counts
     GROUP BY session_group
 ),
 
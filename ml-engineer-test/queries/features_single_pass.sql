@@ -0,0 +1,93 @@
+-- Single-scan variant of features.sql.
+-- exercise_results is read once: the first GROUP BY collapses rows per
+-- (session_group, exercise_name) and every feature is rolled up from there.
+WITH per_exercise AS (
+    SELECT
+        session_group,
+        exercise_name,
+        ANY_VALUE(patient_id) AS patient_id,
+        ANY_VALUE(patient_name) AS patient_name,
+        ANY_VALUE(patient_age) AS patient_age,
+        ANY_VALUE(therapy_name) AS therapy_name,
+        ANY_VALUE(session_number) AS session_number,
+        ANY_VALUE(leave_session) AS leave_session,
+        ANY_VALUE(session_is_nok) AS session_is_nok,
+        ANY_VALUE(pain) AS pain,
+        ANY_VALUE(fatigue) AS fatigue,
+        ANY_VALUE(quality) AS quality,
+
+        ANY_VALUE(quality_reason_movement_detection) AS quality_reason_movement_detection,
+        ANY_VALUE(quality_reason_my_self_personal) AS quality_reason_my_self_personal,
+        ANY_VALUE(quality_reason_other) AS quality_reason_other,
+        ANY_VALUE(quality_reason_exercises) AS quality_reason_exercises,
+        ANY_VALUE(quality_reason_tablet) AS quality_reason_tablet,
+        ANY_VALUE(quality_reason_tablet_and_or_motion_trackers) AS quality_reason_tablet_and_or_motion_trackers,
+        ANY_VALUE(quality_reason_easy_of_use) AS quality_reason_easy_of_use,
+        ANY_VALUE(quality_reason_session_speed) AS quality_reason_session_speed,
+
+        COUNT(*) FILTER (WHERE leave_exercise = 'system_problem') AS leave_exercise_system_problem,
+        COUNT(*) FILTER (WHERE leave_exercise = 'other') AS leave_exercise_other,
+        COUNT(*) FILTER (WHERE leave_exercise = 'unable_perform') AS leave_exercise_unable_perform,
+        COUNT(*) FILTER (WHERE leave_exercise = 'pain') AS leave_exercise_pain,
+        COUNT(*) FILTER (WHERE leave_exercise = 'tired') AS leave_exercise_tired,
+        COUNT(*) FILTER (WHERE leave_exercise = 'technical_issues') AS leave_exercise_technical_issues,
+        COUNT(*) FILTER (WHERE leave_exercise = 'difficulty') AS leave_exercise_difficulty,
+
+        SUM(prescribed_repeats) AS prescribed_repeats,
+        SUM(training_time) AS training_time,
+        SUM(correct_repeats) AS correct_repeats,
+        SUM(correct_repeats + wrong_repeats) AS attempted_repeats,
+        SUM(wrong_repeats) AS total_wrong_repeats,
+        COUNT(*) AS number_exercises,
+        MIN(exercise_order) FILTER (WHERE leave_exercise IS NOT NULL) AS first_skipped_order
+    FROM exercise_results
+    GROUP BY session_group, exercise_name
+)
+
+SELECT
+    session_group,
+    ANY_VALUE(patient_id) AS patient_id,
+    ANY_VALUE(patient_name) AS patient_name,
+    ANY_VALUE(patient_age) AS patient_age,
+    ANY_VALUE(therapy_name) AS therapy_name,
+    ANY_VALUE(session_number) AS session_number,
+    ANY_VALUE(leave_session) AS leave_session,
+    ANY_VALUE(session_is_nok) AS session_is_nok,
+    ANY_VALUE(pain) AS pain,
+    ANY_VALUE(fatigue) AS fatigue,
+    ANY_VALUE(quality) AS quality,
+
+    -- Quality reasons
+    ANY_VALUE(quality_reason_movement_detection) AS quality_reason_movement_detection,
+    ANY_VALUE(quality_reason_my_self_personal) AS quality_reason_my_self_personal,
+    ANY_VALUE(quality_reason_other) AS quality_reason_other,
+    ANY_VALUE(quality_reason_exercises) AS quality_reason_exercises,
+    ANY_VALUE(quality_reason_tablet) AS quality_reason_tablet,
+    ANY_VALUE(quality_reason_tablet_and_or_motion_trackers) AS quality_reason_tablet_and_or_motion_trackers,
+    ANY_VALUE(quality_reason_easy_of_use) AS quality_reason_easy_of_use,
+    ANY_VALUE(quality_reason_session_speed) AS quality_reason_session_speed,
+
+    -- Aggregated Features
+    SUM(leave_exercise_system_problem)::BIGINT AS leave_exercise_system_problem,
+    SUM(leave_exercise_other)::BIGINT AS leave_exercise_other,
+    SUM(leave_exercise_unable_perform)::BIGINT AS leave_exercise_unable_perform,
+    SUM(leave_exercise_pain)::BIGINT AS leave_exercise_pain,
+    SUM(leave_exercise_tired)::BIGINT AS leave_exercise_tired,
+    SUM(leave_exercise_technical_issues)::BIGINT AS leave_exercise_technical_issues,
+    SUM(leave_exercise_difficulty)::BIGINT AS leave_exercise_difficulty,
+
+    COALESCE(SUM(prescribed_repeats), 0) AS prescribed_repeats,
+    COALESCE(SUM(training_time), 0) AS training_time,
+    SUM(correct_repeats) / NULLIF(SUM(attempted_repeats), 0) AS perc_correct_repeats,
+    SUM(number_exercises)::BIGINT AS number_exercises,
+    COUNT(exercise_name) AS number_of_distinct_exercises,
+    CASE
+        WHEN MAX(total_wrong_repeats) = 0 THEN 'None'  -- If all incorrect counts are 0, return 'None'
+        -- Ties go to the lexicographically smallest exercise name
+        ELSE FIRST(exercise_name ORDER BY total_wrong_repeats DESC, exercise_name ASC NULLS LAST)
+            FILTER (WHERE total_wrong_repeats IS NOT NULL)
+    END AS exercise_with_most_incorrect,
+    ARG_MIN(exercise_name, first_skipped_order) AS first_exercise_skipped
+
+FROM per_exercise
+GROUP BY session_group;
@@ -1,6 +1,7 @@
 from setuptools import find_packages, setup
 
 packages = [
+    "aiohttp==3.9.3",
     "duckdb==0.10.0",
     "jupyter_client==8.6.0",
     "jupyter_core==5.7.1",
@@ -11,6 +12,7 @@ packages = [
     "pydantic-settings==2.1.0",
     "pyarrow==14.0.2",
     "SQLAlchemy==1.4.46",
+    "tiktoken==0.5.2",
     "typer==0.9.0",
 ]
 
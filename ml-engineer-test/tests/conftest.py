@@ -0,0 +1,25 @@
+import pytest
+from message.config import get_settings
+from message.model import ChatModel, get_chat_model
+
+
+def reset_model_caches():
+    get_settings.cache_clear()
+    get_chat_model.cache_clear()
+
+
+@pytest.fixture
+def use_stub(monkeypatch):
+    """Returns a function pointing the shared model at a stub server URL.
+
+    Tokens are counted on whitespace so tests never download encodings.
+    """
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(ChatModel, "count_tokens", staticmethod(lambda text, model=None: len(text.split())))
+
+    def point_to(api_base: str):
+        monkeypatch.setenv("OPENAI_API_BASE", api_base)
+        reset_model_caches()
+
+    yield point_to
+    reset_model_caches()
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import statistics
+import pytest
+from aiohttp import web
+from openai.error import APIError, RateLimitError
+from message.backends import CompletionBackend, OpenAIBackend, StubBackend, create_backend
+from message.stub_server import STUB_CONTENT, running_stub_server, sample_latency
+
+MESSAGES = [{"role": "user", "content": "Hey there"}]
+
+
+def test_stub_backend_completion():
+    """Test if the stub backend returns the completion and its usage."""
+
+    async def main():
+        async with running_stub_server() as api_base:
+            backend = StubBackend(api_base)
+            completion = await backend.complete(model="gpt-4-turbo-preview", messages=MESSAGES)
+            await backend.aclose()
+            return completion
+
+    completion = asyncio.run(main())
+
+    assert completion.content == STUB_CONTENT
+    assert completion.prompt_tokens == len("Hey there") // 4
+    assert completion.completion_tokens == len(STUB_CONTENT) // 4
+
+
+def test_stub_rate_limits():
+    """Test if 429s raise RateLimitError with the Retry-After header, at random and above the RPM limit."""
+
+    async def main(stats, **kwargs):
+        async with running_stub_server(stats=stats, **kwargs) as api_base:
+            backend = StubBackend(api_base)
+            results = await asyncio.gather(
+                *(backend.complete(model="gpt-4-turbo-preview", messages=MESSAGES) for _ in range(10)),
+                return_exceptions=True,
+            )
+            await backend.aclose()
+            return results
+
+    stats = {}
+    results = asyncio.run(main(stats, rate_limit_probability=1.0, retry_after=0.5))
+    assert all(isinstance(result, RateLimitError) for result in results)
+    assert results[0].http_status == 429 and results[0].headers["Retry-After"] == "0.500"
+    assert stats["rate_limited"] == 10
+
+    # 60 requests per minute allow a burst of one
+    stats = {}
+    results = asyncio.run(main(stats, rate_limit_rpm=60))
+    assert sum(isinstance(result, RateLimitError) for result in results) == stats["rate_limited"] == 9
+    assert 0 < float(next(r for r in results if isinstance(r, RateLimitError)).headers["Retry-After"]) <= 1
+
+
+def test_stub_backend_wraps_transport_errors():
+    """Test if non-JSON bodies and connection errors raise APIError, not aiohttp or JSON errors."""
+
+    async def plain_text(request):
+        status = int(request.match_info["status"])
+        return web.Response(status=status, text="<html>Bad gateway</html>")
+
+    async def error_of(api_base):
+        backend = StubBackend(api_base)
+        try:
+            await backend.complete(messages=MESSAGES)
+        except Exception as e:
+            return e
+        finally:
+            await backend.aclose()
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/{status}/chat/completions", plain_text)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        try:
+            errors = [await error_of(f"{base}/{status}") for status in [502, 429, 200]]
+        finally:
+            await runner.cleanup()
+        # Nothing listens there anymore
+        return errors + [await error_of(base)]
+
+    bad_gateway, rate_limited, not_json, refused = asyncio.run(main())
+
+    assert isinstance(bad_gateway, APIError) and bad_gateway.http_status == 502
+    assert isinstance(rate_limited, RateLimitError) and rate_limited.http_status == 429
+    assert isinstance(not_json, APIError) and not_json.http_status == 200
+    assert type(refused) is APIError and refused.http_status is None
+
+
+def test_completion_backend_is_abstract():
+    """Test if a backend without `complete` cannot be created."""
+    with pytest.raises(TypeError):
+        CompletionBackend()
+
+    class NoComplete(CompletionBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoComplete()
+
+
+def test_sample_latency():
+    """Test the stub latency distributions around the configured latency."""
+    rng = random.Random(0)
+
+    assert sample_latency(rng, 0.2) == 0.2
+    assert statistics.mean(sample_latency(rng, 0.2, "exponential") for _ in range(20_000)) == pytest.approx(0.2, rel=0.05)
+    assert statistics.median(sample_latency(rng, 0.2, "lognormal", 1.0) for _ in range(20_000)) == pytest.approx(0.2, rel=0.05)
+    with pytest.raises(ValueError):
+        sample_latency(rng, 0.2, "gaussian")
+
+
+def test_create_backend(monkeypatch):
+    """Test if the COMPLETION_BACKEND setting picks the backend."""
+    from message.config import get_settings
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.delenv("OPENAI_API_BASE", raising=False)
+    get_settings.cache_clear()
+    try:
+        assert isinstance(create_backend(), OpenAIBackend)
+        monkeypatch.setenv("COMPLETION_BACKEND", "stub")
+        get_settings.cache_clear()
+        backend = create_backend(pool_size=4)
+        assert isinstance(backend, StubBackend) and backend.pool_size == 4
+        with pytest.raises(ValueError):
+            create_backend("other")
+    finally:
+        get_settings.cache_clear()
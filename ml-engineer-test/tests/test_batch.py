@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+import pandas as pd
+from pathlib import Path
+from message.batch import generate_batch, nok_session_groups
+from message.metrics import STAGE_SECONDS, get_metrics
+from message.model import get_chat_model
+from message.rate_limit import TokenBucket
+from message.stub_server import STUB_CONTENT, running_stub_server
+
+
+def run_batch(use_stub, session_groups, output, **kwargs):
+    async def main():
+        async with running_stub_server() as api_base:
+            use_stub(api_base)
+            try:
+                return await generate_batch(session_groups, output, **kwargs)
+            finally:
+                await get_chat_model().aclose()
+
+    return asyncio.run(main())
+
+
+def test_generate_batch_jsonl(use_stub, tmp_path):
+    """Test a batch end-to-end against the stub server, with one unknown session."""
+    session_groups = nok_session_groups()[:10] + ["missing"]
+    output = Path(tmp_path, "messages.jsonl")
+
+    stats = run_batch(use_stub, session_groups, output, concurrency=4)
+
+    assert (stats["generated"], stats["failed"]) == (10, 1)
+    stages = stats["metrics"]["message_stage_seconds"]
+    assert stages['{stage="feature_lookup"}']["count"] == 11
+    for stage in ("prompt_render", "completion", "token_counting"):
+        assert stages[f'{{stage="{stage}"}}']["count"] == 10
+    assert stats["metrics"]["message_cost_dollars_total"]['{model="gpt-4-turbo-preview"}'] > 0
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record["session_group"] for record in records) == sorted(session_groups)
+    for record in records:
+        if record["session_group"] == "missing":
+            assert record["message"] is None and record["error"]
+        else:
+            assert record["message"] == STUB_CONTENT and record["error"] is None
+
+
+def test_batch_metrics_are_scoped_to_the_batch(use_stub, tmp_path):
+    """Test if a batch summarizes its own metrics without resetting the process-wide ones."""
+    session_groups = nok_session_groups()[:3]
+    get_metrics().counter("before_batch_total").inc()
+    feature_lookups = get_metrics().histogram(STAGE_SECONDS).count(stage="feature_lookup")
+
+    first = run_batch(use_stub, session_groups, Path(tmp_path, "first.jsonl"))
+    second = run_batch(use_stub, session_groups, Path(tmp_path, "second.jsonl"))
+
+    for stats in (first, second):
+        assert stats["metrics"][STAGE_SECONDS]['{stage="feature_lookup"}']["count"] == 3
+        assert "before_batch_total" not in stats["metrics"]
+    assert get_metrics().counter("before_batch_total").value() == 1
+    assert get_metrics().histogram(STAGE_SECONDS).count(stage="feature_lookup") == feature_lookups + 6
+
+
+def test_batch_leaves_the_shared_model_open(use_stub, tmp_path):
+    """Test if the shared model's pool still serves other callers after a batch."""
+
+    async def main():
+        async with running_stub_server() as api_base:
+            use_stub(api_base)
+            chat_model = get_chat_model()
+            await generate_batch(nok_session_groups()[:2], Path(tmp_path, "messages.jsonl"))
+            session = chat_model.backend._session
+            still_open = session is not None and not session.closed
+            await chat_model.aclose()
+            return still_open
+
+    assert asyncio.run(main())
+
+
+def test_generate_batch_parquet(use_stub, tmp_path):
+    """Test if results can be streamed to parquet."""
+    session_groups = nok_session_groups()[:5]
+    output = Path(tmp_path, "messages.parquet")
+
+    run_batch(use_stub, session_groups, output, concurrency=2, tokens_per_minute=1_000_000)
+
+    result = pd.read_parquet(output)
+    assert sorted(result["session_group"]) == sorted(session_groups)
+    assert (result["message"] == STUB_CONTENT).all()
+
+
+def test_batch_token_budget_is_scoped_to_the_batch(use_stub, tmp_path):
+    """Test if a batch's token budget is lifted afterwards and leaves the learned request rate alone."""
+
+    async def main():
+        async with running_stub_server() as api_base:
+            use_stub(api_base)
+            scheduler = get_chat_model().scheduler
+            scheduler.set_limits(requests_per_minute=60_000, tokens_per_minute=None)
+            requests = scheduler.requests
+            requests.set_rate(30_000)  # clamped after a 429
+            budgets = []
+            original_acquire = scheduler.acquire
+
+            async def acquire(tokens=0):
+                budgets.append(scheduler.tokens_per_minute)
+                await original_acquire(tokens)
+
+            scheduler.acquire = acquire
+            await generate_batch(nok_session_groups()[:3], Path(tmp_path, "messages.jsonl"), tokens_per_minute=1_000_000)
+            await get_chat_model().aclose()
+            return scheduler, requests, budgets
+
+    scheduler, requests, budgets = asyncio.run(main())
+
+    assert budgets == [1_000_000] * 3
+    assert scheduler.tokens_per_minute is None and scheduler.tokens is None
+    assert scheduler.requests is requests
+    assert scheduler.request_rate == 30_000
+
+
+def test_token_bucket_waits_for_refill():
+    """Test if acquiring past the capacity waits for the bucket to refill."""
+    async def main():
+        bucket = TokenBucket(rate_per_minute=600, capacity=10)  # 10 tokens per second
+        start = time.monotonic()
+        await bucket.acquire(10)
+        await bucket.acquire(5)
+        return time.monotonic() - start
+
+    assert 0.4 < asyncio.run(main()) < 1.0
@@ -0,0 +1,41 @@
+import pytest
+from message.benchmark import compare_results, run_benchmarks
+
+
+def test_run_benchmarks_results_file():
+    """Test a tiny suite run: one result per case and scale, with the environment recorded."""
+    report = run_benchmarks(
+        scales=[50, 100], cases=["transform_sql", "transform_py", "feature_lookup", "prompt_render"], repeats=2, lookups=20
+    )
+
+    assert report["schema"] == 1
+    assert {"commit", "python", "duckdb", "cpu_count"} <= set(report["environment"])
+    assert [(result["case"], result["scale"]) for result in report["results"]] == [
+        (case, scale)
+        for scale in (50, 100)
+        for case in ("transform_sql", "transform_py", "feature_lookup", "prompt_render")
+    ]
+    lookup = report["results"][2]
+    assert lookup["items"] == 20 and lookup["repeats"] == 2
+    assert 0 < lookup["best_seconds"] <= lookup["median_seconds"]
+    assert report["results"][0]["items"] == 50 * 15
+
+    with pytest.raises(ValueError):
+        run_benchmarks(scales=[10], cases=["unknown"])
+
+
+def test_compare_results_flags_regressions():
+    """Test if cases slower than the tolerance are flagged and unmatched cases skipped."""
+    baseline = {"results": [{"case": "a", "scale": 10, "best_seconds": 1.0}, {"case": "b", "scale": 10, "best_seconds": 1.0}]}
+    current = {
+        "results": [
+            {"case": "a", "scale": 10, "best_seconds": 1.1},
+            {"case": "b", "scale": 10, "best_seconds": 1.5},
+            {"case": "c", "scale": 10, "best_seconds": 9.0},
+        ]
+    }
+
+    comparison = compare_results(baseline, current, tolerance=0.2)
+
+    assert [(row["case"], row["regression"]) for row in comparison] == [("a", False), ("b", True)]
+    assert comparison[1]["ratio"] == pytest.approx(1.5)
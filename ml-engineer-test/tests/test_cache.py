@@ -0,0 +1,64 @@
+from pathlib import Path
+from message.cache import CompletionCache, completion_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_completion_key():
+    """Test if the key depends on model, temperature and prompts but not on transport params."""
+    messages = [{"role": "system", "content": "Be nice"}, {"role": "user", "content": "Hi"}]
+    key = completion_key(model="gpt", messages=messages, temperature=0.7)
+
+    assert key == completion_key(model="gpt", messages=messages, temperature=0.7, api_key="sk", request_timeout=5)
+    assert key != completion_key(model="gpt", messages=messages, temperature=0.2)
+    assert key != completion_key(model="gpt", messages=messages[1:], temperature=0.7)
+    assert key != completion_key(model="gpt", messages=messages, temperature=0.7, max_tokens=10)
+
+
+def test_lru_eviction():
+    """Test if the least recently used entry is evicted from memory."""
+    cache = CompletionCache(max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+    assert cache.stats == {"memory_hits": 3, "disk_hits": 0, "misses": 1, "bypassed": 0, "hits": 3}
+
+
+def test_ttl_expiry():
+    """Test if entries older than the TTL are misses."""
+    clock = FakeClock()
+    cache = CompletionCache(ttl=60, clock=clock)
+    cache.set("a", "A")
+
+    clock.now += 30
+    assert cache.get("a") == "A"
+    clock.now += 31
+    assert cache.get("a") is None
+
+
+def test_disk_tier(tmp_path):
+    """Test if the SQLite tier survives a restart and expires entries."""
+    clock = FakeClock()
+    path = Path(tmp_path, "completions.sqlite")
+    cache = CompletionCache(ttl=60, path=path, clock=clock)
+    cache.set("a", "A")
+    cache.close()
+
+    cache = CompletionCache(ttl=60, path=path, clock=clock)
+    assert cache.get("a") == "A"
+    assert cache.stats["disk_hits"] == 1
+    assert cache.get("a") == "A"
+    assert cache.stats["memory_hits"] == 1
+
+    clock.now += 61
+    assert cache.evict_expired() == 2
+    assert cache.get("a") is None
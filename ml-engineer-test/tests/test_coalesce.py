@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+from message.backends import Completion, CompletionBackend
+from message.coalesce import SingleFlight
+from message.feature_store import get_feature_store
+from message.main import get_message
+from message.metrics import COALESCED, get_metrics
+from message.model import ChatModel, get_chat_model
+from message.stub_server import running_stub_server
+
+MESSAGES = [{"role": "system", "content": "Be nice"}, {"role": "user", "content": "Hey there"}]
+
+
+def test_single_flight_shares_calls():
+    """Test if concurrent calls with the same key share one call, result and exception."""
+    single_flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        if key == "bad":
+            raise ValueError(key)
+        return key.upper()
+
+    async def main():
+        results = await asyncio.gather(
+            *(single_flight.run(key, lambda key=key: work(key)) for key in ["a", "a", "b", "a", "bad", "bad"]),
+            return_exceptions=True,
+        )
+        # ✅ Finished keys are forgotten: the next call starts afresh
+        assert len(single_flight) == 0
+        return results, await single_flight.run("a", lambda: work("a"))
+
+    results, again = asyncio.run(main())
+
+    assert results[:4] == [("A", False), ("A", True), ("B", False), ("A", True)]
+    assert all(isinstance(result, ValueError) for result in results[4:])
+    assert calls == ["a", "b", "bad", "a"]
+    assert again == ("A", False)
+    assert single_flight.stats == {"calls": 7, "coalesced": 3}
+
+
+def test_cancelled_caller_leaves_shared_call_running():
+    """Test if cancelling one caller does not cancel the call the others wait for."""
+    single_flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(single_flight.run("key", work))
+        follower = asyncio.ensure_future(single_flight.run("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+class CountingBackend(CompletionBackend):
+    """Answers after a short delay, counting the requests it receives."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def complete(self, **kwargs) -> Completion:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return Completion("Hi", prompt_tokens=10, completion_tokens=5)
+
+
+def test_identical_completions_coalesce(use_stub, monkeypatch):
+    """Test if identical requests in flight share one API call and count its usage once."""
+    monkeypatch.setenv("COMPLETION_CACHE_SIZE", "0")
+    backend = CountingBackend()
+    chat_model = ChatModel(backend=backend)
+    get_metrics().reset()
+
+    async def send(n, **kwargs):
+        return await asyncio.gather(
+            *(chat_model.create_completion(model="gpt-4-turbo-preview", messages=MESSAGES, **kwargs) for _ in range(n))
+        )
+
+    completions = asyncio.run(send(5))
+
+    assert backend.calls == 1
+    assert [completion.content for completion in completions] == ["Hi"] * 5
+    assert sum(completion.prompt_tokens for completion in completions) == 10
+    assert [completion.coalesced for completion in completions] == [False] + [True] * 4
+    assert get_metrics().counter(COALESCED).value(stage="completion") == 4
+
+    # ✅ Bypassing the cache asks for independent completions
+    asyncio.run(send(3, use_cache=False))
+    assert backend.calls == 4
+
+
+def test_get_message_burst_coalesces(use_stub, monkeypatch):
+    """Test if a burst of get_message calls for one session_group sends one request."""
+    monkeypatch.setenv("COMPLETION_BACKEND", "stub")
+    session_group = get_feature_store().column("session_group")[0]
+
+    async def main(stats):
+        async with running_stub_server(stats=stats, latency=0.05) as api_base:
+            use_stub(api_base)
+            get_chat_model().cache = None
+            get_metrics().reset()
+            try:
+                return await asyncio.gather(*(get_message(session_group) for _ in range(10)))
+            finally:
+                await get_chat_model().aclose()
+
+    stats = {}
+    messages = asyncio.run(main(stats))
+
+    assert stats["requests"] == 1
+    assert len(set(messages)) == 1 and messages[0]
+    assert get_metrics().counter(COALESCED).value(stage="message") == 9
+    assert get_metrics().histogram("message_stage_seconds").count(stage="feature_lookup") == 1
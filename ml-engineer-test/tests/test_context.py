@@ -0,0 +1,68 @@
+import math
+import pyarrow as pa
+from message.context import build_context_columns, format_column, render_user_prompts
+import pytest
+from message.data import SESSION_CONTEXT_FIELDS, SessionContext, fetch_session_data
+from message.feature_store import get_feature_store
+from message.prompt_manager import build_user_prompt
+
+
+def test_render_user_prompts_matches_dict_path():
+    """Test if columnar prompts equal build_user_prompt(fetch_session_data(...)) on every session."""
+    store = get_feature_store()
+    session_groups = store.column("session_group")
+
+    expected = [build_user_prompt(fetch_session_data(session_group)) for session_group in session_groups]
+
+    assert render_user_prompts(store.take(session_groups)) == expected
+    # ✅ Record batches render the same as the table they come from
+    batches = store.take(session_groups).to_batches(max_chunksize=500)
+    assert [prompt for batch in batches for prompt in render_user_prompts(batch)] == expected
+
+
+def test_format_column_matches_python_str():
+    """Test if float, int, bool and null columns format like the Arrow records do."""
+    floats = [2.0, 0.5, 1e-5, 1e-4, 1e15, 1e16, -3.25, 0.0, 123456.789, None]
+    assert format_column(pa.array(floats)).to_pylist() == [format(value, "") for value in floats]
+    for values in ([1, None], [1, 2], [True, None], ["knee", None]):
+        array = pa.array(values)
+        assert format_column(array).to_pylist() == [format(value, "") for value in array.to_pylist()]
+    assert format_column(pa.array([1, None])).to_pylist() == ["1", "None"]
+
+
+def test_missing_columns_get_defaults():
+    """Test if columns absent from the features fall back to the fetch_session_data defaults."""
+    features = pa.table({"session_group": ["A", "B"], "pain": [3.0, None], "session_is_nok": [False, None]})
+
+    columns = build_context_columns(features)
+
+    assert columns["pain"].to_pylist() == ["3.0", "None"]
+    assert columns["quality"].to_pylist() == ["5", "5"]
+    assert columns["patient_name"].to_pylist() == ["Unknown", "Unknown"]
+    assert columns["session_is_nok"].to_pylist() == [False, False]
+    assert render_user_prompts(features.slice(0, 0)) == []
+
+
+def test_session_context_matches_dict():
+    """Test if a SessionContext reads like the dict fetch_session_data used to return."""
+    record = {"session_group": "A", "patient_name": "John Doe", "pain": 2.0, "quality": float("nan"), "session_is_nok": None}
+
+    context = SessionContext.from_record(record)
+
+    assert not hasattr(context, "__dict__")
+    assert list(context) == SESSION_CONTEXT_FIELDS
+    assert context == {
+        "patient_name": "John Doe", "therapy_name": "Unknown Therapy", "session_number": None,
+        "session_is_nok": False, "pain": "2.0", "fatigue": "0", "quality": "nan", "number_exercises": "0",
+        "exercise_with_most_incorrect": "N/A", "first_exercise_skipped": "N/A", "leave_session": "No early leave",
+        "number_of_distinct_exercises": "N/A", "perc_correct_repeats": "N/A",
+    }
+    # ✅ Numeric fields keep their value, the string is only made when read
+    assert context.pain == 2.0 and math.isnan(context.quality)
+    with pytest.raises(KeyError):
+        context["session_group"]
+
+    context["scenario_description"] = "scenario"
+    assert list(context)[-1] == "scenario_description"
+    with pytest.raises(KeyError):
+        context["unknown"] = 1
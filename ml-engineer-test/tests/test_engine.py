@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from message.config import QUERIES_DIR
+from message.engine import DuckDBSession
+from message.synthetic import generate_exercise_results
+
+
+def test_sessions_are_configured_and_isolated():
+    """Test if two sessions in one process keep their own tables and settings."""
+    query = Path(QUERIES_DIR, "features_single_pass.sql").read_text()
+    inputs = [generate_exercise_results(n_sessions=n, exercises_per_session=3, seed=n) for n in (50, 80)]
+
+    def transform(exercise_results):
+        with DuckDBSession(threads=2, memory_limit="256MB") as session:
+            session.register("exercise_results", exercise_results)
+            settings = session.execute(
+                "SELECT current_setting('threads'), current_setting('preserve_insertion_order')"
+            ).fetchone()
+            return settings, session.query_df(query)
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(transform, inputs))
+
+    for exercise_results, (settings, features) in zip(inputs, results):
+        assert settings == (2, False)
+        assert sorted(features["session_group"]) == sorted(exercise_results["session_group"].unique())
+
+
+def test_session_cleans_up():
+    """Test if closing a session drops its registrations and connection."""
+    session = DuckDBSession()
+    session.register("exercise_results", pd.DataFrame({"session_group": ["A", "B"]}))
+    assert session.execute("SELECT COUNT(*) FROM exercise_results").fetchone() == (2,)
+
+    session.close()
+    assert session.connection is None and session._registered == {}
+    session.close()
@@ -0,0 +1,218 @@
+import os
+import math
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from pathlib import Path
+from message import feature_store
+from message.config import DATA_DIR
+from message.data import get_features
+from message.feature_store import FEATURES_PATH, FEATURES_SCHEMA, FeatureStore, get_feature_store, matching_row_groups, read_features, write_features
+
+# The real features in pandas' default layout: one row group, not sorted
+PLAIN_FEATURES_PATH = Path(DATA_DIR, "features_expected.parquet")
+
+
+@pytest.fixture
+def features_path(tmp_path):
+    """Write a small features file for the store to serve."""
+    path = Path(tmp_path, "features.parquet")
+    pd.DataFrame({
+        "session_group": ["A", "B", "C"],
+        "patient_name": ["John Doe", "Jane Smith", None],
+        "pain": [2.0, 5.0, float("nan")],
+        "session_is_nok": [False, True, None],
+    }).to_parquet(path)
+    return path
+
+
+def test_get(features_path):
+    """Test if a lookup returns the record of the session group."""
+    store = FeatureStore(features_path)
+
+    assert len(store) == 3
+    assert store.get("B") == {"session_group": "B", "patient_name": "Jane Smith", "pain": 5.0, "session_is_nok": True}
+    assert store.get("missing") is None
+
+
+def test_get_many(features_path):
+    """Test if a batch lookup keeps the input order and gives None for unknown groups."""
+    store = FeatureStore(features_path)
+
+    records = store.get_many(["C", "missing", "A"])
+
+    assert [record and record["session_group"] for record in records] == ["C", None, "A"]
+    assert records[0]["pain"] is None
+
+
+def test_reload_on_mtime_change(features_path):
+    """Test if the store picks up a rewritten features file."""
+    store = FeatureStore(features_path, reload_interval=0)
+
+    pd.DataFrame({"session_group": ["D"], "patient_name": ["New"], "pain": [1.0], "session_is_nok": [False]}).to_parquet(features_path)
+    stat = os.stat(features_path)
+    os.utime(features_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert store.get("D")["patient_name"] == "New"
+    assert store.get("A") is None
+
+
+def test_matches_arrow_records():
+    """Test if records hold the Arrow values of the real features file, with None for every null."""
+    store = FeatureStore(FEATURES_PATH, auto_reload=False)
+    rows = {row["session_group"]: row for row in pq.read_table(FEATURES_PATH).to_pylist()}
+    frame = pd.read_parquet(FEATURES_PATH)
+    with_nulls = frame[frame.isna().any(axis=1)]["session_group"].sample(10, random_state=0)
+
+    for session_group in [*frame["session_group"].sample(10, random_state=0), *with_nulls]:
+        result = store.get(session_group)
+        assert result == rows[session_group]
+        assert all(value is None for value in result.values() if value != value or value is None)
+
+
+def test_write_features_layout(tmp_path):
+    """Test if write_features sorts, casts, dictionary-encodes and keeps the values."""
+    frame = pd.read_parquet(PLAIN_FEATURES_PATH)
+    path = Path(tmp_path, "features.parquet")
+
+    write_features(frame, path, row_group_size=100)
+
+    metadata = pq.read_metadata(path)
+    assert metadata.num_row_groups == math.ceil(len(frame) / 100)
+    row_group = metadata.row_group(0)
+    columns = {row_group.column(i).path_in_schema: row_group.column(i) for i in range(row_group.num_columns)}
+    assert columns["session_group"].statistics.has_min_max
+    assert columns["session_group"].compression == "ZSTD"
+    for name in ["therapy_name", "leave_session", "exercise_with_most_incorrect", "first_exercise_skipped"]:
+        assert "RLE_DICTIONARY" in columns[name].encodings
+    assert "RLE_DICTIONARY" not in columns["session_group"].encodings
+
+    written = pd.read_parquet(path)
+    assert written["session_group"].is_monotonic_increasing
+    assert written.memory_usage(deep=True).sum() < frame.memory_usage(deep=True).sum()
+    expected = frame.sort_values("session_group", ignore_index=True)
+    pd.testing.assert_frame_equal(written, expected, check_dtype=False)
+
+
+def test_write_features_schema_does_not_depend_on_values(tmp_path):
+    """Test if every write has the FEATURES_SCHEMA types, whatever the value ranges."""
+    frame = pd.read_parquet(PLAIN_FEATURES_PATH)
+    small, large = frame.head(10).copy(), frame.head(10).copy()
+    small["training_time"] = small["prescribed_repeats"] = 1.0
+    large["training_time"] = large["prescribed_repeats"] = 2.0**40
+    large["session_number"] = 100_000
+    small["pain"] = 2.0
+
+    schemas = []
+    for name, part in [("small", small), ("large", large)]:
+        write_features(part, Path(tmp_path, name), row_group_size=100)
+        schemas.append({field.name: field.type for field in pq.read_schema(Path(tmp_path, name))})
+    assert schemas[0] == schemas[1] == {field.name: field.type for field in FEATURES_SCHEMA}
+    assert pq.read_table(Path(tmp_path, "large"))["training_time"][0].as_py() == 2**40
+
+    # ✅ Values the column type cannot hold fail the write instead of changing
+    small["session_number"] = 0.5
+    with pytest.raises(pa.ArrowInvalid):
+        write_features(small, Path(tmp_path, "fractional"))
+
+
+def test_failed_write_keeps_the_previous_file(tmp_path, monkeypatch):
+    """Test if a write that fails halfway leaves the file being served intact."""
+    frame = pd.read_parquet(PLAIN_FEATURES_PATH).head(10)
+    path = Path(tmp_path, "features.parquet")
+    write_features(frame, path)
+    before = pq.read_table(path).to_pylist()
+
+    def crash(table, where, **kwargs):
+        Path(where).write_bytes(b"PAR1 partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(feature_store.pq, "write_table", crash)
+    with pytest.raises(OSError):
+        write_features(frame.head(5), path)
+    monkeypatch.undo()
+
+    assert pq.read_table(path).to_pylist() == before
+
+
+def test_served_features_differ_from_reference_only_as_documented():
+    """Test if the served features match features_expected.parquet but for `exercise_with_most_incorrect`.
+
+    The served file is the transform output: sessions without wrong repeats
+    say 'None' where the reference has NULL, and ties may pick another exercise.
+    """
+    served = pq.read_table(FEATURES_PATH).sort_by("session_group")
+    reference = pq.read_table(PLAIN_FEATURES_PATH).sort_by("session_group")
+    assert served.num_rows == reference.num_rows
+
+    for name in reference.column_names:
+        if name != "exercise_with_most_incorrect":
+            assert served[name].to_pylist() == reference[name].to_pylist(), name
+
+    pairs = list(zip(served["exercise_with_most_incorrect"].to_pylist(), reference["exercise_with_most_incorrect"].to_pylist()))
+    assert all(theirs is None for ours, theirs in pairs if ours == "None")
+    assert all(ours not in (None, "None") for ours, theirs in pairs if theirs is not None)
+    assert sum(ours == "None" for ours, _ in pairs) == 27_012
+
+
+def test_read_features_touches_one_row_group(tmp_path):
+    """Test if a single-session read only reads the row group holding the session."""
+    frame = pd.read_parquet(PLAIN_FEATURES_PATH)
+    path = Path(tmp_path, "features.parquet")
+    write_features(frame, path, row_group_size=100)
+    session_group = frame["session_group"].iloc[0]
+
+    assert len(matching_row_groups(pq.read_metadata(path), [session_group])) == 1
+    assert matching_row_groups(pq.read_metadata(path), ["~missing"]) == []
+    assert read_features([session_group], path)["session_group"].to_pylist() == [session_group]
+    assert read_features(["missing"], path).num_rows == 0
+
+    # ✅ Files without a useful layout are still read correctly, just whole
+    assert read_features([session_group], PLAIN_FEATURES_PATH)["session_group"].to_pylist() == [session_group]
+
+
+def test_lazy_store_matches_loaded_store(tmp_path):
+    """Test if a lazy store serves the loaded store's records from the file, then loads it."""
+    frame = pd.read_parquet(PLAIN_FEATURES_PATH)
+    path = Path(tmp_path, "features.parquet")
+    write_features(frame, path, row_group_size=100)
+    loaded = FeatureStore(path, auto_reload=False)
+    lazy = FeatureStore(path, auto_reload=False, lazy=True, lazy_lookups=10)
+
+    for session_group in frame["session_group"].sample(20, random_state=0).tolist() + ["missing"]:
+        expected = loaded.get(session_group)
+        result = lazy.get(session_group)
+        assert (result is None) == (expected is None)
+        if expected is not None:
+            assert result.keys() == expected.keys()
+            for name, value in expected.items():
+                assert result[name] == value or (value != value and result[name] != result[name])
+
+    assert lazy.file_lookups == 10
+    assert len(lazy) == len(frame)
+
+
+def test_cold_get_features_reads_one_row_group(monkeypatch):
+    """Test if a cold get_features on the default store reads the row group of the session only."""
+    read = []
+    read_row_groups = feature_store.pq.ParquetFile.read_row_groups
+
+    def spy(parquet_file, row_groups, *args, **kwargs):
+        read.append(list(row_groups))
+        return read_row_groups(parquet_file, row_groups, *args, **kwargs)
+
+    monkeypatch.setattr(feature_store.pq.ParquetFile, "read_row_groups", spy)
+    session_group = pd.read_parquet(FEATURES_PATH, columns=["session_group"])["session_group"].iloc[-1]
+    get_feature_store.cache_clear()
+    try:
+        features = get_features(session_group)
+        store = get_feature_store()
+
+        assert features[0]["session_group"] == session_group
+        assert pq.read_metadata(FEATURES_PATH).num_row_groups > 1
+        assert read == [[pq.read_metadata(FEATURES_PATH).num_row_groups - 1]]
+        assert store.file_lookups == 1
+        assert store._state is None
+    finally:
+        get_feature_store.cache_clear()
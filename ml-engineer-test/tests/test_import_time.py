@@ -0,0 +1,65 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from typer.testing import CliRunner
+from message import main
+from message.config import BASE_DIR
+
+# Cold import of the CLI, in ms; typer alone is ~20ms, pandas alone ~200ms
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("MESSAGE_IMPORT_TIME_BUDGET_MS", 150))
+
+# Loaded by the commands that use them, never by starting the CLI
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "duckdb", "openai", "aiohttp", "tiktoken", "pydantic_settings"]
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+
+
+def test_cli_import_skips_heavy_dependencies():
+    """Test if importing the CLI loads none of the heavy dependencies and creates no directories."""
+    code = (
+        "import json, pathlib, sys\n"
+        "def mkdir(*args, **kwargs): raise AssertionError('mkdir at import time')\n"
+        "pathlib.Path.mkdir = mkdir\n"
+        "import message.main\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    modules = set(json.loads(run_python("-c", code).stdout))
+
+    assert [module for module in HEAVY_MODULES if module in modules] == []
+
+
+def test_cli_import_time_budget():
+    """Test if a cold `import message.main` stays within IMPORT_TIME_BUDGET_MS (best of 3 runs)."""
+    timings = []
+    for _ in range(3):
+        stderr = run_python("-X", "importtime", "-c", "import message.main").stderr
+        # "import time: self [us] | cumulative | imported package"
+        cumulative = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| message\.main$", stderr, re.MULTILINE)
+        timings.append(int(cumulative.group(1)) / 1000)
+
+    assert min(timings) < IMPORT_TIME_BUDGET_MS, f"import message.main took {min(timings):.0f}ms"
+
+
+def test_get_message_command_runs_the_coroutine():
+    """Test if `message get-message` runs get_message to completion, as a cron job would start it."""
+    result = run_python("-c", "from message.main import app; app(['get-message', 'missing'])")
+
+    assert "No session data found for session_group: missing" in result.stdout
+    assert "never awaited" not in result.stderr
+
+
+def test_get_message_command_prints_the_message(monkeypatch):
+    """Test if `message get-message` prints the generated message."""
+
+    async def fake_get_message(session_group):
+        return f"Hello {session_group}"
+
+    monkeypatch.setattr(main, "_get_message", fake_get_message)
+    result = CliRunner().invoke(main.app, ["get-message", "sg_1"])
+
+    assert result.exit_code == 0
+    assert result.stdout == "Hello sg_1\n"
@@ -0,0 +1,109 @@
+import pandas as pd
+import pytest
+from pathlib import Path
+from typer.testing import CliRunner
+from message import incremental
+from message.config import QUERIES_DIR
+from message.engine import DuckDBSession
+from message.incremental import MANIFEST_FILENAME, transform_features_incremental
+from message.main import app
+from message.synthetic import generate_exercise_results
+
+
+def full_transform(exercise_results: pd.DataFrame) -> pd.DataFrame:
+    """Runs features.sql over every row, as transform_features_sql does."""
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+    return con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+
+
+def assert_same_features(result: pd.DataFrame, expected: pd.DataFrame):
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_incremental_materializes_only_new_and_changed_groups(tmp_path):
+    """Test that a second run aggregates only the delta and merges it into the dataset."""
+
+    history = generate_exercise_results(n_sessions=200, exercises_per_session=5, seed=1)
+    source = Path(tmp_path, "exercise_results.parquet")
+    dataset_dir = Path(tmp_path, "features")
+
+    # First run materializes everything
+    history.to_parquet(source)
+    assert transform_features_incremental(source, dataset_dir) == 200
+    assert_same_features(pd.read_parquet(dataset_dir), full_transform(history))
+
+    # Nothing new, nothing to do
+    assert transform_features_incremental(source, dataset_dir) == 0
+
+    # 10 new sessions plus one extra exercise for an already materialized session
+    new_sessions = generate_exercise_results(n_sessions=10, exercises_per_session=5, seed=2)
+    new_sessions["session_group"] = "new_" + new_sessions["session_group"]
+    late_exercise = history[history["session_group"] == "sg_7"].tail(1).copy()
+    late_exercise["wrong_repeats"] = 100
+    delta = pd.concat([new_sessions, late_exercise], ignore_index=True)
+    delta["session_exercise_result_id"] = history["session_exercise_result_id"].max() + 1 + delta.index
+
+    everything = pd.concat([history, delta], ignore_index=True)
+    everything.to_parquet(source)
+    assert transform_features_incremental(source, dataset_dir) == 11
+
+    result = pd.read_parquet(dataset_dir)
+    assert result["session_group"].is_unique
+    assert_same_features(result, full_transform(everything))
+
+    manifest = pd.read_parquet(Path(dataset_dir, MANIFEST_FILENAME)).set_index("session_group")
+    assert manifest.loc["sg_7", "part"] == manifest.loc["new_sg_0", "part"] == "part-00001.parquet"
+    assert manifest.loc["sg_8", "part"] == "part-00000.parquet"
+
+
+@pytest.mark.parametrize("changed_sessions", [["sg_7"], [f"sg_{i}" for i in range(50)]], ids=["rewrite", "delete"])
+def test_incremental_recovers_from_a_failed_run(tmp_path, monkeypatch, changed_sessions):
+    """Test that a run dying between the part write and the manifest write is redone cleanly.
+
+    The failed run has already written its part and rewritten (or deleted,
+    when every group of it changed) the old part.
+    """
+
+    history = generate_exercise_results(n_sessions=50, exercises_per_session=5, seed=1)
+    source = Path(tmp_path, "exercise_results.parquet")
+    dataset_dir = Path(tmp_path, "features")
+    history.to_parquet(source)
+    transform_features_incremental(source, dataset_dir)
+
+    late_exercises = history[history["session_group"].isin(changed_sessions)].groupby("session_group").tail(1).copy()
+    late_exercises["wrong_repeats"] = 100
+    late_exercises["session_exercise_result_id"] = history["session_exercise_result_id"].max() + 1 + range(len(late_exercises))
+    everything = pd.concat([history, late_exercises], ignore_index=True)
+    everything.to_parquet(source)
+
+    def crash(path, write):
+        raise RuntimeError("killed before the manifest was written")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(incremental, "replace_file", crash)
+        with pytest.raises(RuntimeError):
+            transform_features_incremental(source, dataset_dir)
+    assert Path(dataset_dir, "part-00001.parquet").exists()
+
+    assert transform_features_incremental(source, dataset_dir) == len(changed_sessions)
+
+    result = pd.read_parquet(dataset_dir)
+    assert result["session_group"].is_unique
+    assert_same_features(result, full_transform(everything))
+    manifest = pd.read_parquet(Path(dataset_dir, MANIFEST_FILENAME))
+    assert sorted(path.name for path in dataset_dir.glob("part-*.parquet")) == sorted(manifest["part"].unique())
+
+
+def test_transform_rejects_incremental_with_py_engine(monkeypatch):
+    """Test if `transform --engine py --incremental` is refused instead of running the SQL query."""
+    monkeypatch.setattr(incremental, "transform_features_incremental", lambda *args, **kwargs: pytest.fail("ran"))
+
+    result = CliRunner().invoke(app, ["transform", "--engine", "py", "--incremental"], env={"COLUMNS": "200"})
+
+    assert result.exit_code == 2
+    assert "Invalid value for '--incremental': only the sql engine has an incremental mode." in result.output
@@ -0,0 +1,58 @@
+import asyncio
+from message.feature_store import get_feature_store
+from message.loadtest import latency_summary, run_loadtest
+from message.main import get_message
+from message.metrics import get_metrics
+from message.model import get_chat_model
+from message.stub_server import running_stub_server
+
+
+def test_loadtest_get_message(use_stub, monkeypatch):
+    """Test a short load test of get_message against the stub backend."""
+    monkeypatch.setenv("COMPLETION_BACKEND", "stub")
+    session_groups = get_feature_store().column("session_group")[:20]
+
+    async def main(stats):
+        async with running_stub_server(stats=stats, latency=0.05, latency_distribution="exponential", seed=0) as api_base:
+            use_stub(api_base)
+            get_chat_model().cache = None
+            try:
+                return await run_loadtest(get_message, session_groups, rps=40, duration=0.5)
+            finally:
+                await get_chat_model().aclose()
+
+    stats = {}
+    report = asyncio.run(main(stats))
+
+    assert report["requests"] == report["ok"] == 20
+    assert report["errors"] == {}
+    assert stats["requests"] == 20
+    assert report["achieved_rps"] > 0
+    assert report["metrics"]["message_stage_seconds"]['{stage="completion"}']["count"] == 20
+    assert report["latency"]["p50"] <= report["latency"]["p95"] <= report["latency"]["p99"] <= report["latency"]["max"]
+
+
+def test_loadtest_counts_errors():
+    """Test if failed requests are counted by type and kept out of the latency quantiles."""
+
+    async def send(session_group):
+        if session_group == "bad":
+            raise RuntimeError(session_group)
+        await asyncio.sleep(0.01)
+
+    get_metrics().counter("before_loadtest_total").inc()
+    report = asyncio.run(run_loadtest(send, ["good", "bad"], rps=100, duration=0.2))
+
+    assert (report["requests"], report["ok"], report["errors"]) == (20, 10, {"RuntimeError": 10})
+    assert report["latency"]["p50"] >= 0.01
+    # The run has its own summary and leaves the process-wide metrics alone
+    assert "before_loadtest_total" not in report["metrics"]
+    assert get_metrics().counter("before_loadtest_total").value() == 1
+
+
+def test_latency_summary():
+    """Test the exact quantiles of the report."""
+    summary = latency_summary(range(101))
+
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (50, 95, 99, 100)
+    assert latency_summary([]) == {}
@@ -0,0 +1,56 @@
+import asyncio
+from message.metrics import COST, STAGE_SECONDS, MetricsRegistry, get_metrics, scoped_metrics
+
+
+def test_histogram_quantiles():
+    """Test if quantiles are interpolated inside the bucket that holds them."""
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("latency_seconds", buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value, stage="completion")
+
+    assert histogram.count(stage="completion") == 4
+    assert histogram.quantile(0.5, stage="completion") == 1.5
+    assert histogram.quantile(1.0, stage="completion") == 4.0
+    assert histogram.quantile(0.5, stage="unknown") is None
+
+
+def test_prometheus_export():
+    """Test the Prometheus text format of counters and histograms."""
+    metrics = MetricsRegistry()
+    metrics.counter(COST, "Estimated cost.").inc(0.5, model="gpt")
+    metrics.counter(COST).inc(0.25, model="gpt")
+    with metrics.time_stage("prompt_render"):
+        pass
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert "# TYPE message_cost_dollars_total counter" in lines
+    assert 'message_cost_dollars_total{model="gpt"} 0.75' in lines
+    assert f"# TYPE {STAGE_SECONDS} histogram" in lines
+    assert f'{STAGE_SECONDS}_bucket{{stage="prompt_render",le="+Inf"}} 1' in lines
+    assert f'{STAGE_SECONDS}_count{{stage="prompt_render"}} 1' in lines
+    assert metrics.summary()[COST] == {'{model="gpt"}': 0.75}
+
+
+def test_scoped_metrics():
+    """Test if a scope sees what is recorded inside it, tasks included, and the process-wide registry sees everything."""
+    process = get_metrics()
+    before = process.counter("scoped_total").value()
+
+    async def record():
+        get_metrics().counter("scoped_total").inc()
+        with get_metrics().time_stage("scoped"):
+            pass
+
+    get_metrics().counter("scoped_total").inc()
+    with scoped_metrics() as outer:
+        asyncio.run(record())
+        with scoped_metrics() as inner:
+            asyncio.run(asyncio.wait_for(record(), timeout=1))
+    get_metrics().counter("scoped_total").inc()
+
+    assert process.counter("scoped_total").value() == before + 4
+    assert outer.counter("scoped_total").value() == 2
+    assert inner.counter("scoped_total").value() == 1
+    assert inner.histogram(STAGE_SECONDS).count(stage="scoped") == 1
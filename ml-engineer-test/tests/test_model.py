@@ -0,0 +1,86 @@
+import asyncio
+
+import tiktoken
+from message import model
+from message.model import ChatModel, generate_message, get_chat_model, group_tokens
+from message.stub_server import STUB_CONTENT, running_stub_server
+
+
+def test_shared_model_reuses_connections(use_stub):
+    """Test if sequential and concurrent messages go through one pooled client."""
+
+    async def main(stats):
+        async with running_stub_server(stats=stats) as api_base:
+            use_stub(api_base)
+
+            chat_model = get_chat_model()
+            assert get_chat_model() is chat_model
+
+            messages = [await generate_message(f"Hey there {i}") for i in range(10)]
+            messages += await asyncio.gather(*(generate_message(f"Hi there {i}") for i in range(10)))
+            await chat_model.aclose()
+            return messages
+
+    stats = {}
+    messages = asyncio.run(main(stats))
+
+    assert messages == [STUB_CONTENT] * 20
+    assert stats["requests"] == 20
+    # One keep-alive connection for the sequential calls, at most 10 for the concurrent ones
+    assert stats["connections"] <= 10
+
+
+def test_identical_prompts_are_cached(use_stub):
+    """Test if identical prompts hit the completion cache unless it is bypassed."""
+
+    async def main(stats):
+        async with running_stub_server(stats=stats) as api_base:
+            use_stub(api_base)
+            chat_model = get_chat_model()
+
+            messages = [await generate_message("Same prompt") for _ in range(3)]
+            messages.append(await generate_message("Same prompt", use_cache=False))
+            messages.append(await generate_message("Other prompt"))
+            await chat_model.aclose()
+            return messages, chat_model.cache.stats
+
+    stats = {}
+    messages, cache_stats = asyncio.run(main(stats))
+
+    assert messages == [STUB_CONTENT] * 5
+    assert stats["requests"] == 3
+    assert (cache_stats["hits"], cache_stats["misses"], cache_stats["bypassed"]) == (2, 2, 1)
+
+
+def byte_level_encoding():
+    """Offline tiktoken encoding with one token per byte."""
+    return tiktoken.Encoding(
+        name="byte_level",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+def test_count_tokens_batch(monkeypatch):
+    """Test if batch token counts match counting each text on its own."""
+    monkeypatch.setattr(model, "get_encoding", lambda model_name: byte_level_encoding())
+    texts = ["Hey there", "", "Olá, como estás?"] * 100
+
+    assert ChatModel.count_tokens_batch(texts, num_threads=4) == [ChatModel.count_tokens(text) for text in texts]
+
+
+def test_static_prompt_tokens_are_memoized(monkeypatch):
+    """Test if a static prompt is tokenized once, and usage from the API is not re-counted."""
+    counted = []
+    monkeypatch.setattr(ChatModel, "count_tokens", staticmethod(lambda text, model=None: counted.append(text) or 2))
+    monkeypatch.setattr(model, "STATIC_TOKEN_COUNTS", {})
+    chat_model = ChatModel.__new__(ChatModel)
+
+    for i in range(3):
+        assert group_tokens("response", "system prompt", f"user {i}", chat_model) == (4, 2)
+    assert counted.count("system prompt") == 1
+
+    counted.clear()
+    assert group_tokens("response", "system prompt", "user", chat_model, prompt_tokens=10, completion_tokens=5) == (10, 5)
+    assert counted == []
@@ -0,0 +1,75 @@
+import pandas as pd
+from pathlib import Path
+from message.config import QUERIES_DIR
+from message.data import compute_features_py
+from message.engine import DuckDBSession
+from message.incremental import MANIFEST_FILENAME
+from message.parallel import transform_features_parallel
+from message.synthetic import generate_exercise_results
+
+
+def sort_features(features: pd.DataFrame) -> pd.DataFrame:
+    # ✅ Sort before comparison
+    return features.sort_values(by=["session_group"]).reset_index(drop=True)
+
+
+def test_parallel_transform_matches_single_process(tmp_path):
+    """Test if the hash-partitioned transform gives the same features with both engines."""
+
+    exercise_results = generate_exercise_results(n_sessions=300, exercises_per_session=5, seed=4)
+    source = Path(tmp_path, "exercise_results.parquet")
+    # Several row groups, so the partitioning runs as several tasks
+    exercise_results.to_parquet(source, row_group_size=400)
+    dataset_dir = Path(tmp_path, "features")
+
+    # NumPy engine is deterministic, the partitioned result must be identical
+    assert transform_features_parallel(source, dataset_dir, workers=2, n_partitions=5, engine="py") == 300
+    pd.testing.assert_frame_equal(
+        sort_features(pd.read_parquet(dataset_dir)), sort_features(compute_features_py(exercise_results))
+    )
+
+    manifest = pd.read_parquet(Path(dataset_dir, MANIFEST_FILENAME))
+    assert manifest["session_group"].is_unique and len(manifest) == 300
+    assert manifest["part"].nunique() == 5
+
+    # SQL engine
+    assert transform_features_parallel(source, dataset_dir, workers=2, n_partitions=3) == 300
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+    expected = con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+    pd.testing.assert_frame_equal(
+        sort_features(pd.read_parquet(dataset_dir)),
+        sort_features(expected),
+        check_dtype=False,
+    )
+    assert len(list(dataset_dir.glob("part-*.parquet"))) == 3
+
+
+def test_parallel_transform_empty_input(tmp_path):
+    """Test if an input without rows gives no features and an empty manifest."""
+
+    source = Path(tmp_path, "exercise_results.parquet")
+    generate_exercise_results(n_sessions=10).head(0).to_parquet(source)
+    dataset_dir = Path(tmp_path, "features")
+
+    assert transform_features_parallel(source, dataset_dir, workers=1, n_partitions=2) == 0
+    assert list(dataset_dir.glob("part-*.parquet")) == []
+    assert pd.read_parquet(Path(dataset_dir, MANIFEST_FILENAME)).empty
+
+
+def test_parallel_transform_null_session_group(tmp_path):
+    """Test if rows without a session group in several row groups still make one group."""
+
+    exercise_results = generate_exercise_results(n_sessions=100, exercises_per_session=4, seed=5)
+    exercise_results.loc[::40, "session_group"] = None
+    source = Path(tmp_path, "exercise_results.parquet")
+    exercise_results.to_parquet(source, row_group_size=50)
+    dataset_dir = Path(tmp_path, "features")
+
+    transform_features_parallel(source, dataset_dir, workers=2, n_partitions=4, engine="py")
+
+    result = pd.read_parquet(dataset_dir)
+    assert result["session_group"].isna().sum() == 1
+    pd.testing.assert_frame_equal(
+        sort_features(result), sort_features(compute_features_py(exercise_results)), check_dtype=False
+    )
@@ -0,0 +1,59 @@
+import os
+import pytest
+from pathlib import Path
+from message.data import SESSION_CONTEXT_FIELDS, fetch_session_data
+from message.feature_store import get_feature_store
+from message.prompt_manager import PROMPT_DIR, CompiledPrompt, PromptRegistry
+
+
+def test_session_context_fields_match_fetch_session_data():
+    """Test if the declared schema matches the keys fetch_session_data returns."""
+    session_group = get_feature_store().column("session_group")[0]
+
+    assert list(fetch_session_data(session_group)) == SESSION_CONTEXT_FIELDS
+
+
+def test_render_matches_str_format():
+    """Test if compiled templates render exactly like str.format on real sessions."""
+    registry = PromptRegistry(auto_reload=False)
+
+    for session_group in get_feature_store().column("session_group")[:50]:
+        context = fetch_session_data(session_group)
+        for name in ("scenario_ok.txt", "scenario_nok.txt"):
+            text = Path(PROMPT_DIR, name).read_text(encoding="utf-8")
+            assert registry.render(name, context) == text.format(**context)
+
+
+def test_compiled_prompt_escapes_and_conversions():
+    """Test if escaped braces, conversions and format specs behave like str.format."""
+    text = "{{literal}} {name!r} {value:.2f}"
+    prompt = CompiledPrompt("test.txt", text)
+
+    assert prompt.fields == {"name", "value"}
+    assert prompt.render({"name": "Ann", "value": 0.5}) == text.format(name="Ann", value=0.5)
+
+
+def test_missing_field_fails_at_load(tmp_path):
+    """Test if a template using a field outside the session context is rejected at load time."""
+    Path(tmp_path, "scenario_ok.txt").write_text("Pain {pain}, mood {mood}")
+
+    with pytest.raises(ValueError, match="mood"):
+        PromptRegistry(str(tmp_path))
+
+
+def test_hot_reload(tmp_path):
+    """Test if a changed template is picked up, and an invalid change keeps the old one."""
+    path = Path(tmp_path, "scenario_ok.txt")
+    path.write_text("Pain {pain}")
+    registry = PromptRegistry(str(tmp_path), reload_interval=0)
+
+    def rewrite(text, bump):
+        path.write_text(text)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 1_000_000_000))
+
+    rewrite("Fatigue {fatigue}", bump=1)
+    assert registry.render("scenario_ok.txt", {"fatigue": "3"}) == "Fatigue 3"
+
+    rewrite("Mood {mood}", bump=2)
+    assert registry.render("scenario_ok.txt", {"fatigue": "3"}) == "Fatigue 3"
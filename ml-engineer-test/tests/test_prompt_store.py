@@ -0,0 +1,116 @@
+import asyncio
+import math
+import os
+import pandas as pd
+import pytest
+from pathlib import Path
+from typer.testing import CliRunner
+from message import data, prompt_store
+from message.data import fetch_session_data
+from message.feature_store import FEATURES_PATH, write_features
+from message.main import app, get_message
+from message.metrics import STAGE_SECONDS, get_metrics
+from message.model import ChatModel, get_chat_model
+from message.prompt_manager import build_user_prompt
+from message.prompt_store import prompts_are_current, read_prompts_summary, render_prompts_file
+from message.stub_server import running_stub_server
+from message.synthetic import generate_exercise_results
+
+
+@pytest.fixture
+def features_path(tmp_path, monkeypatch):
+    """Write 50 sessions of the real features, plus copies of 5 of them under new session groups."""
+    monkeypatch.setattr(
+        ChatModel, "count_tokens_batch", staticmethod(lambda texts, model=None: [len(text.split()) for text in texts])
+    )
+    monkeypatch.setattr(ChatModel, "count_tokens", staticmethod(lambda text, model=None: len(text.split())))
+    frame = pd.read_parquet(FEATURES_PATH).head(50)
+    copies = frame.head(5).assign(session_group=[f"copy-{i}" for i in range(5)])
+    path = Path(tmp_path, "features.parquet")
+    write_features(pd.concat([frame, copies], ignore_index=True), path)
+    return path
+
+
+def test_render_prompts_file(features_path, tmp_path):
+    """Test if every session gets the prompt get_message would render, deduplicated by hash."""
+    output = Path(tmp_path, "prompts.parquet")
+
+    summary = render_prompts_file(features_path, output)
+
+    prompts = pd.read_parquet(output).set_index("session_group")
+    originals = pd.read_parquet(FEATURES_PATH).head(5)["session_group"].tolist()
+    # ✅ Null features must render the same on both paths
+    assert pd.read_parquet(features_path)["first_exercise_skipped"].isna().any()
+    for session_group, row in prompts.iterrows():
+        original = originals[int(session_group[5:])] if session_group.startswith("copy-") else session_group
+        assert row["user_prompt"] == build_user_prompt(fetch_session_data(original))
+        assert row["prompt_tokens"] == len(row["user_prompt"].split())
+
+    assert summary["sessions"] == 55
+    assert summary["unique_prompts"] == prompts["prompt_hash"].nunique() == (~prompts["duplicate"]).sum()
+    for i, original in enumerate(originals):
+        assert prompts.loc[[original, f"copy-{i}"], "duplicate"].sum() == 1
+    assert summary["dedup_ratio"] == pytest.approx(1 - summary["unique_prompts"] / 55)
+    assert summary["unique_estimated_cost"] < summary["estimated_cost"]
+    assert read_prompts_summary(output) == summary
+
+
+def test_render_prompts_reads_transform_output(monkeypatch, tmp_path):
+    """Test if `message render-prompts` renders the features file `message transform` writes."""
+    written, rendered = [], []
+    monkeypatch.setattr(data, "write_features", lambda features, path, compression: written.append(path))
+    monkeypatch.setattr(
+        prompt_store, "render_prompts_file", lambda features_path, output, compression: rendered.append(features_path)
+    )
+
+    data.transform_features_py(generate_exercise_results(n_sessions=5))
+    CliRunner().invoke(app, ["render-prompts", "--output", str(Path(tmp_path, "prompts.parquet"))])
+
+    assert written == rendered == [FEATURES_PATH]
+
+
+def test_prompts_are_current(features_path, tmp_path, monkeypatch):
+    """Test if a prompts file goes stale when the features file changes."""
+    output = Path(tmp_path, "prompts.parquet")
+    assert not prompts_are_current(output, features_path)
+
+    render_prompts_file(features_path, output)
+    assert prompts_are_current(output, features_path)
+
+    stat = os.stat(features_path)
+    os.utime(features_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not prompts_are_current(output, features_path)
+
+    # Files rendered with another value formatting are stale too
+    render_prompts_file(features_path, output)
+    monkeypatch.setattr(prompt_store, "PROMPTS_FORMAT_VERSION", prompt_store.PROMPTS_FORMAT_VERSION + 1)
+    assert not prompts_are_current(output, features_path)
+
+
+def test_get_message_sends_rendered_prompt(use_stub, features_path, tmp_path, monkeypatch):
+    """Test if get_message looks the prompt up instead of rendering it when the prompts file is current."""
+    output = Path(tmp_path, "prompts.parquet")
+    render_prompts_file(features_path, output)
+    monkeypatch.setattr(prompt_store, "PROMPTS_PATH", output)
+    monkeypatch.setattr(prompt_store, "FEATURES_PATH", features_path)
+    monkeypatch.setattr(prompt_store, "_last_check", {"at": -math.inf, "current": False})
+    prompt_store.get_prompt_store.cache_clear()
+    # ✅ Only in the prompts file, rendering it would find no features
+    session_group = "copy-0"
+
+    async def main():
+        async with running_stub_server() as api_base:
+            use_stub(api_base)
+            get_metrics().reset()
+            try:
+                return await get_message(session_group)
+            finally:
+                await get_chat_model().aclose()
+
+    try:
+        assert asyncio.run(main())
+    finally:
+        prompt_store.get_prompt_store.cache_clear()
+    stages = get_metrics().histogram(STAGE_SECONDS)
+    assert stages.count(stage="prompt_lookup") == 1
+    assert stages.count(stage="feature_lookup") == 0
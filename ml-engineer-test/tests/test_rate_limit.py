@@ -0,0 +1,189 @@
+import asyncio
+import time
+import pytest
+from openai.error import APIError, RateLimitError
+from message import model, rate_limit
+from message.backends import Completion, CompletionBackend, StubBackend
+from message.model import ChatModel
+from message.rate_limit import CompletionScheduler, retry_after
+from message.stub_server import running_stub_server
+
+MESSAGES = [{"role": "system", "content": "Be nice"}, {"role": "user", "content": "Hey there"}]
+
+
+@pytest.fixture
+def make_model(use_stub, monkeypatch):
+    """Builds an uncached ChatModel on the given backend and scheduler."""
+    monkeypatch.setenv("COMPLETION_CACHE_SIZE", "0")
+
+    def make(backend, scheduler, max_rate_limit_wait=60.0):
+        chat_model = ChatModel(backend=backend, scheduler=scheduler)
+        chat_model.max_rate_limit_wait = max_rate_limit_wait
+        return chat_model
+
+    return make
+
+
+def send_all(chat_model, n_requests):
+    async def main():
+        results = await asyncio.gather(
+            *(chat_model.get_completion(use_cache=False, model="gpt-4-turbo-preview", messages=MESSAGES) for _ in range(n_requests)),
+            return_exceptions=True,
+        )
+        await chat_model.aclose()
+        return results
+
+    return asyncio.run(main())
+
+
+def test_retry_after_header():
+    """Test if Retry-After is read from the 429 headers, in any case, seconds or milliseconds."""
+    assert retry_after(RateLimitError("429", headers={"Retry-After": "1.5"})) == 1.5
+    assert retry_after(RateLimitError("429", headers={"retry-after-ms": "200"})) == 0.2
+    assert retry_after(RateLimitError("429", headers={"Retry-After": "Wed, 21 Oct 2015"})) is None
+    assert retry_after(RateLimitError("429")) is None
+
+
+def test_pause_is_shared():
+    """Test if a 429 pauses every sender, not only the one that got it."""
+    scheduler = CompletionScheduler()
+
+    async def main():
+        scheduler.on_rate_limited(0.2)
+        start = time.monotonic()
+        await asyncio.gather(*(scheduler.acquire() for _ in range(5)))
+        return time.monotonic() - start
+
+    assert 0.2 <= asyncio.run(main()) < 0.4
+
+
+def test_queue_at_provider_limit(make_model):
+    """Test if requests above an unknown provider limit are queued and all succeed,
+    with the rate clamped to what the provider accepted."""
+
+    async def main(stats):
+        async with running_stub_server(stats=stats, rate_limit_rpm=3000) as api_base:
+            scheduler = CompletionScheduler(window=1.0)
+            chat_model = make_model(StubBackend(api_base), scheduler)
+            results = await asyncio.gather(
+                *(chat_model.get_completion(use_cache=False, model="gpt-4-turbo-preview", messages=MESSAGES) for _ in range(120)),
+                return_exceptions=True,
+            )
+            await chat_model.aclose()
+            return results, scheduler
+
+    stats = {}
+    results, scheduler = asyncio.run(main(stats))
+
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert scheduler.stats["rate_limited"] == stats["rate_limited"] > 0
+    assert scheduler.stats["clamps"] >= 1
+
+
+def test_clamp_and_probe(monkeypatch):
+    """Test if a 429 clamps the rate to the accepted rate, no lower than the share of the
+    send rate, at most once per window, then probes back up to the configured limit."""
+    now = [0.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    scheduler = CompletionScheduler(requests_per_minute=12_000, window=1.0, decrease=0.9)
+
+    # 100 sends and 50 answers in the last second: 6000 sent, 3000 accepted per minute
+    for i in range(100):
+        now[0] = i / 100
+        asyncio.run(scheduler.acquire())
+        if i % 2:
+            scheduler.on_success()
+    now[0] = 1.0
+    assert scheduler.on_rate_limited(0.5) == 0.5
+    assert scheduler.request_rate == pytest.approx(0.9 * 6000)
+    scheduler.on_rate_limited()
+    assert scheduler.stats == {"rate_limited": 2, "clamps": 1}
+
+    now[0] = 11.0
+    scheduler.on_success()
+    assert scheduler.request_rate == pytest.approx(0.9 * 6000 * 1.01**10)
+    now[0] = 100.0
+    scheduler.on_success()
+    assert scheduler.request_rate == 12_000
+
+
+def test_configured_limit_avoids_429s(make_model):
+    """Test if a request budget under the provider limit sends everything without a 429."""
+
+    async def main(stats):
+        async with running_stub_server(stats=stats, rate_limit_rpm=6000) as api_base:
+            chat_model = make_model(StubBackend(api_base), CompletionScheduler(requests_per_minute=5400))
+            results = await asyncio.gather(
+                *(chat_model.get_completion(use_cache=False, model="gpt-4-turbo-preview", messages=MESSAGES) for _ in range(150)),
+                return_exceptions=True,
+            )
+            await chat_model.aclose()
+            return results
+
+    stats = {}
+    results = asyncio.run(main(stats))
+
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert stats["rate_limited"] == 0
+
+
+class FlakyBackend(CompletionBackend):
+    """Fails with the given errors, then answers with fixed usage."""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def complete(self, **kwargs) -> Completion:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return Completion("Hi", prompt_tokens=10, completion_tokens=5)
+
+
+def test_server_errors_are_retried(make_model, monkeypatch):
+    """Test if 5xx errors are retried and client errors are not."""
+    monkeypatch.setattr(model, "RETRY_BACKOFF", 0.0)
+
+    backend = FlakyBackend(APIError("Bad gateway", http_status=502))
+    assert send_all(make_model(backend, CompletionScheduler()), 1) == ["Hi"]
+    assert backend.calls == 2
+
+    backend = FlakyBackend(APIError("Bad request", http_status=400))
+    assert isinstance(send_all(make_model(backend, CompletionScheduler()), 1)[0], APIError)
+    assert backend.calls == 1
+
+
+def test_rate_limit_gives_up_after_max_wait(make_model):
+    """Test if a request rate limited past the maximum wait fails instead of queueing forever."""
+    backend = FlakyBackend(*[RateLimitError("429", headers={"Retry-After": "0.05"}) for _ in range(100)])
+    chat_model = make_model(backend, CompletionScheduler(), max_rate_limit_wait=0.2)
+
+    assert isinstance(send_all(chat_model, 1)[0], RateLimitError)
+    assert 3 <= backend.calls <= 6
+
+
+def test_token_budget_uses_estimates_and_usage(make_model, monkeypatch):
+    """Test if the token budget is taken from the estimate and settled with the reported usage."""
+    monkeypatch.setattr(model, "STATIC_TOKEN_COUNTS", {})
+    scheduler = CompletionScheduler(tokens_per_minute=6000)
+    chat_model = make_model(FlakyBackend(), scheduler)
+
+    assert ChatModel.estimate_tokens(MESSAGES) == 2 + 2 + model.EXPECTED_OUTPUT_TOKENS
+    assert send_all(chat_model, 2) == ["Hi", "Hi"]
+    # Each request used 15 tokens of the 6000 budget
+    assert scheduler.tokens._tokens == pytest.approx(6000 - 2 * 15, abs=1)
+
+
+def test_rate_limited_attempts_refund_their_tokens(make_model, monkeypatch):
+    """Test if the tokens taken for an attempt refused with a 429 go back to the budget."""
+    monkeypatch.setattr(model, "STATIC_TOKEN_COUNTS", {})
+    scheduler = CompletionScheduler(tokens_per_minute=6000, backoff=0.0)
+    backend = FlakyBackend(*[RateLimitError("429", headers={"Retry-After": "0"}) for _ in range(5)])
+    chat_model = make_model(backend, scheduler)
+
+    assert send_all(chat_model, 1) == ["Hi"]
+    assert backend.calls == 6
+    # Only the answered attempt counts, with its reported usage
+    assert scheduler.tokens._tokens == pytest.approx(6000 - 15, abs=1)
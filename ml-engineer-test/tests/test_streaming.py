@@ -0,0 +1,58 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from pathlib import Path
+from typer.testing import CliRunner
+from message import streaming
+from message.config import QUERIES_DIR
+from message.data import FEATURES_SINGLE_PASS_QUERY
+from message.engine import DuckDBSession
+from message.main import app
+from message.streaming import transform_features_streaming
+from message.synthetic import generate_exercise_results
+
+
+def test_streaming_transform_from_parquet_directory(tmp_path):
+    """Test if the streaming transform over a directory of parquet files matches the in-memory transform."""
+
+    exercise_results = generate_exercise_results(n_sessions=300, exercises_per_session=5, seed=3)
+    table = pa.Table.from_pandas(exercise_results)
+    source_dir = Path(tmp_path, "exercise_results")
+    source_dir.mkdir()
+    # Slices of one table, so both files share the schema
+    for i, part in enumerate((table.slice(0, 700), table.slice(700))):
+        pq.write_table(part, Path(source_dir, f"part-{i}.parquet"))
+    output = Path(tmp_path, "features.parquet")
+
+    n_groups = transform_features_streaming(
+        source_dir,
+        output,
+        query_filename=FEATURES_SINGLE_PASS_QUERY,
+        memory_limit="256MB",
+        temp_directory=Path(tmp_path, "spill"),
+        threads=2,
+    )
+
+    con = DuckDBSession()
+    con.register("exercise_results", table)
+    expected = con.execute(Path(QUERIES_DIR, FEATURES_SINGLE_PASS_QUERY).read_text()).fetchdf()
+    result = pd.read_parquet(output)
+
+    assert n_groups == 300
+
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_transform_rejects_streaming_with_py_engine(monkeypatch):
+    """Test if `transform --engine py --streaming` is refused instead of running the SQL query."""
+    monkeypatch.setattr(streaming, "transform_features_streaming", lambda *args, **kwargs: pytest.fail("ran"))
+
+    result = CliRunner().invoke(app, ["transform", "--engine", "py", "--streaming"], env={"COLUMNS": "200"})
+
+    assert result.exit_code == 2
+    assert "Invalid value for '--streaming': only the sql engine has a streaming mode." in result.output
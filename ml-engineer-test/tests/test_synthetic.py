@@ -0,0 +1,48 @@
+from pathlib import Path
+import pandas as pd
+from message.config import QUERIES_DIR
+from message.data import compute_features_py
+from message.engine import DuckDBSession
+from message.synthetic import EXERCISE_NAMES, generate_exercise_results
+
+
+def test_skewed_sessions_and_leave_reasons():
+    """Test if skew makes a few long sessions and hot exercises, keeping the row count,
+    and leave reasons follow the given weights."""
+    exercise_results = generate_exercise_results(
+        n_sessions=2_000,
+        exercises_per_session=10,
+        leave_exercise_rate=0.5,
+        leave_exercise_reasons={"pain": 3, "tired": 1},
+        leave_session_rate=1.0,
+        leave_session_reasons={"system_problem": 1},
+        skew=1.1,
+        seed=3,
+    )
+    sizes = exercise_results.groupby("session_group").size()
+
+    assert len(exercise_results) == 20_000 and len(sizes) == 2_000
+    assert sizes.min() >= 1 and sizes.max() > 20 * sizes.median()
+    # ✅ exercise_order still counts 1, 2, ... within each session
+    assert (exercise_results.groupby("session_group")["exercise_order"].max() == sizes).all()
+    names = exercise_results["exercise_name"].value_counts(normalize=True)
+    assert names.index[0] == EXERCISE_NAMES[0] and names.iloc[0] > 2 / len(EXERCISE_NAMES)
+
+    reasons = exercise_results["leave_exercise"].value_counts(normalize=True)
+    assert set(reasons.index) == {"pain", "tired"}
+    assert abs(reasons["pain"] - 0.75) < 0.02
+    assert exercise_results["leave_session"].eq("system_problem").all()
+
+
+def test_engines_agree_on_skewed_data():
+    """Test the NumPy engine against the single-scan query on skewed synthetic data."""
+    exercise_results = generate_exercise_results(n_sessions=500, skew=1.3, seed=5)
+
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+    expected = con.execute(Path(QUERIES_DIR, "features_single_pass.sql").read_text()).fetchdf()
+    result = compute_features_py(exercise_results)
+
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
@@ -1,8 +1,12 @@
 import pytest
-import duckdb
 import pandas as pd
 from pathlib import Path
+from typer.testing import CliRunner
 from message.config import DATA_DIR, QUERIES_DIR
+from message.data import compute_features_py
+from message.engine import DuckDBSession
+from message.main import app
+from message.synthetic import generate_exercise_results
 
 
 @pytest.fixture
@@ -21,7 +25,7 @@ def test_session_transformation(mock_data):
     """Test if session-level aggregation works correctly."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -63,7 +67,7 @@ def test_prescribed_repeats(mock_data):
     """Test if prescribed_repeats is correctly summed."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -93,7 +97,7 @@ def test_training_time(mock_data):
     """Test if training_time is correctly summed per session_group."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -124,7 +128,7 @@ def test_perc_correct_repeats(mock_data):
     """Test if `perc_correct_repeats` is correctly computed per session_group."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -156,7 +160,7 @@ def test_number_exercises(mock_data):
     """Test if `number_exercises` is correctly counted per session_group."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -187,7 +191,7 @@ def test_number_of_distinct_exercises(mock_data):
     """Test if `number_of_distinct_exercises` is correctly counted per session_group."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -218,7 +222,7 @@ def test_exercise_with_most_incorrect(mock_data):
     """Test if `exercise_with_most_incorrect` is correctly identified."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -249,11 +253,28 @@ def test_exercise_with_most_incorrect(mock_data):
     # Check results
     pd.testing.assert_frame_equal(result, expected, check_dtype=False)
 
+@pytest.mark.parametrize("query_filename", ["features.sql", "features_single_pass.sql"])
+def test_exercise_with_most_incorrect_ties(mock_data, query_filename):
+    """Test if ties in `exercise_with_most_incorrect` go to the smallest exercise name, on every run."""
+
+    # "lunges" now has as many wrong repeats in session A as "squat"
+    tie = mock_data.iloc[[0]].assign(exercise_name="lunges", wrong_repeats=10, session_exercise_result_id=4)
+    exercise_results = pd.concat([mock_data, tie], ignore_index=True)
+
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+    sql_query = Path(QUERIES_DIR, query_filename).read_text()
+
+    for _ in range(5):
+        result = con.execute(sql_query).fetchdf().set_index("session_group")
+        assert result.loc["A", "exercise_with_most_incorrect"] == "lunges"
+
+
 def test_first_exercise_skipped(mock_data):
     """Test if `first_exercise_skipped` is correctly identified per session."""
     
     # Initialize DuckDB
-    con = duckdb.connect()
+    con = DuckDBSession()
 
     # Register the mock data as a DuckDB table
     con.register("exercise_results", mock_data)
@@ -278,4 +299,164 @@ def test_first_exercise_skipped(mock_data):
     expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
 
     # ✅ Check results
-    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
\ No newline at end of file
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_single_pass_matches_features_sql(mock_data):
+    """Test if the single-scan query produces the same frame as features.sql."""
+
+    con = DuckDBSession()
+    con.register("exercise_results", mock_data)
+
+    expected = con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+    result = con.execute(Path(QUERIES_DIR, "features_single_pass.sql").read_text()).fetchdf()
+
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_single_pass_matches_features_sql_synthetic():
+    """Test the single-scan query against features.sql on a larger synthetic dataset."""
+
+    con = DuckDBSession()
+    con.register("exercise_results", generate_exercise_results(n_sessions=500, seed=1))
+
+    expected = con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+    result = con.execute(Path(QUERIES_DIR, "features_single_pass.sql").read_text()).fetchdf()
+
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_compute_features_py_matches_features_sql(mock_data):
+    """Test if the NumPy engine produces the same frame as features.sql."""
+
+    con = DuckDBSession()
+    con.register("exercise_results", mock_data)
+
+    expected = con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+    result = compute_features_py(mock_data)
+
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_compute_features_py_first_non_null(mock_data):
+    """Test if session-level columns take the first non-null value, like ANY_VALUE."""
+
+    mock_data.loc[0, ["pain", "leave_session"]] = [None, "tired"]
+
+    result = compute_features_py(mock_data).set_index("session_group")
+
+    assert result.loc["A", "pain"] == 2
+    assert result.loc["A", "leave_session"] == "tired"
+
+
+def test_compute_features_py_synthetic():
+    """Test the NumPy engine against the single-scan query on synthetic data,
+    and its deterministic tie-breaking for `exercise_with_most_incorrect`."""
+
+    exercise_results = generate_exercise_results(n_sessions=500, seed=2)
+
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+    expected = con.execute(Path(QUERIES_DIR, "features_single_pass.sql").read_text()).fetchdf()
+    result = compute_features_py(exercise_results)
+
+    # ✅ Sort before comparison
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    # Ties go to the lexicographically smallest exercise name
+    wrong = (
+        exercise_results.groupby(["session_group", "exercise_name"])["wrong_repeats"]
+        .sum()
+        .reset_index()
+        .sort_values(["session_group", "wrong_repeats", "exercise_name"], ascending=[True, False, True])
+        .drop_duplicates("session_group")
+        .reset_index(drop=True)
+    )
+    assert (wrong["wrong_repeats"] > 0).all()
+    assert result["exercise_with_most_incorrect"].tolist() == wrong["exercise_name"].tolist()
+
+
+def test_transform_rejects_single_pass_with_py_engine():
+    """Test if `transform --engine py --single-pass` is refused instead of ignoring --single-pass."""
+    result = CliRunner().invoke(app, ["transform", "--engine", "py", "--single-pass"], env={"COLUMNS": "200"})
+
+    assert result.exit_code == 2
+    assert "Invalid value for '--single-pass': only the sql engine has a single-pass query." in result.output
+
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+@pytest.mark.parametrize(
+    "exercise_results_path, features_expected_path",
+    [
+        # Small committed sample; its expected features come from the original
+        # features.sql (random tie-breaking), laid out like features_expected.parquet
+        (
+            Path(TEST_DATA_DIR, "exercise_results_sample.parquet"),
+            Path(TEST_DATA_DIR, "features_expected_sample.parquet"),
+        ),
+        pytest.param(
+            Path(DATA_DIR, "exercise_results.parquet"),
+            Path(DATA_DIR, "features_expected.parquet"),
+            marks=pytest.mark.skipif(
+                not Path(DATA_DIR, "exercise_results.parquet").exists(),
+                reason="data/exercise_results.parquet is not available",
+            ),
+        ),
+    ],
+    ids=["sample", "full"],
+)
+def test_features_sql_matches_features_expected(exercise_results_path, features_expected_path):
+    """Golden test: features.sql over the exercise results reproduces the expected features."""
+
+    exercise_results = pd.read_parquet(exercise_results_path)
+    con = DuckDBSession()
+    con.register("exercise_results", exercise_results)
+
+    result = con.execute(Path(QUERIES_DIR, "features.sql").read_text()).fetchdf()
+    expected = pd.read_parquet(features_expected_path)
+
+    # ✅ Sort before comparison, the expected file has its own column order
+    result = result.sort_values(by=["session_group"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["session_group"]).reset_index(drop=True)[result.columns]
+
+    pd.testing.assert_frame_equal(
+        result.drop(columns=["exercise_with_most_incorrect"]),
+        expected.drop(columns=["exercise_with_most_incorrect"]),
+        check_dtype=False,
+    )
+
+    # The expected files store NULL where features.sql says 'None'
+    ours = result["exercise_with_most_incorrect"].replace("None", None)
+    theirs = expected["exercise_with_most_incorrect"]
+    assert theirs[ours.isna()].isna().all()
+
+    # The expected files broke ties at random; where they picked another
+    # exercise, that exercise must have as many wrong repeats as ours and sort
+    # after it. A NULL exercise name sorts after every name.
+    wrong = exercise_results.groupby(["session_group", "exercise_name"], dropna=False)["wrong_repeats"].sum()
+    differs = ours.notna() & (ours != theirs).fillna(True)
+    for session_group, our_name, their_name in zip(
+        result.loc[differs, "session_group"], ours[differs], theirs[differs]
+    ):
+        if pd.isna(their_name):
+            their_wrong = wrong[session_group].loc[wrong[session_group].index.isna()]
+            assert (their_wrong == wrong[(session_group, our_name)]).any()
+        else:
+            assert our_name < their_name
+            assert wrong[(session_group, our_name)] == wrong[(session_group, their_name)]